@@ -1,7 +1,8 @@
 """Flask application entry point for the backend service."""
+import math
 import os
 from dotenv import load_dotenv
-from flask import Flask
+from flask import Flask, g, request
 from flask_cors import CORS
 
 # Load environment variables first
@@ -13,6 +14,13 @@ from routes.posts import posts_bp
 from routes.users import users_bp
 from routes.auth import auth_bp
 from routes.savings import savings_bp
+from routes.budgets import budgets_bp
+from routes.export import export_bp
+from routes.recurring import recurring_bp
+from routes.stream import stream_bp
+from routes.sync import sync_bp
+from services.rate_limit import load_shedder
+from services.resilience import StoreUnavailableError
 
 
 def create_app() -> Flask:
@@ -43,17 +51,72 @@ def create_app() -> Flask:
     app.register_blueprint(dashboard_bp, url_prefix="/api/dashboard")
     app.register_blueprint(users_bp, url_prefix="/api/users")
     app.register_blueprint(savings_bp, url_prefix="/api/savings")
+    app.register_blueprint(budgets_bp, url_prefix="/api/budgets")
+    app.register_blueprint(export_bp, url_prefix="/api/export")
+    app.register_blueprint(recurring_bp, url_prefix="/api/recurring")
+    app.register_blueprint(sync_bp, url_prefix="/api/sync")
+    app.register_blueprint(stream_bp, url_prefix="/api/stream")
+
+    @app.before_request
+    def shed_load():
+        """Turn requests away with 503 before every worker is saturated."""
+        if request.path.startswith("/health"):
+            return None
+        admitted, retry_after = load_shedder.enter(request.headers.get("X-Request-Start"))
+        if not admitted:
+            return (
+                {"error": "Server busy", "message": "Too many requests in flight, retry later"},
+                503,
+                {"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+        g.load_admitted = True
+        return None
+
+    @app.after_request
+    def hold_load_slot_while_streaming(response):
+        """Keep a streamed response (SSE, exports) counted until its body is done."""
+        if response.is_streamed and g.pop("load_admitted", False):
+            response.call_on_close(load_shedder.leave)
+        return response
+
+    @app.teardown_request
+    def release_load_slot(exc):
+        if g.pop("load_admitted", False):
+            load_shedder.leave()
+
+    @app.errorhandler(StoreUnavailableError)
+    def store_unavailable(error: StoreUnavailableError):
+        """Fail fast with 503 while Firebase is degraded instead of tying up workers."""
+        return (
+            {"error": "Data store temporarily unavailable", "message": str(error)},
+            503,
+            {"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+        )
+
+    @app.after_request
+    def mark_stale_responses(response):
+        """Flag responses built from last-known-good data while Firebase is failing."""
+        if g.get("stale_data"):
+            response.headers["X-Data-Stale"] = "true"
+            response.headers["Warning"] = '110 - "Response is Stale"'
+        return response
 
     @app.get("/health")
+    @app.get("/health/live")
     def health_check() -> dict[str, str]:
-        """Simple health-check endpoint."""
+        """Liveness probe: the process is up and serving requests."""
         return {"status": "ok"}
-    
-    # Initialize Firebase connection on app startup
-    with app.app_context():
-        from services.firebase_db import get_firebase_store
-        firebase_store = get_firebase_store()
 
+    @app.get("/health/ready")
+    def readiness_check():
+        """Readiness probe: report dependency state and cache warmth."""
+        from services.warmup import readiness
+
+        ready, payload = readiness()
+        return payload, 200 if ready else 503
+
+    # Firebase is initialised lazily on first use (or by the gunicorn
+    # post_fork warmup) so importing the app stays fast on cold starts.
     return app
 
 
@@ -1,11 +1,62 @@
 import os
+import subprocess
+import sys
 
 bind = f"0.0.0.0:{os.getenv('PORT', 10000)}"
-workers = 2
-worker_class = "sync"
+workers = int(os.getenv("GUNICORN_WORKERS", 2))
+# Threaded workers so long-lived /api/stream connections do not block a worker.
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 32))
 worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 50
 timeout = 30
 keepalive = 2
-preload_app = True
\ No newline at end of file
+preload_app = True
+
+_shared_cache_server = None
+
+
+def on_starting(server):
+    """Start this host's shared cache server when the local backend is used."""
+    global _shared_cache_server
+    from services.shared_cache import SHARED_CACHE_BACKEND, SHARED_CACHE_URL
+
+    if SHARED_CACHE_BACKEND == "local" and not SHARED_CACHE_URL:
+        _shared_cache_server = subprocess.Popen(
+            [sys.executable, "-m", "services.shared_cache"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+
+
+def on_exit(server):
+    """Stop the shared cache server started in on_starting."""
+    if _shared_cache_server is not None:
+        _shared_cache_server.terminate()
+        _shared_cache_server.wait(timeout=5)
+
+
+def post_fork(server, worker):
+    """Pre-open Firebase connections and prime caches before taking traffic."""
+    from services.recurring import start_scheduler
+    from services.warmup import warm_worker
+
+    warm_worker(timeout=float(os.getenv("WORKER_WARMUP_SECONDS", 10)))
+    # Only the worker that wins the host-wide lock runs the scheduler.
+    start_scheduler()
+
+
+def child_exit(server, worker):
+    """Free a dead worker's load-shedding slot, including requests it never finished."""
+    from services.rate_limit import load_shedder
+
+    load_shedder.release_pid(worker.pid)
+
+
+def worker_exit(server, worker):
+    """Stop login prefetches and flush any write-behind buffer before the worker goes away."""
+    from services.firebase_db import get_firebase_store
+    from services.prefetch import cancel_all
+
+    cancel_all()
+    get_firebase_store().flush_writes()
@@ -1,5 +1,10 @@
 from .auth import auth_bp
+from .budgets import budgets_bp
 from .dashboard import dashboard_bp
+from .export import export_bp
 from .posts import posts_bp
+from .recurring import recurring_bp
 from .savings import savings_bp
+from .stream import stream_bp
+from .sync import sync_bp
 from .users import users_bp
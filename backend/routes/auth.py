@@ -1,7 +1,7 @@
 """Authentication routes for user management with account linking support."""
 from flask import Blueprint, jsonify, request
 from services.auth import require_auth, get_current_user, verify_firebase_token
-from firebase_admin import auth as admin_auth
+from services.profiles import get_profile, token_identities
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,30 +16,17 @@ def get_user_profile():
         return jsonify({"error": "User not found"}), 401
     
     try:
-        # Get additional user info from Firebase Admin
-        user_record = admin_auth.get_user(user["uid"])
-        
-        # Determine available sign-in methods
-        providers = []
-        for provider_data in user_record.provider_data:
-            providers.append(provider_data.provider_id)
-        
-        # Also check if email/password is enabled
-        if user_record.email and not user_record.disabled:
-            if 'password' not in providers and len(user_record.provider_data) > 0:
-                # Check if any provider is not password-based
-                has_non_password = any(p.provider_id != 'password' for p in user_record.provider_data)
-                if has_non_password and user_record.email:
-                    providers.append('email')
-            elif len(user_record.provider_data) == 0:
-                providers.append('email')
-        
+        # Derived profile and providers, cached per uid until the token's
+        # identities change (e.g. a completed account link)
+        profile = get_profile(user["uid"], token_identities(user["token"]))
+        providers = profile["providers"]
+
         return jsonify({
             "uid": user["uid"],
             "email": user["email"],
-            "display_name": user_record.display_name,
-            "photo_url": user_record.photo_url,
-            "email_verified": user_record.email_verified,
+            "display_name": profile["display_name"],
+            "photo_url": profile["photo_url"],
+            "email_verified": profile["email_verified"],
             "providers": providers,
             "authenticated": True,
             "account_linking_available": len(providers) == 1  # Can link if only one method
@@ -0,0 +1,71 @@
+"""Budget routes: monthly category limits with spend status and alerts."""
+from __future__ import annotations
+
+from flask import Blueprint, jsonify, request
+
+from services.auth import require_auth
+from services.budgets import (
+    add_budget,
+    delete_budget,
+    get_budget_alerts,
+    get_budgets,
+    update_budget,
+)
+
+budgets_bp = Blueprint("budgets", __name__)
+
+
+@budgets_bp.get("/")
+@require_auth
+def list_budgets():
+    """Return budgets with spend status for ?month=YYYY-MM (default: current month)."""
+    return jsonify(get_budgets(request.args.get("month")))
+
+
+@budgets_bp.get("/status")
+@require_auth
+def budget_status():
+    """Return spend status and fired alerts for a month."""
+    month = request.args.get("month")
+    return jsonify({
+        "budgets": get_budgets(month),
+        "alerts": get_budget_alerts(month),
+    })
+
+
+@budgets_bp.post("/")
+@require_auth
+def create_budget():
+    data = request.get_json(force=True, silent=True) or {}
+    required_fields = ["category", "limit"]
+    missing = [field for field in required_fields if field not in data]
+    if missing:
+        return {"error": f"Missing required fields: {', '.join(missing)}"}, 400
+
+    try:
+        budget = add_budget(data)
+        return budget, 201
+    except (ValueError, KeyError, TypeError) as exc:
+        return {"error": str(exc)}, 400
+
+
+@budgets_bp.put("/<budget_id>")
+@require_auth
+def modify_budget(budget_id: str):
+    updates = request.get_json(force=True, silent=True) or {}
+    try:
+        budget = update_budget(budget_id, updates)
+        if budget:
+            return budget, 200
+        return {"error": "Budget not found"}, 404
+    except (ValueError, TypeError) as exc:
+        return {"error": str(exc)}, 400
+
+
+@budgets_bp.delete("/<budget_id>")
+@require_auth
+def remove_budget(budget_id: str):
+    success = delete_budget(budget_id)
+    if success:
+        return {"message": "Budget deleted"}, 200
+    return {"error": "Budget not found"}, 404
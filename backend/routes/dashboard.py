@@ -5,7 +5,13 @@ from datetime import datetime
 
 from flask import Blueprint, jsonify, request
 
-from services.auth import require_auth, get_current_user
+from services.archive import get_archive_totals, get_archived_transactions
+from services.auth import require_auth, get_current_user, get_current_user_id
+from services.fx import normalize_currency
+from services.networth import get_history
+from services.price_history import DEFAULT_POINTS, has_history, normalize_ticker, price_history
+from services.search import search_transactions
+from services.transaction_partitions import is_partition_key
 from services.data_store import (
     add_stock,
     add_transaction,
@@ -18,7 +24,7 @@ from services.data_store import (
     enrich_stock,
     get_savings_goals,
     get_transactions,
-    get_investments,
+    investments_with_returns,
     update_investment,
 )
 
@@ -32,6 +38,25 @@ def get_overview():
     return jsonify(dashboard_overview())
 
 
+@dashboard_bp.get("/networth")
+@require_auth
+def get_networth_history():
+    """Daily net-worth snapshots for ?start=&end= (YYYY-MM-DD), downsampled to ?points=."""
+    try:
+        points = int(request.args.get("points", 365))
+    except ValueError:
+        return {"error": "points must be an integer"}, 400
+    start = request.args.get("start") or None
+    end = request.args.get("end") or None
+    for value in (start, end):
+        if value is not None:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                return {"error": "start and end must be YYYY-MM-DD dates"}, 400
+    return jsonify(get_history(get_current_user_id(), start, end, points))
+
+
 @dashboard_bp.post("/income")
 @require_auth
 def add_income():
@@ -44,6 +69,11 @@ def add_income():
     if not source or amount is None:
         return {"error": "source and amount are required"}, 400
 
+    try:
+        currency = normalize_currency(data.get("currency"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
     parsed_date = None
     if date_value:
         try:
@@ -59,6 +89,8 @@ def add_income():
             category=str(data.get("category") or "Other"),
             content=str(data.get("content") or ""),
             date=parsed_date,
+            currency=currency,
+            investment_id=data.get("investment_id"),
         )
         return transaction, 201
     except ValueError as e:
@@ -78,6 +110,11 @@ def add_expense():
     if not category or amount is None:
         return {"error": "category and amount are required"}, 400
 
+    try:
+        currency = normalize_currency(data.get("currency"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
     parsed_date = None
     if date_value:
         try:
@@ -93,6 +130,8 @@ def add_expense():
             category=str(category),
             content=str(data.get("content") or ""),
             date=parsed_date,
+            currency=currency,
+            investment_id=data.get("investment_id"),
         )
         return transaction, 201
     except ValueError as e:
@@ -112,12 +151,18 @@ def add_stock_position():
     if not ticker or quantity is None or purchase_price is None:
         return {"error": "ticker, quantity and purchase_price are required"}, 400
 
+    try:
+        currency = normalize_currency(data.get("currency"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
     try:
         stock = add_stock(
             ticker=str(ticker),
             quantity=float(quantity),
             purchase_price=float(purchase_price),
             current_price=float(current_price) if current_price is not None else None,
+            currency=currency,
         )
         return enrich_stock(stock), 201
     except ValueError as e:
@@ -130,11 +175,75 @@ def get_stock_options():
     return jsonify(list(available_stocks()))
 
 
+@dashboard_bp.get("/stocks/<ticker>/history")
+@require_auth
+def get_stock_history(ticker):
+    """Price history for a ticker, downsampled to ?points=N over ?start=&end= (ISO dates)."""
+    try:
+        symbol = normalize_ticker(ticker)
+        start, end = (
+            datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
+            for value in (request.args.get("start"), request.args.get("end"))
+        )
+        points = int(request.args.get("points", DEFAULT_POINTS))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    if points < 3:
+        return {"error": "points must be at least 3"}, 400
+    if not has_history(symbol):
+        return {"error": "No price history for this ticker"}, 404
+
+    timestamps, prices, total = price_history(symbol, start, end, points)
+    response = jsonify({
+        "ticker": symbol,
+        "timestamps": timestamps.tolist(),
+        "prices": prices.tolist(),
+        "total_points": total,
+    })
+    response.headers["Cache-Control"] = "private, max-age=60"
+    return response
+
+
 @dashboard_bp.get("/transactions")
 @require_auth
 def get_transactions_endpoint():
-    """Get all transactions for authenticated user."""
-    return jsonify(get_transactions())
+    """Get transactions for authenticated user, optionally for months ?start=YYYY-MM&end=YYYY-MM."""
+    start = request.args.get("start") or None
+    end = request.args.get("end") or None
+    if any(month is not None and not is_partition_key(month) for month in (start, end)):
+        return {"error": "start and end must be YYYY-MM"}, 400
+    return jsonify(get_transactions(start_month=start, end_month=end))
+
+
+@dashboard_bp.get("/transactions/archive")
+@require_auth
+def get_transaction_archive():
+    """Precomputed totals for each archived year."""
+    return jsonify(get_archive_totals(get_current_user_id()))
+
+
+@dashboard_bp.get("/transactions/archive/<year>")
+@require_auth
+def get_archived_year(year):
+    """Every archived transaction of one year."""
+    if not (len(year) == 4 and year.isdigit()):
+        return {"error": "year must be YYYY"}, 400
+    return jsonify(get_archived_transactions(get_current_user_id(), year))
+
+
+@dashboard_bp.get("/transactions/search")
+@require_auth
+def search_transactions_endpoint():
+    """Full-text search over the user's transaction titles and content."""
+    query = request.args.get("q", "").strip()
+    if not query:
+        return {"error": "q is required"}, 400
+    try:
+        page = int(request.args.get("page", 1))
+        per_page = int(request.args.get("per_page", 20))
+    except ValueError:
+        return {"error": "page and per_page must be integers"}, 400
+    return jsonify(search_transactions(get_current_user_id(), query, page, per_page))
 
 
 @dashboard_bp.delete("/transaction/<transaction_id>")
@@ -163,8 +272,8 @@ def delete_stock_endpoint(ticker):
 @dashboard_bp.get("/investments")
 @require_auth
 def get_investments_endpoint():
-    """Get all investments for authenticated user."""
-    return jsonify(get_investments())
+    """Get all investments for authenticated user, with CAGR and XIRR."""
+    return jsonify(investments_with_returns())
 
 
 @dashboard_bp.get("/savings")
@@ -200,7 +309,8 @@ def add_investment_endpoint():
             description=data.get("description", ""),
             quantity=float(data["quantity"]) if data.get("quantity") else None,
             location=data.get("location", ""),
-            custom_type=data.get("custom_type", "")
+            custom_type=data.get("custom_type", ""),
+            currency=data.get("currency"),
         )
         return investment, 201
     except (ValueError, TypeError, KeyError) as e:
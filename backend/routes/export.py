@@ -0,0 +1,83 @@
+"""Export routes: stream a user's data or run the export as a background job."""
+from __future__ import annotations
+
+from flask import Blueprint, Response, jsonify, request
+
+from services.auth import get_current_user_id, require_auth
+from services.export import (
+    FORMATS,
+    export_filename,
+    export_job_file,
+    get_export_job,
+    parse_collections,
+    start_export_job,
+    stream_export,
+    stream_file,
+)
+
+export_bp = Blueprint("export", __name__)
+
+
+def _export_options():
+    export_format = (request.args.get("format") or "csv").lower()
+    if export_format not in FORMATS:
+        raise ValueError(f"Unsupported format '{export_format}'; use one of: {', '.join(FORMATS)}")
+    return export_format, parse_collections(request.args.get("collections"))
+
+
+def _attachment(chunks, export_format: str) -> Response:
+    return Response(
+        chunks,
+        mimetype=FORMATS[export_format][0],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(export_format)}"'},
+    )
+
+
+@export_bp.get("/")
+@require_auth
+def export_data():
+    """Stream ?collections=a,b (default: all) as ?format=csv|jsonl|parquet."""
+    try:
+        export_format, collections = _export_options()
+        chunks = stream_export(get_current_user_id(), export_format, collections)
+    except ValueError as exc:
+        return {"error": str(exc)}, 400
+    except RuntimeError as exc:
+        return {"error": str(exc)}, 501
+    return _attachment(chunks, export_format)
+
+
+@export_bp.post("/jobs")
+@require_auth
+def create_export_job():
+    """Start a background export; poll the job and download it when completed."""
+    try:
+        export_format, collections = _export_options()
+        job = start_export_job(get_current_user_id(), export_format, collections)
+    except ValueError as exc:
+        return {"error": str(exc)}, 400
+    return {**job, "status_url": f"/api/export/jobs/{job['id']}"}, 202
+
+
+@export_bp.get("/jobs/<job_id>")
+@require_auth
+def export_job_status(job_id: str):
+    job = get_export_job(get_current_user_id(), job_id)
+    if job is None:
+        return {"error": "Export job not found"}, 404
+    if job.get("status") == "completed":
+        job["download_url"] = f"/api/export/jobs/{job_id}/download"
+    return jsonify(job)
+
+
+@export_bp.get("/jobs/<job_id>/download")
+@require_auth
+def download_export_job(job_id: str):
+    user_id = get_current_user_id()
+    job = get_export_job(user_id, job_id)
+    if job is None:
+        return {"error": "Export job not found"}, 404
+    path = export_job_file(user_id, job)
+    if job.get("status") != "completed" or not path.exists():
+        return {"error": f"Export job is {job.get('status', 'unavailable')}"}, 409
+    return _attachment(stream_file(path), job["format"])
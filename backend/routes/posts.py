@@ -11,6 +11,7 @@ from services.data_store import (
     get_transactions,
     transaction_summary,
 )
+from services.fx import normalize_currency
 
 posts_bp = Blueprint("posts", __name__)
 
@@ -35,6 +36,11 @@ def create_transaction():
     if not title or amount is None:
         return {"error": "title and amount are required"}, 400
 
+    try:
+        currency = normalize_currency(data.get("currency"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
     parsed_date = None
     if date_value:
         try:
@@ -49,6 +55,7 @@ def create_transaction():
         transaction_type=transaction_type,
         category=category,
         date=parsed_date,
+        currency=currency,
     )
     return transaction, 201
 
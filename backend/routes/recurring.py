@@ -0,0 +1,59 @@
+"""Recurring transaction rule routes."""
+from __future__ import annotations
+
+from flask import Blueprint, jsonify, request
+
+from services.auth import require_auth
+from services.recurring import (
+    add_recurring_rule,
+    delete_recurring_rule,
+    get_recurring_rules,
+    update_recurring_rule,
+)
+
+recurring_bp = Blueprint("recurring", __name__)
+
+
+@recurring_bp.get("/")
+@require_auth
+def list_recurring_rules():
+    """Return all recurring rules for current user."""
+    return jsonify(get_recurring_rules())
+
+
+@recurring_bp.post("/")
+@require_auth
+def create_recurring_rule():
+    data = request.get_json(force=True, silent=True) or {}
+    required_fields = ["title", "amount", "type"]
+    missing = [field for field in required_fields if field not in data]
+    if missing:
+        return {"error": f"Missing required fields: {', '.join(missing)}"}, 400
+
+    try:
+        rule = add_recurring_rule(data)
+        return rule, 201
+    except (ValueError, KeyError, TypeError) as exc:
+        return {"error": str(exc)}, 400
+
+
+@recurring_bp.put("/<rule_id>")
+@require_auth
+def modify_recurring_rule(rule_id: str):
+    updates = request.get_json(force=True, silent=True) or {}
+    try:
+        rule = update_recurring_rule(rule_id, updates)
+        if rule:
+            return rule, 200
+        return {"error": "Recurring rule not found"}, 404
+    except (ValueError, TypeError) as exc:
+        return {"error": str(exc)}, 400
+
+
+@recurring_bp.delete("/<rule_id>")
+@require_auth
+def remove_recurring_rule(rule_id: str):
+    success = delete_recurring_rule(rule_id)
+    if success:
+        return {"message": "Recurring rule deleted"}, 200
+    return {"error": "Recurring rule not found"}, 404
@@ -0,0 +1,35 @@
+"""Server-Sent Events route pushing the signed-in user's data changes."""
+from __future__ import annotations
+
+from flask import Blueprint, Response, request
+
+from services.auth import get_current_user_id, require_auth
+from services.stream import event_stream, get_hub
+
+stream_bp = Blueprint("stream", __name__)
+
+
+@stream_bp.get("/")
+@require_auth(allow_query_token=True)
+def stream_changes():
+    """Stream change events; resumes after Last-Event-ID (or ?lastEventId=)."""
+    raw_last_id = request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+    try:
+        last_event_id = int(raw_last_id) if raw_last_id else None
+    except ValueError:
+        return {"error": "Last-Event-ID must be an integer"}, 400
+
+    hub = get_hub()
+    subscription = hub.subscribe(get_current_user_id())
+    if subscription is None:
+        return {"error": "Too many open streams, retry later"}, 503, {"Retry-After": "5"}
+    channel, subscriber = subscription
+
+    response = Response(
+        event_stream(channel, subscriber, last_event_id),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Runs on normal end and on client disconnect, even before the first frame.
+    response.call_on_close(lambda: hub.unsubscribe(channel, subscriber))
+    return response
@@ -0,0 +1,21 @@
+"""Delta sync route: changes since a client's last seen sequence number."""
+from __future__ import annotations
+
+from flask import Blueprint, jsonify, request
+
+from services.auth import get_current_user_id, require_auth
+from services.sync import SYNC_PAGE_SIZE, get_changes
+
+sync_bp = Blueprint("sync", __name__)
+
+
+@sync_bp.get("/")
+@require_auth
+def sync_changes():
+    """Return upserts and deletes after ?since=<seq> (0 for a full sync)."""
+    try:
+        since = int(request.args.get("since", 0))
+        limit = int(request.args.get("limit", SYNC_PAGE_SIZE))
+    except ValueError:
+        return {"error": "since and limit must be integers"}, 400
+    return jsonify(get_changes(get_current_user_id(), since, limit))
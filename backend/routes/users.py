@@ -1,11 +1,13 @@
 """User authentication and profile routes."""
 from __future__ import annotations
 
-from datetime import datetime
-from flask import Blueprint, jsonify, request
-from firebase_admin import firestore
+from flask import Blueprint, current_app, jsonify, request
 
-from services.firebase import get_firebase_auth, get_firestore_client
+from services.auth import require_auth
+from services.data_store import get_settings, update_settings
+from services.firebase import get_firebase_auth
+from services.prefetch import schedule_prefetch
+from services.user_sync import schedule_profile_sync
 
 users_bp = Blueprint("users", __name__)
 
@@ -17,7 +19,7 @@ def _mock_user(uid: str) -> dict[str, str]:
 
 @users_bp.post("/login")
 def login():
-    """Authenticate a user with Firebase ID token and sync to Firestore."""
+    """Authenticate a user with Firebase ID token and queue a Firestore profile sync."""
     data = request.get_json(force=True, silent=True) or {}
     token = data.get("token")
     if not token:
@@ -26,33 +28,12 @@ def login():
     auth = get_firebase_auth()
     try:
         decoded = auth.verify_id_token(token)
-        
-        # Sync user info to Firestore regardless of auth method
-        db = get_firestore_client()
-        if db is not None:
-            try:
-                # Check if user has password provider (completed profile)
-                firebase_providers = decoded.get("firebase", {}).get("sign_in_provider", "")
-                has_password_auth = "password" in str(firebase_providers) or decoded.get("firebase", {}).get("identities", {}).get("password")
-                
-                user_data = {
-                    'uid': decoded["uid"],
-                    'email': decoded.get("email", ""),
-                    'displayName': decoded.get("name", decoded.get("display_name", "")),
-                    'authMethod': 'firebase_auth',  # Both Google and email/password use Firebase Auth
-                    'lastLogin': datetime.utcnow().isoformat(),
-                    'emailVerified': decoded.get("email_verified", False),
-                    'authTime': datetime.utcfromtimestamp(decoded.get("auth_time", 0)).isoformat(),
-                    'hasPasswordAuth': bool(has_password_auth),
-                    'profileCompleted': bool(has_password_auth)  # Profile is complete when user has password auth
-                }
-                
-                users_ref = db.collection('users')
-                users_ref.document(decoded["uid"]).set(user_data, merge=True)
-            except Exception as e:
-                print(f"Firestore sync failed: {e}")
-                # Don't fail login if Firestore update fails
-        
+
+        # Sync user info to Firestore off the request path; redundant syncs are skipped
+        schedule_profile_sync(decoded)
+        # Warm the shared cache for the dashboard load that follows login
+        schedule_prefetch(current_app._get_current_object(), decoded["uid"])
+
         return jsonify({
             "uid": decoded["uid"],
             "email": decoded.get("email", ""),
@@ -69,3 +50,21 @@ def current_user():
     """Return the mock current user profile."""
     # Replace with real authentication middleware later.
     return jsonify(_mock_user("demo"))
+
+
+@users_bp.get("/settings")
+@require_auth
+def get_user_settings():
+    """Return the authenticated user's settings (reporting currency)."""
+    return jsonify(get_settings())
+
+
+@users_bp.put("/settings")
+@require_auth
+def update_user_settings():
+    """Update the authenticated user's settings."""
+    data = request.get_json(force=True, silent=True) or {}
+    try:
+        return jsonify(update_settings(data))
+    except ValueError as exc:
+        return {"error": str(exc)}, 400
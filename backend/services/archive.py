@@ -0,0 +1,285 @@
+"""Cold archive of closed years of transactions.
+
+Once a calendar year is ``ARCHIVE_AFTER_MONTHS`` old, the archival job
+(``python -m services.archive``) moves its transactions out of the live
+``transactions`` node into
+
+* ``users/{uid}/archive_blobs/{YYYY}/part{NNN}``: the rows as
+  zlib-compressed, base64-encoded JSON, split into chunks, and
+* ``users/{uid}/archive_totals/{YYYY}``: precomputed income, expense and
+  count, the expense breakdown for the year and for each month, the
+  highest numeric id, in the reporting currency at archive time, and the
+  rows linked to an investment (for investment returns).
+
+The totals, blob and removal of the live rows go in one multi-path update,
+so readers never count a row twice or miss it. Summaries add the yearly
+totals to the live rows; only explicit history reads decompress a blob.
+Rows later written into an archived year stay live until the next run
+merges them in.
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import logging
+import os
+import uuid
+import zlib
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from services.firebase_db import get_firebase_store
+from services.fx import convert_records, get_reporting_currency
+from services.local_state import read_json, state_path, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+firebase_store = get_firebase_store()
+
+TOTALS_PATH = "archive_totals"
+BLOBS_PATH = "archive_blobs"
+
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", 12))
+# Encoded characters per blob chunk; keeps each RTDB string value small.
+ARCHIVE_CHUNK_CHARS = int(os.getenv("ARCHIVE_CHUNK_CHARS", 512 * 1024))
+DEFAULT_PAGE_SIZE = 100
+
+
+def last_archivable_year(today: Optional[date] = None) -> int:
+    """The latest year that ended at least ``ARCHIVE_AFTER_MONTHS`` ago."""
+    today = today or datetime.utcnow().date()
+    months = today.year * 12 + today.month - 1 - ARCHIVE_AFTER_MONTHS
+    return months // 12 - 1
+
+
+def _encode(records: List[Dict[str, Any]]) -> Dict[str, str]:
+    raw = json.dumps(records, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    encoded = base64.b64encode(zlib.compress(raw, 9)).decode("ascii")
+    return {
+        f"part{index:03d}": encoded[offset:offset + ARCHIVE_CHUNK_CHARS]
+        for index, offset in enumerate(range(0, len(encoded), ARCHIVE_CHUNK_CHARS))
+    }
+
+
+def _decode(parts: Any) -> List[Dict[str, Any]]:
+    if not isinstance(parts, dict) or not parts:
+        return []
+    encoded = "".join(parts[key] for key in sorted(parts))
+    return json.loads(zlib.decompress(base64.b64decode(encoded)).decode("utf-8"))
+
+
+def _breakdown(amounts: Dict[str, float]) -> Dict[str, List[Any]]:
+    # Labels/data lists rather than a mapping: category names may contain
+    # characters RTDB does not allow in keys.
+    labels = list(amounts)
+    return {"labels": labels, "data": [round(amounts[label], 2) for label in labels]}
+
+
+def year_totals(records: List[Dict[str, Any]], currency: str) -> Dict[str, Any]:
+    """Precompute a year's totals and expense breakdowns in ``currency``."""
+    amounts, missing = convert_records(records, "amount", currency, date_field="date")
+    income = expenses = 0.0
+    categories: Dict[str, float] = {}
+    months: Dict[str, Dict[str, float]] = {}
+    for record, amount in zip(records, amounts.tolist()):
+        if record.get("type") == "income":
+            income += amount
+        elif record.get("type") == "expense":
+            spent = abs(amount)
+            expenses += spent
+            category = str(record.get("category", "Other"))
+            categories[category] = categories.get(category, 0.0) + spent
+            month = months.setdefault(str(record.get("date", ""))[:7], {})
+            month[category] = month.get(category, 0.0) + spent
+    numeric_ids = [int(r["id"]) for r in records if str(r.get("id", "")).isdigit()]
+    # Kept raw so investment returns can still see archived contributions.
+    investment_flows = [
+        {key: r.get(key) for key in ("investment_id", "type", "amount", "currency", "date")}
+        for r in records if r.get("investment_id")
+    ]
+    totals = {
+        "currency": currency,
+        "count": len(records),
+        "income": round(income, 2),
+        "expenses": round(expenses, 2),
+        "categories": _breakdown(categories),
+        "months": {month: _breakdown(spend) for month, spend in sorted(months.items())},
+        "max_id": max(numeric_ids) if numeric_ids else 0,
+        "investment_flows": investment_flows,
+        "archived_at": datetime.utcnow().isoformat() + "Z",
+    }
+    if missing:
+        totals["missing_rates"] = missing
+    return totals
+
+
+def get_archived_transactions(user_id: str, year: str) -> List[Dict[str, Any]]:
+    """Decompress one archived year's transactions."""
+    return _decode(firebase_store.get_value(user_id, f"{BLOBS_PATH}/{year}"))
+
+
+def get_archive_totals(user_id: str, currency: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Archived years => totals, in ``currency`` (default: the reporting currency).
+
+    Years archived under another reporting currency are recomputed from
+    their blob.
+    """
+    stored = firebase_store.get_value(user_id, TOTALS_PATH)
+    if not isinstance(stored, dict):
+        return {}
+    currency = currency or get_reporting_currency(user_id)
+    result: Dict[str, Dict[str, Any]] = {}
+    for year, totals in sorted(stored.items()):
+        if not isinstance(totals, dict):
+            continue
+        if totals.get("currency") != currency:
+            totals = {**year_totals(get_archived_transactions(user_id, year), currency), "max_id": totals.get("max_id", 0)}
+        result[year] = totals
+    return result
+
+
+def archived_max_id(user_id: str) -> int:
+    """Highest numeric transaction id in the archive, so ids are never reused."""
+    stored = firebase_store.get_value(user_id, TOTALS_PATH)
+    if not isinstance(stored, dict):
+        return 0
+    return max((int(t.get("max_id", 0)) for t in stored.values() if isinstance(t, dict)), default=0)
+
+
+def archived_investment_flows(user_id: str) -> List[Dict[str, Any]]:
+    """Archived transactions linked to an investment, from the yearly totals."""
+    stored = firebase_store.get_value(user_id, TOTALS_PATH)
+    if not isinstance(stored, dict):
+        return []
+    return [
+        flow
+        for totals in stored.values() if isinstance(totals, dict)
+        for flow in _as_list(totals.get("investment_flows"))
+        if isinstance(flow, dict)
+    ]
+
+
+def _as_list(value: Any) -> List[Any]:
+    # RTDB returns stored lists as lists, or dicts when they have gaps.
+    if isinstance(value, dict):
+        return list(value.values())
+    return value if isinstance(value, list) else []
+
+
+def merge_totals(
+    summary: Dict[str, Any], breakdown: Dict[str, float], archived: Dict[str, Dict[str, Any]]
+) -> None:
+    """Add archived yearly totals into a live summary and expense breakdown, in place."""
+    missing = set(summary.get("missing_rates", []))
+    for totals in archived.values():
+        summary["income"] += float(totals.get("income", 0.0))
+        summary["expenses"] += float(totals.get("expenses", 0.0))
+        summary["transaction_count"] += int(totals.get("count", 0))
+        categories = totals.get("categories") or {}
+        for label, value in zip(categories.get("labels") or [], categories.get("data") or []):
+            breakdown[label] = breakdown.get(label, 0.0) + float(value)
+        missing.update(totals.get("missing_rates") or [])
+    summary["balance"] = summary["income"] - summary["expenses"]
+    if missing:
+        summary["missing_rates"] = sorted(missing)
+
+
+def archive_user(user_id: str, today: Optional[date] = None) -> Dict[str, int]:
+    """Archive every closed year with live transactions; returns year => rows moved."""
+    last_year = last_archivable_year(today)
+    if last_year < 1:
+        return {}
+    live = firebase_store.get_transactions(user_id, end_month=f"{last_year:04d}-12")
+    by_year: Dict[str, List[Dict[str, Any]]] = {}
+    for transaction in live:
+        year = str(transaction.get("date", ""))[:4]
+        # Undated rows stay live; they cannot be placed in a year.
+        if year.isdigit() and 0 < int(year) <= last_year and "id" in transaction:
+            by_year.setdefault(year, []).append(transaction)
+
+    currency = get_reporting_currency(user_id)
+    prefix = f"users/{user_id}"
+    moved: Dict[str, int] = {}
+    for year, rows in sorted(by_year.items()):
+        existing = {str(r.get("id")): r for r in get_archived_transactions(user_id, year)}
+        existing.update({str(r["id"]): r for r in rows})
+        records = sorted(existing.values(), key=lambda r: (str(r.get("date", "")), str(r.get("id"))))
+
+        updates: Dict[str, Any] = {
+            f"{prefix}/{TOTALS_PATH}/{year}": year_totals(records, currency),
+            f"{prefix}/{BLOBS_PATH}/{year}": _encode(records),
+        }
+        for transaction in rows:
+            for path, value in firebase_store.transaction_delete_writes(transaction).items():
+                updates[f"{prefix}/{path}"] = value
+        if not firebase_store.update_paths(updates):
+            raise RuntimeError(f"Failed to archive {year} for {user_id}")
+        moved[year] = len(rows)
+    return moved
+
+
+def iter_archived(user_id: str, page_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Yield archived transactions a page at a time, oldest year first."""
+    for year in firebase_store.child_keys(user_id, TOTALS_PATH):
+        records = get_archived_transactions(user_id, year)
+        for offset in range(0, len(records), page_size):
+            yield records[offset:offset + page_size]
+
+
+def run_archive(
+    checkpoint_path: Path | None = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    restart: bool = False,
+) -> Dict[str, Any]:
+    """Archive closed years for every user, resuming from the checkpoint."""
+    if not firebase_store.firebase_available:
+        raise RuntimeError("Firebase store is not available")
+
+    checkpoint_path = checkpoint_path or state_path("archive", "checkpoint.json")
+    state = None if restart else read_json(checkpoint_path)
+    if not state or state.get("completed"):
+        state = {
+            "run_id": uuid.uuid4().hex,
+            "cursor": None,
+            "users_processed": 0,
+            "transactions_archived": 0,
+            "completed": False,
+            "started_at": datetime.utcnow().isoformat() + "Z",
+        }
+    else:
+        logger.info("Resuming archive run %s after %s", state["run_id"], state["cursor"])
+
+    for user_ids in firebase_store.iter_user_id_pages(start_after=state["cursor"], page_size=page_size):
+        for user_id in user_ids:
+            state["transactions_archived"] += sum(archive_user(user_id).values())
+        state["cursor"] = user_ids[-1]
+        state["users_processed"] += len(user_ids)
+        write_json_atomic(checkpoint_path, state)
+
+    state["completed"] = True
+    state["finished_at"] = datetime.utcnow().isoformat() + "Z"
+    write_json_atomic(checkpoint_path, state)
+    return state
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Archive closed years of transactions for all users.")
+    parser.add_argument("--checkpoint", type=Path, default=None)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--restart", action="store_true", help="Ignore any saved checkpoint")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    result = run_archive(checkpoint_path=args.checkpoint, page_size=args.page_size, restart=args.restart)
+    logger.info(
+        "Archive run %s done: %d users, %d transactions archived",
+        result["run_id"],
+        result["users_processed"],
+        result["transactions_archived"],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,22 @@
 """Authentication middleware for Firebase ID token verification."""
+import math
 from functools import wraps
 from flask import request, jsonify, g
-from firebase_admin import auth
 from services.firebase import get_firebase_auth
+from services.rate_limit import RATE_LIMIT_ENABLED, rate_limiter, request_kind
 import logging
 
 logger = logging.getLogger(__name__)
 
-def verify_firebase_token():
-    """Extract and verify Firebase ID token from request headers."""
+def verify_firebase_token(allow_query_token=False):
+    """Extract and verify Firebase ID token from request headers.
+
+    With ``allow_query_token`` an ``?access_token=`` parameter is accepted
+    when there is no Authorization header (EventSource cannot set headers).
+    """
     auth_header = request.headers.get('Authorization')
+    if not auth_header and allow_query_token and request.args.get('access_token'):
+        auth_header = f"Bearer {request.args['access_token']}"
     if not auth_header:
         return None, "No Authorization header provided"
     
@@ -34,11 +41,17 @@ def verify_firebase_token():
         logger.error(f"Token verification failed: {e}")
         return None, f"Invalid token: {str(e)}"
 
-def require_auth(f):
-    """Decorator to require Firebase authentication for endpoints."""
+def require_auth(f=None, *, allow_query_token=False):
+    """Decorator to require Firebase authentication for endpoints.
+
+    Use as ``@require_auth`` or ``@require_auth(allow_query_token=True)``.
+    """
+    if f is None:
+        return lambda func: require_auth(func, allow_query_token=allow_query_token)
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        user, error = verify_firebase_token()
+        user, error = verify_firebase_token(allow_query_token)
         
         if error:
             return jsonify({
@@ -48,6 +61,16 @@ def require_auth(f):
         
         # Store user info in Flask's g object for use in the request
         g.current_user = user
+
+        # Per-user token buckets with separate read and write budgets
+        if RATE_LIMIT_ENABLED:
+            allowed, retry_after = rate_limiter.acquire(user['uid'], request_kind(request.method))
+            if not allowed:
+                return jsonify({
+                    'error': 'Too many requests',
+                    'message': 'Rate limit exceeded, retry later'
+                }), 429, {'Retry-After': str(max(1, math.ceil(retry_after)))}
+
         return f(*args, **kwargs)
     
     return decorated_function
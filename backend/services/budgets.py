@@ -0,0 +1,233 @@
+"""Monthly category budgets with incrementally maintained spend counters.
+
+Spend is kept per user as ``users/{uid}/budget_spend/{YYYY-MM}/{category}``
+and adjusted on every expense add/delete, so budget status only needs the
+month's counters and the budget list: O(categories), never O(transactions).
+Counters are kept in the user's reporting currency, are maintained while
+the user has at least one budget and are rebuilt from the transaction
+history when the first budget is created.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, List
+from urllib.parse import quote
+
+from services.archive import get_archive_totals
+from services.auth import get_current_user_id
+from services.firebase_db import get_firebase_store
+from services.fx import convert_records, get_reporting_currency, rate_store, record_currency
+
+firebase_store = get_firebase_store()
+
+DEFAULT_ALERT_THRESHOLDS = (0.8, 1.0)
+
+
+def _category_key(category: str) -> str:
+    """Encode a category name as a valid RTDB key (no . $ # [ ] /)."""
+    return quote(category, safe=" -_").replace(".", "%2E")
+
+
+def _month_of(transaction: Dict[str, Any]) -> str:
+    return str(transaction.get("date") or datetime.utcnow().isoformat())[:7]
+
+
+def _current_month() -> str:
+    return datetime.utcnow().strftime("%Y-%m")
+
+
+def _require_user() -> str:
+    user_id = get_current_user_id()
+    if not user_id:
+        raise ValueError("User must be authenticated to manage budgets")
+    if not firebase_store.firebase_available:
+        raise RuntimeError("Firebase store is not available")
+    return user_id
+
+
+def _budgets_for(user_id: str) -> List[Dict[str, Any]]:
+    budgets = firebase_store.get_value(user_id, "budgets")
+    if isinstance(budgets, dict):
+        return [b for b in budgets.values() if isinstance(b, dict)]
+    return []
+
+
+def _next_budget_id(budgets: List[Dict[str, Any]]) -> str:
+    numbers = [
+        int(b["id"][6:]) for b in budgets
+        if isinstance(b.get("id"), str) and b["id"].startswith("budget") and b["id"][6:].isdigit()
+    ]
+    return f"budget{max(numbers) + 1}" if numbers else "budget1"
+
+
+def rebuild_spend_counters(user_id: str) -> Dict[str, Dict[str, float]]:
+    """Recompute every month's category spend from the full transaction history."""
+    currency = get_reporting_currency(user_id)
+    expenses = [t for t in firebase_store.get_transactions(user_id) if t.get("type") == "expense"]
+    amounts, _ = convert_records(expenses, "amount", currency, date_field="date")
+    spend: Dict[str, Dict[str, float]] = {}
+    # Archived years carry their monthly breakdowns precomputed.
+    for totals in get_archive_totals(user_id, currency).values():
+        for month_key, breakdown in (totals.get("months") or {}).items():
+            month = spend.setdefault(month_key, {})
+            for label, value in zip(breakdown.get("labels") or [], breakdown.get("data") or []):
+                key = _category_key(str(label))
+                month[key] = round(month.get(key, 0.0) + float(value), 2)
+    for transaction, amount in zip(expenses, amounts.tolist()):
+        month = spend.setdefault(_month_of(transaction), {})
+        key = _category_key(str(transaction.get("category", "Other")))
+        month[key] = round(month.get(key, 0.0) + abs(amount), 2)
+    firebase_store.set_value(user_id, "budget_spend", spend or None)
+    return spend
+
+
+def _status_for(budget: Dict[str, Any], spent: float) -> Dict[str, Any]:
+    limit = float(budget.get("limit", 0.0))
+    ratio = spent / limit if limit > 0 else 0.0
+    thresholds = sorted(budget.get("alert_thresholds") or DEFAULT_ALERT_THRESHOLDS)
+    if limit > 0 and ratio >= 1.0:
+        status = "exceeded"
+    elif limit > 0 and any(ratio >= t for t in thresholds if t < 1.0):
+        status = "warning"
+    else:
+        status = "ok"
+    return {
+        **budget,
+        "spent": round(spent, 2),
+        "remaining": round(max(limit - spent, 0.0), 2),
+        "percent_used": round(ratio * 100, 2),
+        "status": status,
+    }
+
+
+def _evaluate(user_id: str, month: str, budgets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Evaluate budgets for a month from its counters; O(categories)."""
+    counters = firebase_store.get_value(user_id, f"budget_spend/{month}")
+    counters = counters if isinstance(counters, dict) else {}
+    return [
+        _status_for(budget, float(counters.get(_category_key(str(budget.get("category", ""))), 0.0)))
+        for budget in budgets
+    ]
+
+
+def _fire_alerts(user_id: str, month: str, statuses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Record thresholds newly crossed this month and return them as alerts."""
+    fired = firebase_store.get_value(user_id, f"budget_alerts/{month}")
+    fired = fired if isinstance(fired, dict) else {}
+    alerts: List[Dict[str, Any]] = []
+    for status in statuses:
+        ratio = status["percent_used"] / 100
+        crossed = [t for t in status.get("alert_thresholds") or DEFAULT_ALERT_THRESHOLDS if ratio >= t]
+        if not crossed:
+            continue
+        highest = max(crossed)
+        if highest <= float(fired.get(status["id"], 0.0)):
+            continue
+        firebase_store.set_value(user_id, f"budget_alerts/{month}/{status['id']}", highest)
+        alerts.append({
+            "budget_id": status["id"],
+            "category": status.get("category"),
+            "month": month,
+            "threshold": highest,
+            "spent": status["spent"],
+            "limit": status.get("limit"),
+            "status": status["status"],
+        })
+    return alerts
+
+
+def record_transaction_spend(user_id: str, transaction: Dict[str, Any], sign: int = 1) -> List[Dict[str, Any]]:
+    """Apply an added (sign=1) or deleted (sign=-1) expense to the spend counters.
+
+    Returns any budget alerts newly triggered by the change.
+    """
+    if not user_id or transaction.get("type") != "expense":
+        return []
+    budgets = _budgets_for(user_id)
+    if not budgets:
+        # Counters are only maintained while the user has budgets.
+        return []
+
+    month = _month_of(transaction)
+    category = _category_key(str(transaction.get("category", "Other")))
+    amount = abs(rate_store.convert_one(
+        float(transaction.get("amount", 0.0)),
+        record_currency(transaction),
+        get_reporting_currency(user_id),
+        str(transaction.get("date") or ""),
+    ))
+    firebase_store.increment_value(user_id, f"budget_spend/{month}/{category}", sign * amount)
+
+    if sign < 0:
+        return []
+    relevant = [b for b in budgets if b.get("category") == transaction.get("category")]
+    return _fire_alerts(user_id, month, _evaluate(user_id, month, relevant))
+
+
+def get_budgets(month: str | None = None) -> List[Dict[str, Any]]:
+    """Return the current user's budgets with spend status for ``month``."""
+    user_id = get_current_user_id()
+    if not user_id or not firebase_store.firebase_available:
+        return []
+    budgets = _budgets_for(user_id)
+    if not budgets:
+        return []
+    return _evaluate(user_id, month or _current_month(), budgets)
+
+
+def get_budget_alerts(month: str | None = None) -> Dict[str, float]:
+    """Return budget_id => highest alert threshold fired in ``month``."""
+    user_id = get_current_user_id()
+    if not user_id or not firebase_store.firebase_available:
+        return {}
+    fired = firebase_store.get_value(user_id, f"budget_alerts/{month or _current_month()}")
+    return fired if isinstance(fired, dict) else {}
+
+
+def add_budget(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Create a monthly budget for a category."""
+    user_id = _require_user()
+    budgets = _budgets_for(user_id)
+    thresholds = data.get("alert_thresholds") or list(DEFAULT_ALERT_THRESHOLDS)
+    budget = {
+        "id": _next_budget_id(budgets),
+        "category": str(data["category"]),
+        "limit": float(data["limit"]),
+        "period": "monthly",
+        "alert_thresholds": sorted(float(t) for t in thresholds),
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "updated_at": datetime.utcnow().isoformat() + "Z",
+    }
+    if not budgets:
+        # Counters were not maintained while there were no budgets.
+        rebuild_spend_counters(user_id)
+    firebase_store.set_value(user_id, f"budgets/{budget['id']}", budget)
+    return _evaluate(user_id, _current_month(), [budget])[0]
+
+
+def update_budget(budget_id: str, updates: Dict[str, Any]) -> Dict[str, Any] | None:
+    """Update a budget's category, limit or alert thresholds."""
+    user_id = _require_user()
+    changes: Dict[str, Any] = {}
+    if "category" in updates:
+        changes["category"] = str(updates["category"])
+    if "limit" in updates:
+        changes["limit"] = float(updates["limit"])
+    if "alert_thresholds" in updates:
+        changes["alert_thresholds"] = sorted(float(t) for t in updates["alert_thresholds"])
+    changes["updated_at"] = datetime.utcnow().isoformat() + "Z"
+    budget = firebase_store.patch_one(user_id, "budgets", budget_id, changes)
+    if budget is None:
+        return None
+    return _evaluate(user_id, _current_month(), [budget])[0]
+
+
+def delete_budget(budget_id: str) -> bool:
+    """Delete a budget for the current user."""
+    user_id = get_current_user_id()
+    if not user_id:
+        return False
+    if not firebase_store.firebase_available:
+        raise RuntimeError("Firebase store is not available")
+    return firebase_store.delete_one(user_id, "budgets", budget_id)
+
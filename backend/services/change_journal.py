@@ -0,0 +1,100 @@
+"""Per-user change journal entries for delta sync.
+
+Every store write to an item of a journaled collection is recorded at
+``users/{uid}/changes/{key}`` as ``{"collection", "id", "op", "value"}``.
+Keys are allocated from ``users/{uid}/change_seq`` and written in the same
+multi-path update as the data they describe. ``op`` is ``"upsert"`` or
+``"delete"``. ``value`` is omitted for partial (field-level) writes and
+resolved from the live item when the journal is read.
+
+Old entries are compacted away; ``users/{uid}/change_floor`` is the lowest
+sequence number still in the journal.
+"""
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.transaction_partitions import split_transaction_path
+
+JOURNALED_COLLECTIONS = frozenset({
+    "transactions",
+    "investments",
+    "stocks",
+    "savings_goals",
+    "budgets",
+    "recurring",
+})
+
+CHANGES_PATH = "changes"
+SEQ_PATH = "change_seq"
+FLOOR_PATH = "change_floor"
+
+# Entries kept per user; compaction runs each time the sequence crosses a
+# multiple of CHANGE_LOG_COMPACT_EVERY.
+CHANGE_LOG_RETAIN = int(os.getenv("CHANGE_LOG_RETAIN", 5000))
+CHANGE_LOG_COMPACT_EVERY = int(os.getenv("CHANGE_LOG_COMPACT_EVERY", 500))
+
+# A letter prefix keeps RTDB from treating the numeric keys as array indices.
+_KEY_PREFIX = "c"
+_SEQ_WIDTH = 12
+
+
+def seq_key(seq: int) -> str:
+    """Journal key for a sequence number; keys sort in sequence order."""
+    return f"{_KEY_PREFIX}{seq:0{_SEQ_WIDTH}d}"
+
+
+def key_seq(key: str) -> int:
+    return int(key[len(_KEY_PREFIX):])
+
+
+def change_for_path(path: str, value: Any) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Map a root path ``users/{uid}/{collection}/{id}[/...]`` to (uid, entry).
+
+    Month-partitioned transaction paths map like their flat form. Returns
+    None for paths outside the journaled collections.
+    """
+    parts = split_transaction_path(path.strip("/").split("/"))
+    if parts is None or len(parts) < 4 or parts[0] != "users" or parts[2] not in JOURNALED_COLLECTIONS:
+        return None
+    entry: Dict[str, Any] = {"collection": parts[2], "id": parts[3]}
+    if len(parts) > 4:
+        entry["op"] = "upsert"
+    elif value is None:
+        entry["op"] = "delete"
+    else:
+        entry["op"] = "upsert"
+        entry["value"] = value
+    return parts[1], entry
+
+
+def changes_for_updates(updates: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """Group the journal entries for a root multi-path update by user.
+
+    Several writes to one item collapse into a single entry; if they are not
+    a single whole-item write (optionally with deletes of other copies, as
+    when a transaction moves partition) the entry carries no value.
+    """
+    by_user: Dict[str, Dict[Tuple[str, str], Dict[str, Any]]] = {}
+    for path, value in updates.items():
+        change = change_for_path(path, value)
+        if change is None:
+            continue
+        user_id, entry = change
+        items = by_user.setdefault(user_id, {})
+        key = (entry["collection"], entry["id"])
+        previous = items.get(key)
+        if previous is not None:
+            if previous["op"] == "delete" and (entry["op"] == "delete" or "value" in entry):
+                pass
+            elif entry["op"] == "delete" and "value" in previous:
+                entry = previous
+            else:
+                entry = {"collection": entry["collection"], "id": entry["id"], "op": "upsert"}
+        items[key] = entry
+    return {user_id: list(items.values()) for user_id, items in by_user.items()}
+
+
+def needs_compaction(previous_seq: int, new_seq: int) -> bool:
+    return new_seq // CHANGE_LOG_COMPACT_EVERY > previous_seq // CHANGE_LOG_COMPACT_EVERY
@@ -1,11 +1,25 @@
 """Firebase Realtime Database data store for the cash-track backend with user isolation."""
 from __future__ import annotations
 
-from collections import Counter
 from datetime import datetime
 from typing import Any, Dict, Iterable, List, Tuple
+
 from services.firebase_db import get_firebase_store
+from services.archive import archived_investment_flows, archived_max_id, get_archive_totals, merge_totals
 from services.auth import get_current_user_id
+from services.budgets import rebuild_spend_counters, record_transaction_spend
+from services.fx import (
+    convert_records,
+    get_reporting_currency,
+    normalize_currency,
+    rate_store,
+    record_currency,
+    set_reporting_currency,
+)
+from services.networth import record_holdings, record_transaction
+from services.price_history import record_price
+from services.returns import investment_returns
+from services.search import index_transaction, unindex_transaction
 
 # Get Firebase store instance
 firebase_store = get_firebase_store()
@@ -85,14 +99,9 @@ def update_savings_goal(goal_id: str, updates: Dict[str, Any]) -> Dict[str, Any]
     if not firebase_store.firebase_available:
         raise RuntimeError("Firebase store is not available")
 
-    goals = firebase_store.get_savings_goals(user_id)
-    goal = next((g for g in goals if g.get("id") == goal_id), None)
-    if not goal:
-        return None
-    goal.update(updates)
-    goal["updated_at"] = datetime.utcnow().isoformat() + "Z"
-    firebase_store.save_savings_goal(user_id, goal)
-    return goal
+    changes = {key: value for key, value in updates.items() if key != "id"}
+    changes["updated_at"] = datetime.utcnow().isoformat() + "Z"
+    return firebase_store.patch_one(user_id, "savings_goals", goal_id, changes)
 
 
 def delete_savings_goal(goal_id: str) -> bool:
@@ -115,15 +124,16 @@ def _next_transaction_id() -> str:
     if not firebase_store.firebase_available:
         return "1"
 
-    transactions = firebase_store.get_transactions(user_id)
-    if transactions:
-        # Get the highest ID and increment
+    transaction_ids = firebase_store.transaction_ids(user_id)
+    archived_max = archived_max_id(user_id)
+    if transaction_ids or archived_max:
+        # Get the highest ID (archived ones included) and increment
         try:
-            max_id = max(int(t.get("id", "0")) for t in transactions if t.get("id", "0").isdigit())
+            max_id = max([int(t) for t in transaction_ids if t.isdigit()] + [archived_max])
             return str(max_id + 1)
         except (ValueError, TypeError):
             # If there's an issue with ID parsing, use length + 1
-            return str(len(transactions) + 1)
+            return str(len(transaction_ids) + 1)
     # No transactions exist, start with 1
     return "1"
 
@@ -150,7 +160,7 @@ def _next_investment_id() -> str:
     return "inv1"
 
 
-def get_transactions() -> List[Dict[str, Any]]:
+def get_transactions(start_month: str | None = None, end_month: str | None = None) -> List[Dict[str, Any]]:
     """Return transactions from Firebase for current user or empty list for new users."""
     user_id = get_current_user_id()
     if not user_id:
@@ -159,7 +169,7 @@ def get_transactions() -> List[Dict[str, Any]]:
     if not firebase_store.firebase_available:
         return []
 
-    transactions = firebase_store.get_transactions(user_id)
+    transactions = firebase_store.get_transactions(user_id, start_month, end_month)
     return transactions if transactions else []
 
 
@@ -170,8 +180,14 @@ def add_transaction(
     transaction_type: str,
     category: str,
     date: datetime | None = None,
+    currency: str | None = None,
+    investment_id: str | None = None,
 ) -> Dict[str, Any]:
-    """Add a transaction to Firebase for current user."""
+    """Add a transaction to Firebase for current user.
+
+    ``investment_id`` links it to an investment: expenses count as money
+    put into the holding and income as money taken out of it.
+    """
     user_id = get_current_user_id()
     if not user_id:
         raise ValueError("User must be authenticated to add transactions")
@@ -184,13 +200,23 @@ def add_transaction(
         "type": transaction_type,
         "category": category,
         "date": (date or datetime.utcnow()).isoformat() + "Z",
+        "currency": normalize_currency(currency) or get_reporting_currency(user_id),
     }
+    if investment_id:
+        transaction["investment_id"] = str(investment_id)
     
     # Save to Firebase
     if not firebase_store.firebase_available:
         raise RuntimeError("Firebase store is not available")
 
-    return firebase_store.save_transaction(user_id, transaction)
+    saved = firebase_store.save_transaction(user_id, transaction)
+    index_transaction(user_id, saved)
+    # Keep monthly budget counters current and surface any thresholds crossed
+    alerts = record_transaction_spend(user_id, saved)
+    record_transaction(user_id, saved)
+    if alerts:
+        return {**saved, "budget_alerts": alerts}
+    return saved
 
 
 def delete_transaction(transaction_id: str) -> bool:
@@ -202,33 +228,83 @@ def delete_transaction(transaction_id: str) -> bool:
     if not firebase_store.firebase_available:
         raise RuntimeError("Firebase store is not available")
 
-    # Delete from Firebase
-    return firebase_store.delete_transaction(user_id, transaction_id)
+    # Read the row first so its amount can be taken off the budget counters
+    transaction = firebase_store.get_one(user_id, "transactions", transaction_id)
+    deleted = firebase_store.delete_transaction(user_id, transaction_id)
+    if deleted:
+        unindex_transaction(user_id, transaction_id)
+    if deleted and transaction:
+        record_transaction_spend(user_id, transaction, sign=-1)
+        record_transaction(user_id, transaction, sign=-1)
+    return deleted
+
+
+def _transaction_totals(
+    transactions: List[Dict[str, Any]], currency: str
+) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """Summary and expense breakdown in ``currency``, converting every row in one batch."""
+    import numpy as np
+
+    amounts, missing = convert_records(transactions, "amount", currency, date_field="date")
+    types = np.array([t["type"] for t in transactions], dtype=object)
+    income = float(amounts[types == "income"].sum())
+    is_expense = types == "expense"
+    expense_amounts = np.abs(amounts[is_expense])
+    expenses = float(expense_amounts.sum())
 
+    # Preserve insertion order for deterministic output.
+    categories = [t["category"] for t, expense in zip(transactions, is_expense) if expense]
+    labels = list(dict.fromkeys(categories))
+    positions = {label: index for index, label in enumerate(labels)}
+    totals = np.bincount(
+        np.fromiter((positions[c] for c in categories), dtype=np.intp, count=len(categories)),
+        weights=expense_amounts,
+        minlength=len(labels),
+    )
 
-def transaction_summary() -> Dict[str, Any]:
-    """Compute totals for income, expenses, and balance from Firebase data."""
-    transactions = get_transactions()
-    income = sum(t["amount"] for t in transactions if t["type"] == "income")
-    expenses = sum(abs(t["amount"]) for t in transactions if t["type"] == "expense")
-    balance = income - expenses
-    return {
+    summary = {
         "income": income,
         "expenses": expenses,
-        "balance": balance,
+        "balance": income - expenses,
         "transaction_count": len(transactions),
+        "currency": currency,
     }
+    if missing:
+        summary["missing_rates"] = missing
+    return summary, {label: float(total) for label, total in zip(labels, totals)}
+
+
+def _user_totals(currency: str) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """Live transaction totals plus the precomputed totals of archived years.
+
+    Shared across workers until the user's next write; keyed by day as
+    well, since conversions use that day's rates.
+    """
+    user_id = get_current_user_id()
+
+    def compute() -> Tuple[Dict[str, Any], Dict[str, float]]:
+        summary, breakdown = _transaction_totals(get_transactions(), currency)
+        if user_id and firebase_store.firebase_available:
+            merge_totals(summary, breakdown, get_archive_totals(user_id, currency))
+        return summary, breakdown
+
+    if not user_id or not firebase_store.firebase_available:
+        return compute()
+    today = datetime.utcnow().date().isoformat()
+    summary, breakdown = firebase_store.cached_aggregate(user_id, f"totals:{currency}:{today}", compute)
+    return summary, breakdown
+
+
+def transaction_summary() -> Dict[str, Any]:
+    """Compute totals for income, expenses, and balance in the user's reporting currency."""
+    currency = get_reporting_currency(get_current_user_id())
+    return _user_totals(currency)[0]
 
 
 def expense_breakdown() -> Dict[str, float]:
-    """Return a category => total spent mapping for expenses from Firebase data."""
-    transactions = get_transactions()
-    counter: Counter[str] = Counter()
-    for transaction in transactions:
-        if transaction["type"] == "expense":
-            counter[transaction["category"]] += abs(transaction["amount"])
-    # Preserve insertion order for deterministic output.
-    return dict(counter)
+    """Return a category => total spent mapping in the user's reporting currency."""
+    currency = get_reporting_currency(get_current_user_id())
+    return _user_totals(currency)[1]
 
 
 def get_investments() -> List[Dict[str, Any]]:
@@ -244,6 +320,36 @@ def get_investments() -> List[Dict[str, Any]]:
     return investments if investments else []
 
 
+def portfolio_returns(investments: List[Dict[str, Any]] | None = None) -> Dict[str, Any]:
+    """CAGR/XIRR per investment and the portfolio XIRR in the reporting currency.
+
+    Shared across workers until the user's next write, and per day since
+    the valuation date and conversion rates move daily.
+    """
+    user_id = get_current_user_id()
+    currency = get_reporting_currency(user_id)
+
+    def compute() -> Dict[str, Any]:
+        holdings = get_investments() if investments is None else investments
+        linked = [t for t in get_transactions() if t.get("investment_id")]
+        if user_id and firebase_store.firebase_available:
+            linked.extend(archived_investment_flows(user_id))
+        return investment_returns(holdings, linked, currency)
+
+    if not user_id or not firebase_store.firebase_available:
+        return compute()
+    today = datetime.utcnow().date().isoformat()
+    return firebase_store.cached_aggregate(user_id, f"returns:{currency}:{today}", compute)
+
+
+def investments_with_returns() -> List[Dict[str, Any]]:
+    """Investments with their ``cagr`` and ``xirr`` (percent, or None when undefined)."""
+    investments = get_investments()
+    holdings = portfolio_returns(investments)["holdings"]
+    empty = {"cagr": None, "xirr": None}
+    return [{**investment, **holdings.get(str(investment.get("id")), empty)} for investment in investments]
+
+
 def add_investment(
     investment_type: str,
     name: str,
@@ -253,7 +359,8 @@ def add_investment(
     description: str = "",
     quantity: float | None = None,
     location: str = "",
-    custom_type: str = ""
+    custom_type: str = "",
+    currency: str | None = None,
 ) -> Dict[str, Any]:
     """Add an investment to Firebase for current user."""
     user_id = get_current_user_id()
@@ -269,6 +376,7 @@ def add_investment(
         "current_value": float(current_value),
         "purchase_date": purchase_date.isoformat() + "Z",
         "last_updated": datetime.utcnow().isoformat() + "Z",
+        "currency": normalize_currency(currency) or get_reporting_currency(user_id),
     }
     
     # Add optional fields if provided
@@ -283,7 +391,9 @@ def add_investment(
     if not firebase_store.firebase_available:
         raise RuntimeError("Firebase store is not available")
 
-    return firebase_store.save_investment(user_id, investment)
+    saved = firebase_store.save_investment(user_id, investment)
+    record_holdings(user_id)
+    return saved
 
 
 def update_investment(
@@ -298,18 +408,15 @@ def update_investment(
     if not firebase_store.firebase_available:
         raise RuntimeError("Firebase store is not available")
 
-    # Get current investment
-    investments = firebase_store.get_investments(user_id)
-    investment = next((inv for inv in investments if inv.get("id") == investment_id), None)
-    if not investment:
-        return None
-        
-    # Update fields
-    investment.update(updates)
-    investment["last_updated"] = datetime.utcnow().isoformat() + "Z"
-    
-    # Save back to Firebase
-    return firebase_store.save_investment(user_id, investment)
+    # Patch only this investment's node instead of rewriting the collection
+    changes = {key: value for key, value in updates.items() if key != "id"}
+    if "currency" in changes:
+        changes["currency"] = normalize_currency(changes["currency"]) or get_reporting_currency(user_id)
+    changes["last_updated"] = datetime.utcnow().isoformat() + "Z"
+    updated = firebase_store.patch_one(user_id, "investments", investment_id, changes)
+    if updated is not None:
+        record_holdings(user_id)
+    return updated
 
 
 def delete_investment(investment_id: str) -> bool:
@@ -322,7 +429,10 @@ def delete_investment(investment_id: str) -> bool:
         raise RuntimeError("Firebase store is not available")
 
     # Delete from Firebase
-    return firebase_store.delete_investment(user_id, investment_id)
+    deleted = firebase_store.delete_investment(user_id, investment_id)
+    if deleted:
+        record_holdings(user_id)
+    return deleted
 
 
 
@@ -345,6 +455,7 @@ def add_stock(
     quantity: float,
     purchase_price: float,
     current_price: float | None = None,
+    currency: str | None = None,
 ) -> Dict[str, Any]:
     """Persist a stock position to Firebase for current user. Default to reference price when current price is missing."""
     user_id = get_current_user_id()
@@ -365,6 +476,7 @@ def add_stock(
         "quantity": float(quantity),
         "purchase_price": float(purchase_price),
         "current_price": resolved_current_price,
+        "currency": normalize_currency(currency) or get_reporting_currency(user_id),
     }
     
     # Save to Firebase
@@ -372,6 +484,13 @@ def add_stock(
         raise RuntimeError("Firebase store is not available")
 
     firebase_store.save_stock(user_id, stock)
+    record_holdings(user_id)
+    if current_price is None and reference:
+        # Only reference prices go into the shared history, never user input.
+        try:
+            record_price(ticker, float(reference["price"]))
+        except (OSError, ValueError):
+            pass
     return stock.copy()
 
 
@@ -385,7 +504,10 @@ def delete_stock(ticker: str) -> bool:
         raise RuntimeError("Firebase store is not available")
 
     # Delete from Firebase
-    return firebase_store.delete_stock(user_id, ticker)
+    deleted = firebase_store.delete_stock(user_id, ticker)
+    if deleted:
+        record_holdings(user_id)
+    return deleted
 
 
 def available_stocks() -> Tuple[Dict[str, Any], ...]:
@@ -411,6 +533,7 @@ def _stocks_with_derived_values(
                 "current_price": current_price,
                 "current_value": current_value,
                 "profit": profit,
+                "currency": record_currency(stock),
             }
         )
     return enriched
@@ -427,10 +550,16 @@ def enrich_stock(stock: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def dashboard_overview() -> Dict[str, Any]:
-    """Return the aggregated dashboard payload expected by the frontend."""
-    summary = transaction_summary()
+    """Return the aggregated dashboard payload expected by the frontend.
+
+    Totals are in the user's reporting currency; transactions convert at their
+    own date and holdings at the latest rates.
+    """
+    currency = get_reporting_currency(get_current_user_id())
+    summary, expense_data = _user_totals(currency)
     stocks = stock_positions()
     investments = get_investments()
+    returns = portfolio_returns(investments)
     savings_goals = get_savings_goals()
 
     for goal in savings_goals:
@@ -439,19 +568,22 @@ def dashboard_overview() -> Dict[str, Any]:
         goal["progress"] = round((current / target) * 100, 2) if target > 0 else 0.0
         goal["remaining_amount"] = max(target - current, 0.0)
 
-    total_stock_value = sum(item["current_value"] for item in stocks)
-    total_investment_value = sum(item["current_value"] for item in investments)
+    stock_values, stock_missing = convert_records(stocks, "current_value", currency)
+    investment_values, investment_missing = convert_records(investments, "current_value", currency)
+    total_stock_value = float(stock_values.sum())
+    total_investment_value = float(investment_values.sum())
+    missing_rates = sorted(set(summary.get("missing_rates", [])) | set(stock_missing) | set(investment_missing))
     total_savings = max(summary["income"] - summary["expenses"], 0.0)
     deficit = summary["income"] - summary["expenses"]
 
-    expense_data = expense_breakdown()
     expense_labels = list(expense_data.keys())
     expense_values = [expense_data[label] for label in expense_labels]
 
     assets = total_stock_value + total_investment_value + total_savings
     liabilities = max(summary["expenses"] - summary["income"], 0.0)
 
-    return {
+    overview = {
+        "currency": currency,
         "net_worth": round(total_stock_value + total_investment_value, 2),
         "total_savings": round(total_savings, 2),
         "total_net_worth": round(total_stock_value + total_investment_value + total_savings, 2),
@@ -465,7 +597,11 @@ def dashboard_overview() -> Dict[str, Any]:
             "data": [round(assets, 2), round(liabilities, 2)],
         },
         "stock_data": stocks,
-        "investment_data": investments,
+        "investment_data": [
+            {**investment, **returns["holdings"].get(str(investment.get("id")), {"cagr": None, "xirr": None})}
+            for investment in investments
+        ],
+        "investment_returns": returns["portfolio"],
         "savings_goals": savings_goals,
         "available_stocks": [
             {
@@ -476,13 +612,46 @@ def dashboard_overview() -> Dict[str, Any]:
             for item in _AVAILABLE_STOCKS
         ],
     }
+    if missing_rates:
+        overview["missing_rates"] = missing_rates
+    return overview
+
+
+def get_settings() -> Dict[str, Any]:
+    """Return the current user's settings."""
+    user_id = get_current_user_id()
+    return {
+        "reporting_currency": get_reporting_currency(user_id),
+        "available_currencies": rate_store.currencies(),
+    }
+
+
+def update_settings(updates: Dict[str, Any]) -> Dict[str, Any]:
+    """Update the current user's settings."""
+    user_id = get_current_user_id()
+    if not user_id:
+        raise ValueError("User must be authenticated to update settings")
+    if not firebase_store.firebase_available:
+        raise RuntimeError("Firebase store is not available")
+
+    if "reporting_currency" in updates:
+        previous = get_reporting_currency(user_id)
+        if set_reporting_currency(user_id, updates["reporting_currency"]) != previous:
+            # Budget spend counters are kept in the reporting currency.
+            if firebase_store.get_value(user_id, "budgets"):
+                rebuild_spend_counters(user_id)
+    return get_settings()
 
 
 # Removed seeding - users should start with empty data
 # _firebase_seeded = False
 
 def initialize_firebase_data():
-    """Initialize Firebase connection - no seeding for production."""
+    """Warm up the Firebase connection - no seeding for production.
+
+    Called from the gunicorn ``post_fork`` hook rather than at import time so
+    cold starts do not block on network I/O.
+    """
     if not firebase_store.firebase_available:
         return
     
@@ -492,7 +661,3 @@ def initialize_firebase_data():
         firebase_store.get_transactions("connection_test")
     except Exception:
         pass
-
-
-# Initialize Firebase connection on module import
-initialize_firebase_data()
\ No newline at end of file
@@ -0,0 +1,265 @@
+"""Streaming export of a user's data as CSV, JSON Lines or Parquet.
+
+Exports page through the store collection by collection, so memory use
+stays flat regardless of account size. Large exports can run as background
+jobs that write to the local state directory and are downloaded later.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from services.archive import iter_archived
+from services.firebase_db import get_firebase_store
+from services.local_state import read_json, state_path, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+firebase_store = get_firebase_store()
+
+COLLECTION_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "transactions": ("id", "title", "content", "amount", "currency", "type", "category", "date"),
+    "investments": (
+        "id", "type", "name", "description", "purchase_value", "current_value", "currency",
+        "purchase_date", "last_updated", "quantity", "location", "custom_type",
+    ),
+    "stocks": ("ticker", "quantity", "purchase_price", "current_price", "currency"),
+    "savings_goals": (
+        "id", "name", "target_amount", "current_amount", "deadline", "category",
+        "priority", "created_at", "updated_at",
+    ),
+}
+NUMERIC_FIELDS = {
+    "amount", "purchase_value", "current_value", "quantity", "purchase_price",
+    "current_price", "target_amount", "current_amount",
+}
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", 500))
+EXPORT_JOB_TTL = float(os.getenv("EXPORT_JOB_TTL", 24 * 3600))
+_CHUNK_SIZE = 64 * 1024
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def parse_collections(value: str | None) -> List[str]:
+    """Parse a comma-separated collection list (default: all collections)."""
+    if not value:
+        return list(COLLECTION_FIELDS)
+    collections = [c.strip() for c in value.split(",") if c.strip()]
+    unknown = [c for c in collections if c not in COLLECTION_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown collections: {', '.join(unknown)}")
+    return collections
+
+
+def _columns(collections: List[str]) -> List[str]:
+    """Column order for a flat export; multi-collection exports add a ``collection`` column."""
+    columns: List[str] = [] if len(collections) == 1 else ["collection"]
+    for collection in collections:
+        for field in COLLECTION_FIELDS[collection]:
+            if field not in columns:
+                columns.append(field)
+    return columns
+
+
+def iter_records(user_id: str, collections: List[str]) -> Iterator[List[Dict[str, Any]]]:
+    """Yield pages of records tagged with their collection."""
+    for collection in collections:
+        if collection == "transactions":
+            for page in iter_archived(user_id, EXPORT_PAGE_SIZE):
+                yield [{"collection": collection, **record} for record in page]
+        for page in firebase_store.iter_collection(user_id, collection, EXPORT_PAGE_SIZE):
+            yield [{"collection": collection, **record} for record in page]
+
+
+def stream_csv(user_id: str, collections: List[str]) -> Iterator[bytes]:
+    columns = _columns(collections)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for page in iter_records(user_id, collections):
+        writer.writerows(page)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def stream_jsonl(user_id: str, collections: List[str]) -> Iterator[bytes]:
+    for page in iter_records(user_id, collections):
+        yield "".join(json.dumps(record) + "\n" for record in page).encode("utf-8")
+
+
+def write_parquet(user_id: str, collections: List[str], destination: Path) -> None:
+    """Write a Parquet file one row group per page (requires ``pyarrow``)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("Parquet export requires the optional 'pyarrow' package") from exc
+
+    columns = _columns(collections)
+    schema = pa.schema([
+        (column, pa.float64() if column in NUMERIC_FIELDS else pa.string()) for column in columns
+    ])
+
+    def convert(value: Any, column: str) -> Any:
+        if value is None:
+            return None
+        if column in NUMERIC_FIELDS:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+        return value if isinstance(value, str) else json.dumps(value)
+
+    with pq.ParquetWriter(str(destination), schema) as writer:
+        for page in iter_records(user_id, collections):
+            table = pa.table(
+                {column: [convert(row.get(column), column) for row in page] for column in columns},
+                schema=schema,
+            )
+            writer.write_table(table)
+
+
+def stream_file(path: Path, remove: bool = False) -> Iterator[bytes]:
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if remove:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def stream_export(user_id: str, export_format: str, collections: List[str]) -> Iterator[bytes]:
+    """Return a byte stream for the export in the requested format."""
+    if export_format == "csv":
+        return stream_csv(user_id, collections)
+    if export_format == "jsonl":
+        return stream_jsonl(user_id, collections)
+    if export_format == "parquet":
+        # Parquet needs its footer written last, so spool to a temp file first.
+        handle, name = tempfile.mkstemp(suffix=".parquet")
+        os.close(handle)
+        path = Path(name)
+        try:
+            write_parquet(user_id, collections, path)
+        except Exception:
+            path.unlink()
+            raise
+        return stream_file(path, remove=True)
+    raise ValueError(f"Unsupported export format: {export_format}")
+
+
+def export_filename(export_format: str) -> str:
+    return f"cash-track-export-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{FORMATS[export_format][1]}"
+
+
+# Background jobs
+def _jobs_dir(user_id: str) -> Path:
+    return state_path("exports", user_id, ".keep").parent
+
+
+def _job_meta_path(user_id: str, job_id: str) -> Path:
+    return _jobs_dir(user_id) / f"{job_id}.json"
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+        return _executor
+
+
+def _expire_old_jobs(user_id: str) -> None:
+    cutoff = time.time() - EXPORT_JOB_TTL
+    for path in _jobs_dir(user_id).iterdir():
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
+
+
+def _run_job(user_id: str, job: Dict[str, Any]) -> None:
+    meta_path = _job_meta_path(user_id, job["id"])
+    output = _jobs_dir(user_id) / job["file"]
+    partial = output.with_name(output.name + ".part")
+    job["status"] = "running"
+    write_json_atomic(meta_path, job)
+    try:
+        if job["format"] == "parquet":
+            write_parquet(user_id, job["collections"], partial)
+        else:
+            with open(partial, "wb") as f:
+                for chunk in stream_export(user_id, job["format"], job["collections"]):
+                    f.write(chunk)
+        os.replace(partial, output)
+        job.update(status="completed", size=output.stat().st_size)
+    except Exception as exc:
+        logger.warning("Export job %s failed: %s", job["id"], exc)
+        job.update(status="failed", error=str(exc))
+        try:
+            partial.unlink()
+        except OSError:
+            pass
+    job["finished_at"] = datetime.utcnow().isoformat() + "Z"
+    write_json_atomic(meta_path, job)
+
+
+def start_export_job(user_id: str, export_format: str, collections: List[str]) -> Dict[str, Any]:
+    """Queue a background export and return its job record."""
+    if export_format not in FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    _expire_old_jobs(user_id)
+    job_id = uuid.uuid4().hex
+    job = {
+        "id": job_id,
+        "format": export_format,
+        "collections": collections,
+        "status": "queued",
+        "file": f"{job_id}.{FORMATS[export_format][1]}",
+        "created_at": datetime.utcnow().isoformat() + "Z",
+    }
+    # Metadata lives on disk so any worker can report status and serve the file.
+    write_json_atomic(_job_meta_path(user_id, job_id), job)
+    _get_executor().submit(_run_job, user_id, dict(job))
+    return job
+
+
+def get_export_job(user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+    """Return a job record for this user, or None if it does not exist."""
+    if not job_id.isalnum():
+        return None
+    return read_json(_job_meta_path(user_id, job_id))
+
+
+def export_job_file(user_id: str, job: Dict[str, Any]) -> Path:
+    return _jobs_dir(user_id) / job["file"]
+
@@ -5,13 +5,20 @@ import json
 import os
 from functools import lru_cache
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import firebase_admin
-from firebase_admin import auth, credentials, db, firestore
+if TYPE_CHECKING:
+    import firebase_admin
+
+# firebase_admin (and especially firestore/gRPC) is imported lazily inside the
+# functions below so that importing the app does not pay for it on cold starts.
 
 SERVICE_ACCOUNT_PATH = Path(__file__).resolve().parent.parent / "firebase-service-account.json"
 
+# Per-request deadline for Firebase HTTP calls (the SDK default is 120s, far
+# beyond gunicorn's worker timeout).
+HTTP_TIMEOUT_SECONDS = float(os.getenv('FIREBASE_HTTP_TIMEOUT', 5))
+
 
 class MockAuth:
     """Mock Firebase auth for development without service account."""
@@ -26,7 +33,9 @@ class MockAuth:
 @lru_cache
 def initialize_app() -> firebase_admin.App | None:
     """Initialise and cache the Firebase app instance with Realtime Database support."""
-    
+    import firebase_admin
+    from firebase_admin import credentials
+
     # Try environment variable first (for production/Render deployment)
     service_account_json = os.getenv('FIREBASE_SERVICE_ACCOUNT_JSON')
     if service_account_json:
@@ -39,7 +48,8 @@ def initialize_app() -> firebase_admin.App | None:
             
             cred = credentials.Certificate(service_account_dict)
             app = firebase_admin.initialize_app(cred, {
-                'databaseURL': database_url
+                'databaseURL': database_url,
+                'httpTimeout': HTTP_TIMEOUT_SECONDS,
             })
             return app
         except (json.JSONDecodeError, Exception) as e:
@@ -61,7 +71,8 @@ def initialize_app() -> firebase_admin.App | None:
             
             cred = credentials.Certificate(str(SERVICE_ACCOUNT_PATH))
             app = firebase_admin.initialize_app(cred, {
-                'databaseURL': database_url
+                'databaseURL': database_url,
+                'httpTimeout': HTTP_TIMEOUT_SECONDS,
             })
             return app
         except Exception as e:
@@ -77,6 +88,7 @@ def get_firebase_auth() -> Any:
     if app is None:
         # Return mock auth for development
         return MockAuth()
+    from firebase_admin import auth
     return auth
 
 
@@ -85,6 +97,7 @@ def get_firebase_db():
     app = initialize_app()
     if app is None:
         return None
+    from firebase_admin import db
     return db
 
 
@@ -93,4 +106,5 @@ def get_firestore_client():
     app = initialize_app()
     if app is None:
         return None
+    from firebase_admin import firestore
     return firestore.client()
@@ -1,17 +1,147 @@
 """Firebase Realtime Database service for Cash Track with user isolation."""
-import firebase_admin
-from firebase_admin import credentials, db
-import json
+import bisect
+import copy
 import os
-from typing import Dict, List, Any, Optional
-from datetime import datetime
-from services.firebase import initialize_app
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Tuple
+from flask import g, has_app_context
+from services.cache import SingleFlight, TTLCache
+from services.change_journal import (
+    CHANGE_LOG_COMPACT_EVERY,
+    CHANGE_LOG_RETAIN,
+    CHANGES_PATH,
+    FLOOR_PATH,
+    JOURNALED_COLLECTIONS,
+    SEQ_PATH,
+    change_for_path,
+    changes_for_updates,
+    needs_compaction,
+    seq_key,
+)
+from services.firebase import get_firebase_db, initialize_app
+from services.local_state import state_path
+from services.resilience import CircuitBreaker, StoreUnavailableError, call_with_retries
+from services.shared_cache import shared_cache
+from services.transaction_partitions import (
+    INDEX_PATH,
+    SCHEMA_FLAT,
+    SCHEMA_PARTITIONED,
+    SCHEMA_PATH,
+    flatten_transactions,
+    is_partition_key,
+    partition_for,
+)
+
+# Optional write-behind mode: buffer writes and flush them as multi-path updates.
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+
+# Total time budget for one store call including retries; kept well under the
+# 30s gunicorn worker timeout. Each HTTP attempt is bounded by httpTimeout.
+CALL_DEADLINE_SECONDS = float(os.getenv('FIREBASE_CALL_DEADLINE', 8))
+CALL_ATTEMPTS = int(os.getenv('FIREBASE_CALL_ATTEMPTS', 3))
+LAST_GOOD_MAX_ENTRIES = int(os.getenv('FIREBASE_LAST_GOOD_ENTRIES', 2048))
+# Concurrent reads of the same user path share one RTDB fetch.
+READ_COALESCING_ENABLED = os.getenv('READ_COALESCING', '1').lower() not in ('0', 'false', 'no')
+# How long a worker trusts a user's cached transaction layout marker.
+TRANSACTION_SCHEMA_TTL = float(os.getenv('TRANSACTION_SCHEMA_TTL', 60))
+# Whole-collection snapshots kept in the cross-worker shared cache.
+SHARED_CACHE_PATHS = JOURNALED_COLLECTIONS | {INDEX_PATH}
+
+
+def _as_item_map(data: Any) -> Dict[str, Any]:
+    """Normalise an RTDB collection (dict, or sparse list for numeric keys) to {id: item}."""
+    if isinstance(data, dict):
+        return {str(k): v for k, v in data.items() if v is not None}
+    if isinstance(data, list):
+        # Filter out None values from array indices
+        return {str(i): v for i, v in enumerate(data) if v is not None}
+    return {}
+
+
+def _apply_write(node: Any, prefix: str, path: str, value: Any) -> Any:
+    """Apply a pending write at ``path`` to the node stored at ``prefix``."""
+    if path == prefix:
+        return copy.deepcopy(value)
+    if prefix.startswith(path + '/'):
+        # Write to an ancestor: pick our node out of the written value.
+        for key in prefix[len(path) + 1:].split('/'):
+            if isinstance(value, list):
+                value = _as_item_map(value)
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return copy.deepcopy(value)
+
+    parts = path[len(prefix) + 1:].split('/')
+    root = _as_item_map(node) if isinstance(node, list) else node
+    root = root if isinstance(root, dict) else {}
+    current = root
+    for key in parts[:-1]:
+        child = current.get(key)
+        if not isinstance(child, dict):
+            if value is None:
+                return root
+            child = {}
+            current[key] = child
+        current = child
+    if value is None:
+        current.pop(parts[-1], None)
+    else:
+        current[parts[-1]] = copy.deepcopy(value)
+    return root
+
+
+def _mark_stale() -> None:
+    """Flag the current request as served from last-known-good data."""
+    if has_app_context():
+        g.stale_data = True
+
+
+def _transient_errors() -> tuple:
+    """Exception types worth retrying (and counting against the circuit)."""
+    from firebase_admin import exceptions
+
+    return (
+        exceptions.UnavailableError,
+        exceptions.DeadlineExceededError,
+        exceptions.InternalError,
+        exceptions.UnknownError,
+        OSError,
+    )
+
+
+class _ItemConflict(Exception):
+    """Raised inside a transaction to abort when the item is missing or changed."""
+
 
 class FirebaseDataStore:
     """Firebase Realtime Database data store for transactions and stocks with user isolation."""
     
     def __init__(self):
-        self.firebase_available = self._check_firebase_availability()
+        # Resolved on first use so constructing the store never touches Firebase.
+        self._firebase_available: Optional[bool] = None
+        self._write_behind = None
+        self._write_behind_pid: Optional[int] = None
+        self._write_behind_lock = threading.Lock()
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('FIREBASE_BREAKER_THRESHOLD', 5)),
+            reset_timeout=float(os.getenv('FIREBASE_BREAKER_RESET', 30)),
+        )
+        # Last-known-good raw values keyed by (user_id, path), used when reads fail.
+        self._last_good: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._last_good_lock = threading.Lock()
+        self._change_listeners: List[Callable[[str, int], None]] = []
+        self._schema_cache = TTLCache(ttl=TRANSACTION_SCHEMA_TTL, max_entries=10000)
+        self.read_flights = SingleFlight()
+
+    @property
+    def firebase_available(self) -> bool:
+        """Whether the Firebase app initialised; checked lazily and cached."""
+        if self._firebase_available is None:
+            self._firebase_available = self._check_firebase_availability()
+        return self._firebase_available
         
     def _check_firebase_availability(self) -> bool:
         """Check if Firebase is properly initialized."""
@@ -28,10 +158,615 @@ class FirebaseDataStore:
         try:
             # User-specific path: users/{user_id}/{data_type}
             user_path = f"users/{user_id}/{path}"
-            return db.reference(user_path)
+            return get_firebase_db().reference(user_path)
         except Exception as e:
             return None
     
+    # Write-behind support
+    def _get_write_behind(self):
+        """Return the write-behind queue for this process, or None when disabled."""
+        if not WRITE_BEHIND_ENABLED or not self.firebase_available:
+            return None
+        # Created lazily per process so no flusher thread exists before gunicorn forks.
+        if self._write_behind is None or self._write_behind_pid != os.getpid():
+            with self._write_behind_lock:
+                if self._write_behind is None or self._write_behind_pid != os.getpid():
+                    from services.write_behind import WriteBehindQueue
+
+                    self._write_behind = WriteBehindQueue(
+                        commit=self._commit_updates,
+                        journal_dir=state_path('write_behind', 'journal'),
+                        flush_interval=float(os.getenv('WRITE_BEHIND_FLUSH_MS', 500)) / 1000,
+                        max_batch=int(os.getenv('WRITE_BEHIND_MAX_BATCH', 500)),
+                        max_pending=int(os.getenv('WRITE_BEHIND_MAX_PENDING', 5000)),
+                    )
+                    self._write_behind_pid = os.getpid()
+        return self._write_behind
+
+    def flush_writes(self) -> bool:
+        """Flush buffered write-behind writes; a no-op when write-behind is off."""
+        queue = self._write_behind if self._write_behind_pid == os.getpid() else None
+        return queue.flush() if queue else True
+
+    def _flush_overlapping(self, user_id: str, path: str) -> None:
+        """Commit buffered writes touching a path before an RTDB transaction on it.
+
+        Atomic operations bypass the write-behind queue, so a buffered write
+        flushed after one would overwrite its result.
+        """
+        queue = self._get_write_behind()
+        if queue is not None and queue.pending_writes(user_id, f"users/{user_id}/{path}"):
+            if not queue.flush():
+                raise StoreUnavailableError("Buffered writes could not be flushed")
+
+    def _overlay_pending(self, user_id: str, path: str, data: Any) -> Any:
+        """Apply this user's unflushed writes so reads see their own writes."""
+        queue = self._get_write_behind()
+        if queue is None:
+            return data
+        prefix = f"users/{user_id}/{path}"
+        for write_path, value in queue.pending_writes(user_id, prefix):
+            data = _apply_write(data, prefix, write_path, value)
+        return data
+
+    # Change journal
+    def _allocate_seq(self, user_id: str, count: int) -> int:
+        """Reserve ``count`` consecutive journal sequence numbers, returning the first."""
+        ref = get_firebase_db().reference(f"users/{user_id}/{SEQ_PATH}")
+        head = self._call(lambda: ref.transaction(
+            lambda current: (current if isinstance(current, int) else 0) + count
+        ))
+        return head - count + 1
+
+    def _journal_updates(self, updates: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Tuple[str, int, int]]]:
+        """Build journal entries for a root update.
+
+        Returns (entry paths, [(user_id, first seq, last seq)]).
+        """
+        journal: Dict[str, Any] = {}
+        allocated: List[Tuple[str, int, int]] = []
+        for user_id, entries in changes_for_updates(updates).items():
+            first = self._allocate_seq(user_id, len(entries))
+            written_at = int(time.time() * 1000)
+            for offset, entry in enumerate(entries):
+                journal[f"users/{user_id}/{CHANGES_PATH}/{seq_key(first + offset)}"] = {**entry, "ts": written_at}
+            allocated.append((user_id, first, first + len(entries) - 1))
+        return journal, allocated
+
+    def _after_journal(self, allocated: List[Tuple[str, int, int]]) -> None:
+        """Compact journals that crossed a boundary and notify change listeners."""
+        for user_id, first, head in allocated:
+            if needs_compaction(first - 1, head):
+                self._compact_changes(user_id, head)
+            for listener in list(self._change_listeners):
+                try:
+                    listener(user_id, head)
+                except Exception:
+                    pass
+
+    def add_change_listener(self, listener: Callable[[str, int], None]) -> None:
+        """Call ``listener(user_id, head_seq)`` after journaled writes from this process."""
+        self._change_listeners.append(listener)
+
+    def _commit_updates(self, updates: Dict[str, Any]) -> None:
+        """Apply a root multi-path update atomically with its change journal entries."""
+        journal, allocated = self._journal_updates(updates)
+        self._call(lambda: get_firebase_db().reference('/').update({**updates, **journal}))
+        self._forget_reads(updates)
+        self._invalidate_shared(updates)
+        self._after_journal(allocated)
+
+    def _journal_change(self, user_id: str, path: str, value: Any) -> None:
+        """Journal a write made by an RTDB transaction, which cannot carry extra paths."""
+        journal, allocated = self._journal_updates({f"users/{user_id}/{path}": value})
+        if journal:
+            self._call(lambda: get_firebase_db().reference('/').update(journal))
+        self._after_journal(allocated)
+
+    def _compact_changes(self, user_id: str, head: int) -> None:
+        """Drop journal entries older than the retention window and raise the floor."""
+        floor = head - CHANGE_LOG_RETAIN + 1
+        if floor <= 1:
+            return
+        try:
+            ref = self._get_user_ref(user_id, CHANGES_PATH)
+            query = ref.order_by_key().end_at(seq_key(floor - 1)).limit_to_first(2 * CHANGE_LOG_COMPACT_EVERY)
+            stale = self._call(query.get) or {}
+            updates: Dict[str, Any] = {f"users/{user_id}/{CHANGES_PATH}/{key}": None for key in stale}
+            updates[f"users/{user_id}/{FLOOR_PATH}"] = floor
+            self._call(lambda: get_firebase_db().reference('/').update(updates))
+        except Exception:
+            pass
+
+    # Resilience: retries, circuit breaker and last-known-good fallback
+    def _call(self, fn):
+        """Run a Firebase call with bounded, jittered retries behind the circuit breaker."""
+        return call_with_retries(
+            fn,
+            self.breaker,
+            deadline=CALL_DEADLINE_SECONDS,
+            attempts=CALL_ATTEMPTS,
+            retry_on=_transient_errors(),
+        )
+
+    def _remember(self, user_id: str, path: str, data: Any) -> None:
+        with self._last_good_lock:
+            self._last_good[(user_id, path)] = copy.deepcopy(data)
+            self._last_good.move_to_end((user_id, path))
+            while len(self._last_good) > LAST_GOOD_MAX_ENTRIES:
+                self._last_good.popitem(last=False)
+
+    def _last_known_good(self, user_id: str, path: str) -> Tuple[bool, Any]:
+        with self._last_good_lock:
+            if (user_id, path) not in self._last_good:
+                return False, None
+            return True, copy.deepcopy(self._last_good[(user_id, path)])
+
+    def _forget_reads(self, full_paths: Iterable[str]) -> None:
+        """Keep reads issued after a write from joining fetches started before it."""
+        written = [path.strip('/') for path in full_paths]
+
+        def overlaps(key) -> bool:
+            read_path = f"users/{key[0]}/{key[1]}".rstrip('/')
+            return any(
+                read_path == path or read_path.startswith(path + '/') or path.startswith(read_path + '/')
+                for path in written
+            )
+
+        self.read_flights.forget(overlaps)
+
+    def _invalidate_shared(self, full_paths: Iterable[str]) -> None:
+        """Make shared-cache entries of every user written to stale."""
+        if shared_cache is None:
+            return
+        user_ids = {parts[1] for parts in (path.strip('/').split('/') for path in full_paths) if len(parts) > 1}
+        for user_id in user_ids:
+            shared_cache.invalidate(user_id)
+
+    def cached_aggregate(self, user_id: str, name: str, compute: Callable[[], Any]) -> Any:
+        """Return ``compute()``, shared across workers until the user's next write.
+
+        The result must be JSON-serialisable (tuples come back as lists).
+        Results built from last-known-good data are not cached.
+        """
+        if shared_cache is None or not user_id:
+            return compute()
+        hit, value, version = shared_cache.lookup(user_id, f"agg:{name}")
+        if hit:
+            return value
+        value = compute()
+        if not (has_app_context() and g.get('stale_data')):
+            shared_cache.store(user_id, f"agg:{name}", value, version)
+        return value
+
+    def _apply_to_last_good(self, user_id: str, path: str, value: Any) -> None:
+        """Keep cached snapshots in step with a committed write."""
+        full_path = f"users/{user_id}/{path}"
+        self._forget_reads([full_path])
+        with self._last_good_lock:
+            for (cached_user, cached_path), data in list(self._last_good.items()):
+                if cached_user != user_id:
+                    continue
+                prefix = f"users/{user_id}/{cached_path}"
+                if full_path == prefix or full_path.startswith(prefix + '/') or prefix.startswith(full_path + '/'):
+                    self._last_good[(cached_user, cached_path)] = _apply_write(data, prefix, full_path, value)
+
+    def _read(self, user_id: str, path: str) -> Any:
+        """Read the raw value at users/{user_id}/{path}, including pending writes.
+
+        Concurrent reads of the same path share one fetch. When Firebase is
+        failing (or the circuit is open) the last-known-good value is
+        returned instead and the request is marked stale.
+        """
+        ref = self._get_user_ref(user_id, path)
+        data = None
+        if ref:
+            shared = shared_cache if path in SHARED_CACHE_PATHS else None
+
+            def fetch():
+                if shared is not None:
+                    hit, value, version = shared.lookup(user_id, f"snap:{path}")
+                    if hit:
+                        self._remember(user_id, path, value)
+                        return value
+                value = self._call(ref.get)
+                self._remember(user_id, path, value)
+                if shared is not None:
+                    # Stored under the version seen before the fetch, so a
+                    # write committed meanwhile leaves the entry stale.
+                    shared.store(user_id, f"snap:{path}", value, version)
+                return value
+
+            try:
+                if READ_COALESCING_ENABLED:
+                    data = self.read_flights.do((user_id, path), fetch)
+                else:
+                    data = fetch()
+            except StoreUnavailableError:
+                found, data = self._last_known_good(user_id, path)
+                if not found:
+                    raise
+                _mark_stale()
+        return self._overlay_pending(user_id, path, data)
+
+    def _collection_items(self, user_id: str, collection: str) -> Dict[str, Any]:
+        """Read a whole collection as an {id: item} mapping."""
+        return _as_item_map(self._read(user_id, collection))
+
+    def _write(self, user_id: str, path: str, value: Any) -> None:
+        """Set (or delete, when value is None) users/{user_id}/{path}."""
+        queue = self._get_write_behind()
+        if queue is not None:
+            queue.enqueue(user_id, f"users/{user_id}/{path}", value)
+            return
+        ref = self._get_user_ref(user_id, path)
+        if ref:
+            full_path = f"users/{user_id}/{path}"
+            if change_for_path(full_path, value) is not None:
+                self._commit_updates({full_path: value})
+            elif value is None:
+                self._call(ref.delete)
+                self._invalidate_shared([full_path])
+            else:
+                self._call(lambda: ref.set(value))
+                self._invalidate_shared([full_path])
+            self._apply_to_last_good(user_id, path, value)
+
+    def _write_many(self, user_id: str, writes: Dict[str, Any]) -> None:
+        """Apply several user-relative writes together (atomically unless buffered)."""
+        queue = self._get_write_behind()
+        if queue is not None:
+            for path, value in writes.items():
+                queue.enqueue(user_id, f"users/{user_id}/{path}", value)
+            return
+        if not self._get_user_ref(user_id, ''):
+            return
+        self._commit_updates({f"users/{user_id}/{path}": value for path, value in writes.items()})
+        for path, value in writes.items():
+            self._apply_to_last_good(user_id, path, value)
+
+    # Transaction layout
+    def transaction_schema(self, user_id: str) -> str:
+        """The user's transaction layout, ``flat`` or ``partitioned`` (cached briefly)."""
+        schema = self._schema_cache.get(user_id)
+        if schema is None:
+            try:
+                schema = self._read(user_id, SCHEMA_PATH) or SCHEMA_FLAT
+            except Exception:
+                # Not cached, so the real layout is picked up once reads recover.
+                return SCHEMA_FLAT
+            self._schema_cache.set(user_id, schema)
+        return schema
+
+    def _transaction_partition(self, user_id: str, transaction_id: str) -> Optional[str]:
+        """The indexed partition of a transaction, or None when it is stored flat."""
+        partition = self._read(user_id, f"{INDEX_PATH}/{transaction_id}")
+        return partition if is_partition_key(partition) else None
+
+    def _item_path(self, user_id: str, collection: str, item_id: str) -> str:
+        if collection == 'transactions':
+            # The index is consulted in either layout so items moved by a
+            # running migration are still found by workers that think "flat".
+            partition = self._transaction_partition(user_id, item_id)
+            if partition:
+                return f"transactions/{partition}/{item_id}"
+        return f"{collection}/{item_id}"
+
+    def transaction_writes(self, user_id: str, transaction: Dict[str, Any]) -> Dict[str, Any]:
+        """User-relative paths that store a new transaction in the user's layout."""
+        transaction_id = transaction['id']
+        if self.transaction_schema(user_id) != SCHEMA_PARTITIONED:
+            return {f"transactions/{transaction_id}": transaction}
+        partition = partition_for(transaction)
+        return {
+            f"transactions/{partition}/{transaction_id}": transaction,
+            f"{INDEX_PATH}/{transaction_id}": partition,
+        }
+
+    def transaction_delete_writes(self, transaction: Dict[str, Any]) -> Dict[str, Any]:
+        """User-relative paths that remove a transaction in whichever layout holds it."""
+        transaction_id = transaction['id']
+        return {
+            f"transactions/{transaction_id}": None,
+            f"transactions/{partition_for(transaction)}/{transaction_id}": None,
+            f"{INDEX_PATH}/{transaction_id}": None,
+        }
+
+    # Single item methods
+    def get_one(self, user_id: str, collection: str, item_id: str) -> Optional[Dict[str, Any]]:
+        """Read a single item at users/{user_id}/{collection}/{item_id}."""
+        if not self.firebase_available or not user_id or not item_id:
+            return None
+
+        try:
+            item = self._read(user_id, self._item_path(user_id, collection, item_id))
+            if isinstance(item, dict):
+                return item
+        except StoreUnavailableError:
+            raise
+        except Exception:
+            pass
+
+        return None
+
+    def patch_one(
+        self,
+        user_id: str,
+        collection: str,
+        item_id: str,
+        updates: Dict[str, Any],
+        expected: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Merge updates into a single item with an RTDB transaction (compare-and-set).
+
+        Returns the updated item, or None when the item does not exist or a
+        field in ``expected`` no longer matches the stored value.
+        """
+        if not self.firebase_available or not user_id or not item_id:
+            return None
+
+        def apply(current):
+            if not isinstance(current, dict):
+                raise _ItemConflict()
+            if expected and any(current.get(k) != v for k, v in expected.items()):
+                raise _ItemConflict()
+            merged = dict(current)
+            merged.update(updates)
+            return merged
+
+        try:
+            path = self._item_path(user_id, collection, item_id)
+            ref = self._get_user_ref(user_id, path)
+            if ref:
+                self._flush_overlapping(user_id, path)
+                updated = self._call(lambda: ref.transaction(apply))
+                self._invalidate_shared([f"users/{user_id}/{path}"])
+                self._apply_to_last_good(user_id, path, updated)
+                self._journal_change(user_id, path, updated)
+                return updated
+        except _ItemConflict:
+            return None
+        except StoreUnavailableError:
+            raise
+        except Exception:
+            pass
+
+        return None
+
+    def delete_one(self, user_id: str, collection: str, item_id: str) -> bool:
+        """Delete a single item, returning False when it does not exist."""
+        if not self.firebase_available or not user_id or not item_id:
+            return False
+
+        try:
+            path = self._item_path(user_id, collection, item_id)
+            if self._get_write_behind() is not None:
+                exists = self._read(user_id, path) is not None
+            else:
+                ref = self._get_user_ref(user_id, path)
+                exists = bool(ref) and self._call(lambda: ref.get(shallow=True)) is not None
+            if exists and path != f'{collection}/{item_id}':
+                # Partitioned transaction: drop its index entry and any stray flat copy too.
+                self._write_many(user_id, {
+                    path: None,
+                    f'{collection}/{item_id}': None,
+                    f'{INDEX_PATH}/{item_id}': None,
+                })
+                return True
+            if exists:
+                self._write(user_id, path, None)
+                return True
+        except StoreUnavailableError:
+            raise
+        except Exception:
+            pass
+
+        return False
+
+    # Paged reads
+    def iter_collection(self, user_id: str, collection: str, page_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        """Yield a collection in key order, one page of items at a time.
+
+        Pages are fetched with key-ordered limit queries so only one page is
+        held in memory. Partitioned transactions are paged one month at a
+        time. Pending write-behind writes are flushed first.
+        """
+        if not self.firebase_available or not user_id:
+            return
+        self.flush_writes()
+        if collection != 'transactions':
+            yield from self._iter_pages(user_id, collection, page_size)
+            return
+
+        keys = sorted(self.child_keys(user_id, collection))
+        partitions = [key for key in keys if is_partition_key(key)]
+        if len(partitions) < len(keys):
+            # Flat items (unmigrated user, or a migration in progress).
+            for page in self._iter_pages(user_id, collection, page_size):
+                page = [item for item in page if 'id' in item]
+                if page:
+                    yield page
+        for partition in partitions:
+            yield from self._iter_pages(user_id, f"{collection}/{partition}", page_size)
+
+    def _iter_pages(self, user_id: str, path: str, page_size: int) -> Iterator[List[Dict[str, Any]]]:
+        ref = self._get_user_ref(user_id, path)
+        if not ref:
+            return
+
+        cursor: Optional[str] = None
+        while True:
+            query = ref.order_by_key()
+            if cursor is not None:
+                query = query.start_at(cursor)
+            # One extra row because start_at is inclusive of the cursor.
+            query = query.limit_to_first(page_size + (1 if cursor is not None else 0))
+            page = _as_item_map(self._call(query.get))
+            if cursor is not None:
+                page.pop(cursor, None)
+            if not page:
+                return
+            yield list(page.values())
+            cursor = list(page.keys())[-1]
+            if len(page) < page_size:
+                return
+
+    # Generic value methods
+    def get_value(self, user_id: str, path: str) -> Any:
+        """Read the raw value at users/{user_id}/{path} (None when missing).
+
+        Raises StoreUnavailableError when Firebase is failing and no
+        last-known-good copy exists.
+        """
+        if not self.firebase_available or not user_id:
+            return None
+        try:
+            return self._read(user_id, path)
+        except StoreUnavailableError:
+            raise
+        except Exception:
+            return None
+
+    def set_value(self, user_id: str, path: str, value: Any) -> None:
+        """Set (or delete, when value is None) the value at users/{user_id}/{path}."""
+        if not self.firebase_available or not user_id:
+            return
+        try:
+            self._write(user_id, path, value)
+        except StoreUnavailableError:
+            raise
+        except Exception:
+            pass
+
+    def transact_value(self, user_id: str, path: str, apply: Callable[[Any], Any]) -> Any:
+        """Atomically replace the value at a path with ``apply(current)``, returning it.
+
+        Runs as an RTDB transaction even with write-behind on.
+        """
+        if not self.firebase_available or not user_id:
+            return None
+
+        try:
+            ref = self._get_user_ref(user_id, path)
+            if ref:
+                self._flush_overlapping(user_id, path)
+                value = self._call(lambda: ref.transaction(apply))
+                self._invalidate_shared([f"users/{user_id}/{path}"])
+                self._apply_to_last_good(user_id, path, value)
+                self._journal_change(user_id, path, value)
+                return value
+        except StoreUnavailableError:
+            raise
+        except Exception:
+            pass
+        return None
+
+    def increment_value(self, user_id: str, path: str, delta: float) -> Optional[float]:
+        """Atomically add ``delta`` to a numeric counter, returning the new value."""
+
+        def apply(current):
+            base = current if isinstance(current, (int, float)) else 0.0
+            return round(base + delta, 2)
+
+        return self.transact_value(user_id, path, apply)
+
+    def get_range(
+        self,
+        user_id: str,
+        path: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        last: Optional[int] = None,
+        first: Optional[int] = None,
+        flush: bool = True,
+    ) -> "OrderedDict[str, Any]":
+        """Read children of a node with keys in [start, end], in key order.
+
+        ``first``/``last`` keep only the first or final N keys of the range.
+        Pending write-behind writes are flushed first unless ``flush`` is False.
+        """
+        if not self.firebase_available or not user_id:
+            return OrderedDict()
+        ref = self._get_user_ref(user_id, path)
+        if not ref:
+            return OrderedDict()
+        if flush:
+            self.flush_writes()
+
+        query = ref.order_by_key()
+        if start is not None:
+            query = query.start_at(start)
+        if end is not None:
+            query = query.end_at(end)
+        if last is not None:
+            query = query.limit_to_last(last)
+        elif first is not None:
+            query = query.limit_to_first(first)
+        try:
+            data = self._call(query.get)
+        except StoreUnavailableError:
+            raise
+        except Exception:
+            return OrderedDict()
+        # Numeric keys can come back as a sparse list.
+        return OrderedDict(_as_item_map(data))
+
+    def child_keys(self, user_id: str, path: str) -> List[str]:
+        """Keys of the children at users/{user_id}/{path}, via a shallow read."""
+        if not self.firebase_available or not user_id:
+            return []
+        ref = self._get_user_ref(user_id, path)
+        if not ref:
+            return []
+        return list(_as_item_map(self._call(lambda: ref.get(shallow=True))))
+
+    def read_fresh(self, user_id: str, path: str) -> Any:
+        """Read users/{user_id}/{path} straight from Firebase, for jobs that write back what they read.
+
+        Skips the shared cache and the last-known-good fallback; errors propagate.
+        """
+        if not self.firebase_available or not user_id:
+            return None
+        ref = self._get_user_ref(user_id, path)
+        return self._call(ref.get) if ref else None
+
+    # Cross-user methods
+    def iter_user_id_pages(self, start_after: Optional[str] = None, page_size: int = 100) -> Iterator[List[str]]:
+        """Yield user IDs after ``start_after`` in key order, ``page_size`` at a time.
+
+        The users node is listed with a single shallow read, so a job walking
+        every user pays for the listing once. Errors propagate, so a failed
+        listing fails the job instead of ending it as if there were no users.
+        """
+        if not self.firebase_available:
+            return
+        users = self._call(lambda: get_firebase_db().reference('users').get(shallow=True))
+        user_ids = sorted(_as_item_map(users))
+        if start_after is not None:
+            user_ids = user_ids[bisect.bisect_right(user_ids, start_after):]
+        for start in range(0, len(user_ids), page_size):
+            yield user_ids[start:start + page_size]
+
+    def update_paths(self, updates: Dict[str, Any], journal: bool = True) -> bool:
+        """Apply a multi-path update relative to the database root.
+
+        ``journal=False`` skips change journal entries, for writes that only
+        move data without changing what clients see.
+        """
+        if not self.firebase_available or not updates:
+            return False
+
+        try:
+            if journal:
+                self._commit_updates(updates)
+            else:
+                self._call(lambda: get_firebase_db().reference('/').update(updates))
+                self._forget_reads(updates)
+                self._invalidate_shared(updates)
+            return True
+        except Exception:
+            return False
+
     # Transaction methods
     def save_transaction(self, user_id: str, transaction: Dict[str, Any]) -> Dict[str, Any]:
         """Save a transaction to Firebase for a specific user."""
@@ -39,49 +774,98 @@ class FirebaseDataStore:
             return transaction
             
         try:
-            ref = self._get_user_ref(user_id, 'transactions')
-            if ref:
-                ref.child(transaction['id']).set(transaction)
+            writes = self.transaction_writes(user_id, transaction)
+            if self.transaction_schema(user_id) == SCHEMA_PARTITIONED:
+                transaction_id = transaction['id']
+                previous = self._transaction_partition(user_id, transaction_id)
+                if previous and previous != partition_for(transaction):
+                    # The date moved it to another month.
+                    writes[f"transactions/{previous}/{transaction_id}"] = None
+                writes.setdefault(f"transactions/{transaction_id}", None)
+            self._write_many(user_id, writes)
+        except StoreUnavailableError:
+            raise
         except Exception as e:
             pass
         
         return transaction
     
-    def get_transactions(self, user_id: str) -> List[Dict[str, Any]]:
-        """Get all transactions from Firebase for a specific user."""
+    def get_transactions(
+        self,
+        user_id: str,
+        start_month: Optional[str] = None,
+        end_month: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Get transactions from Firebase for a specific user.
+
+        ``start_month``/``end_month`` (``YYYY-MM``, inclusive) limit the result
+        by transaction date; for partitioned users only those partitions are read.
+        """
         if not self.firebase_available or not user_id:
             return []
             
         try:
-            ref = self._get_user_ref(user_id, 'transactions')
-            if ref:
-                transactions_data = ref.get()
-                if transactions_data:
-                    if isinstance(transactions_data, dict):
-                        return list(transactions_data.values())
-                    elif isinstance(transactions_data, list):
-                        # Filter out None values from array indices
-                        return [t for t in transactions_data if t is not None]
+            ranged = start_month is not None or end_month is not None
+            if ranged and self.transaction_schema(user_id) == SCHEMA_PARTITIONED:
+                partitions = self.get_range(user_id, 'transactions', start=start_month, end=end_month)
+                items = flatten_transactions({k: v for k, v in partitions.items() if is_partition_key(k)})
+                return list(items.values())
+            items = self.get_collection(user_id, 'transactions')
+            if ranged:
+                return [
+                    t for t in items.values()
+                    if (start_month is None or partition_for(t) >= start_month)
+                    and (end_month is None or partition_for(t) <= end_month)
+                ]
+            return list(items.values())
+        except StoreUnavailableError:
+            raise
         except Exception as e:
             pass
         
         return []
     
+    def transaction_ids(self, user_id: str) -> List[str]:
+        """All transaction ids, without reading the transactions themselves.
+
+        Ids come from the partition index plus the keys of any flat items, so
+        the result is complete before, during and after a migration.
+        """
+        if not self.firebase_available or not user_id:
+            return []
+
+        try:
+            ids = set(self._collection_items(user_id, INDEX_PATH))
+            if self._get_write_behind() is not None:
+                # Shallow reads cannot see buffered writes.
+                ids.update(self.get_collection(user_id, 'transactions'))
+            else:
+                ids.update(key for key in self.child_keys(user_id, 'transactions') if not is_partition_key(key))
+            return sorted(ids)
+        except StoreUnavailableError:
+            raise
+        except Exception:
+            pass
+
+        return []
+
     def delete_transaction(self, user_id: str, transaction_id: str) -> bool:
         """Delete a transaction from Firebase for a specific user."""
+        return self.delete_one(user_id, 'transactions', transaction_id)
+
+    def get_collection(self, user_id: str, collection: str) -> Dict[str, Dict[str, Any]]:
+        """Read a whole collection as {id: item}, in either transaction layout."""
         if not self.firebase_available or not user_id:
-            return False
-            
+            return {}
         try:
-            ref = self._get_user_ref(user_id, f'transactions/{transaction_id}')
-            if ref:
-                ref.delete()
-                return True
-        except Exception as e:
-            pass
-        
-        return False
-    
+            if collection == 'transactions':
+                return flatten_transactions(self._read(user_id, collection))
+            return {k: v for k, v in self._collection_items(user_id, collection).items() if isinstance(v, dict)}
+        except StoreUnavailableError:
+            raise
+        except Exception:
+            return {}
+
     # Stock methods
     def save_stock(self, user_id: str, stock: Dict[str, Any]) -> Dict[str, Any]:
         """Save a stock position to Firebase for a specific user."""
@@ -89,9 +873,9 @@ class FirebaseDataStore:
             return stock
             
         try:
-            ref = self._get_user_ref(user_id, 'stocks')
-            if ref:
-                ref.child(stock['ticker']).set(stock)
+            self._write(user_id, f"stocks/{stock['ticker']}", stock)
+        except StoreUnavailableError:
+            raise
         except Exception as e:
             pass
         
@@ -103,11 +887,9 @@ class FirebaseDataStore:
             return []
             
         try:
-            ref = self._get_user_ref(user_id, 'stocks')
-            if ref:
-                stocks_data = ref.get()
-                if stocks_data and isinstance(stocks_data, dict):
-                    return list(stocks_data.values())
+            return list(self._collection_items(user_id, 'stocks').values())
+        except StoreUnavailableError:
+            raise
         except Exception as e:
             pass
         
@@ -115,19 +897,8 @@ class FirebaseDataStore:
     
     def delete_stock(self, user_id: str, ticker: str) -> bool:
         """Delete a stock position from Firebase for a specific user."""
-        if not self.firebase_available or not user_id:
-            return False
-            
-        try:
-            ref = self._get_user_ref(user_id, f'stocks/{ticker}')
-            if ref:
-                ref.delete()
-                return True
-        except Exception as e:
-            pass
-        
-        return False
-    
+        return self.delete_one(user_id, 'stocks', ticker)
+
     # Investment methods
     def save_investment(self, user_id: str, investment: Dict[str, Any]) -> Dict[str, Any]:
         """Save an investment to Firebase for a specific user."""
@@ -135,9 +906,9 @@ class FirebaseDataStore:
             return investment
             
         try:
-            ref = self._get_user_ref(user_id, 'investments')
-            if ref:
-                ref.child(investment['id']).set(investment)
+            self._write(user_id, f"investments/{investment['id']}", investment)
+        except StoreUnavailableError:
+            raise
         except Exception as e:
             pass
         
@@ -149,11 +920,9 @@ class FirebaseDataStore:
             return []
             
         try:
-            ref = self._get_user_ref(user_id, 'investments')
-            if ref:
-                investments_data = ref.get()
-                if investments_data and isinstance(investments_data, dict):
-                    return list(investments_data.values())
+            return list(self._collection_items(user_id, 'investments').values())
+        except StoreUnavailableError:
+            raise
         except Exception as e:
             pass
         
@@ -161,18 +930,7 @@ class FirebaseDataStore:
     
     def delete_investment(self, user_id: str, investment_id: str) -> bool:
         """Delete an investment from Firebase for a specific user."""
-        if not self.firebase_available or not user_id:
-            return False
-            
-        try:
-            ref = self._get_user_ref(user_id, f'investments/{investment_id}')
-            if ref:
-                ref.delete()
-                return True
-        except Exception as e:
-            pass
-        
-        return False
+        return self.delete_one(user_id, 'investments', investment_id)
 
     # Savings goal methods
     def save_savings_goal(self, user_id: str, goal: Dict[str, Any]) -> Dict[str, Any]:
@@ -180,9 +938,9 @@ class FirebaseDataStore:
         if not self.firebase_available or not user_id:
             return goal
         try:
-            ref = self._get_user_ref(user_id, 'savings_goals')
-            if ref:
-                ref.child(goal['id']).set(goal)
+            self._write(user_id, f"savings_goals/{goal['id']}", goal)
+        except StoreUnavailableError:
+            raise
         except Exception:
             pass
         return goal
@@ -192,27 +950,16 @@ class FirebaseDataStore:
         if not self.firebase_available or not user_id:
             return []
         try:
-            ref = self._get_user_ref(user_id, 'savings_goals')
-            if ref:
-                goals_data = ref.get()
-                if goals_data and isinstance(goals_data, dict):
-                    return list(goals_data.values())
+            return list(self._collection_items(user_id, 'savings_goals').values())
+        except StoreUnavailableError:
+            raise
         except Exception:
             pass
         return []
 
     def delete_savings_goal(self, user_id: str, goal_id: str) -> bool:
         """Remove a savings goal for a specific user."""
-        if not self.firebase_available or not user_id:
-            return False
-        try:
-            ref = self._get_user_ref(user_id, f'savings_goals/{goal_id}')
-            if ref:
-                ref.delete()
-                return True
-        except Exception:
-            pass
-        return False
+        return self.delete_one(user_id, 'savings_goals', goal_id)
 
 # Global instance using singleton pattern
 _firebase_store_instance = None
@@ -0,0 +1,243 @@
+"""Currency codes, FX rates and vectorized conversion to a reporting currency.
+
+Rates come from a provider (by default a local JSON file) as dated tables of
+"units of currency per one base unit"::
+
+    {"base": "USD", "rates": {"2026-10-01": {"EUR": 0.92, "GBP": 0.79}}}
+
+``RateStore`` caches them as a dense date x currency matrix, forward-filling
+currencies missing on a date from the latest earlier date. A conversion
+resolves every row's rate with array indexing into that matrix, so converting
+N amounts costs a handful of numpy operations rather than N lookups.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from services.firebase_db import get_firebase_store
+from services.local_state import read_json, state_path
+from services.warmup import register_cache_warmer
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+firebase_store = get_firebase_store()
+
+DEFAULT_CURRENCY = os.getenv("DEFAULT_CURRENCY", "USD").upper()
+FX_RATES_FILE = os.getenv("FX_RATES_FILE") or str(state_path("fx", "rates.json"))
+FX_RELOAD_SECONDS = float(os.getenv("FX_RELOAD_SECONDS", 60))
+
+_CURRENCY_RE = re.compile(r"^[A-Z]{3}$")
+
+
+def normalize_currency(code: Any) -> Optional[str]:
+    """Return an upper-case ISO 4217 style code, or None when ``code`` is empty.
+
+    Raises ValueError for anything that is not a three-letter code.
+    """
+    if code is None or code == "":
+        return None
+    value = str(code).strip().upper()
+    if not _CURRENCY_RE.match(value):
+        raise ValueError(f"Invalid currency code: {code}")
+    return value
+
+
+def record_currency(record: Dict[str, Any]) -> str:
+    """Currency of a stored record; records saved before currencies existed use the default."""
+    return str(record.get("currency") or DEFAULT_CURRENCY).upper()
+
+
+class LocalFileRateProvider:
+    """Reads dated rate tables from a JSON file."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+
+    def version(self) -> Optional[float]:
+        try:
+            return self.path.stat().st_mtime
+        except OSError:
+            return None
+
+    def load(self) -> Tuple[str, Dict[str, Dict[str, float]]]:
+        """Return (base currency, {YYYY-MM-DD: {currency: rate}})."""
+        data = read_json(self.path, default={}) or {}
+        base = str(data.get("base") or DEFAULT_CURRENCY).upper()
+        tables = data.get("rates") or {}
+        rates: Dict[str, Dict[str, float]] = {}
+        for day, table in tables.items():
+            if isinstance(table, dict):
+                rates[str(day)[:10]] = {
+                    str(code).upper(): float(rate) for code, rate in table.items() if rate
+                }
+        return base, rates
+
+
+class RateStore:
+    """Dated FX rate cache with vectorized conversion."""
+
+    def __init__(self, provider: LocalFileRateProvider):
+        self.provider = provider
+        self._lock = threading.Lock()
+        self._checked_at: Optional[float] = None
+        self._version: Optional[float] = None
+        self._base = DEFAULT_CURRENCY
+        # Built on first use so importing this module does not load numpy.
+        self._dates: Optional[np.ndarray] = None
+        self._columns: Dict[str, int] = {DEFAULT_CURRENCY: 0}
+        self._matrix: Optional[np.ndarray] = None
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if self._matrix is not None and self._checked_at is not None and now - self._checked_at < FX_RELOAD_SECONDS:
+            return
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < FX_RELOAD_SECONDS:
+                return
+            self._checked_at = now
+            version = self.provider.version()
+            if version == self._version and self._matrix is not None:
+                return
+            try:
+                base, rates = self.provider.load()
+            except Exception as exc:
+                logger.warning("Could not load FX rates: %s", exc)
+                if self._matrix is None:
+                    self._build(DEFAULT_CURRENCY, {})
+                return
+            self._build(base, rates)
+            self._version = version
+
+    def _build(self, base: str, rates: Dict[str, Dict[str, float]]) -> None:
+        import numpy as np
+
+        dates = sorted(rates)
+        codes = sorted({base, *(code for table in rates.values() for code in table)})
+        columns = {code: index for index, code in enumerate(codes)}
+        matrix = np.full((max(len(dates), 1), len(codes)), np.nan)
+        for row, day in enumerate(dates):
+            for code, rate in rates[day].items():
+                matrix[row, columns[code]] = rate
+            if row:
+                # Forward-fill currencies not quoted on this date.
+                gaps = np.isnan(matrix[row])
+                matrix[row, gaps] = matrix[row - 1, gaps]
+        matrix[:, columns[base]] = 1.0
+        self._base = base
+        self._dates = np.array(dates, dtype="U10")
+        self._columns = columns
+        self._matrix = matrix
+
+    def currencies(self) -> List[str]:
+        self._refresh()
+        return sorted(self._columns)
+
+    def convert(
+        self,
+        amounts: Sequence[float],
+        currencies: Sequence[str],
+        to_currency: str,
+        dates: Optional[Sequence[str]] = None,
+    ) -> Tuple[np.ndarray, List[str]]:
+        """Convert amounts to ``to_currency`` at each row's date (latest rates when omitted).
+
+        Returns (converted amounts, currencies that had no rate). Rows without a
+        rate keep their original amount. Dates before the first table use the
+        earliest rates available.
+        """
+        import numpy as np
+
+        self._refresh()
+        values = np.asarray(amounts, dtype=float)
+        if values.size == 0:
+            return values, []
+        matrix, columns, known_dates = self._matrix, self._columns, self._dates
+
+        codes, inverse = np.unique(np.asarray(currencies, dtype="U3"), return_inverse=True)
+        row_codes = codes[inverse]
+        row_columns = np.array([columns.get(code, -1) for code in codes])[inverse]
+
+        if dates is None or known_dates.size == 0:
+            rows = np.full(values.shape, matrix.shape[0] - 1)
+        else:
+            query = np.asarray([str(day)[:10] for day in dates], dtype="U10")
+            rows = np.clip(np.searchsorted(known_dates, query, side="right") - 1, 0, None)
+
+        # Unknown currencies index the trailing NaN column.
+        padded = np.concatenate([matrix, np.full((matrix.shape[0], 1), np.nan)], axis=1)
+        to_column = columns.get(to_currency, -1)
+        converted = values * padded[rows, to_column] / padded[rows, row_columns]
+
+        same = row_codes == to_currency
+        converted[same] = values[same]
+        missing_rows = np.isnan(converted)
+        converted[missing_rows] = values[missing_rows]
+        missing = set(row_codes[missing_rows].tolist())
+        if missing and to_column < 0:
+            missing.add(to_currency)
+        return converted, sorted(missing)
+
+    def convert_one(self, amount: float, currency: str, to_currency: str, day: Optional[str] = None) -> float:
+        converted, _ = self.convert([amount], [currency], to_currency, [day] if day else None)
+        return float(converted[0])
+
+    def warm(self) -> None:
+        """Load the rate table (and numpy) and run one dated conversion."""
+        self.convert([1.0], [DEFAULT_CURRENCY], DEFAULT_CURRENCY, ["1970-01-01"])
+
+
+rate_store = RateStore(LocalFileRateProvider(FX_RATES_FILE))
+# Worker warmup loads the table so the first dashboard request does not.
+register_cache_warmer("fx_rates", rate_store.warm)
+
+
+def convert_records(
+    records: Iterable[Dict[str, Any]],
+    field: str,
+    to_currency: str,
+    date_field: Optional[str] = None,
+) -> Tuple[np.ndarray, List[str]]:
+    """Convert ``field`` of every record in one batch; see ``RateStore.convert``."""
+    records = list(records)
+    return rate_store.convert(
+        [float(record.get(field) or 0.0) for record in records],
+        [record_currency(record) for record in records],
+        to_currency,
+        [str(record.get(date_field) or "") for record in records] if date_field else None,
+    )
+
+
+def get_reporting_currency(user_id: Optional[str]) -> str:
+    """The user's reporting currency (``settings/reporting_currency``).
+
+    Cached in the shared cache until the user's next write, so a change made
+    through any worker is seen by all of them.
+    """
+    if not user_id:
+        return DEFAULT_CURRENCY
+
+    def read() -> str:
+        value = firebase_store.get_value(user_id, "settings/reporting_currency")
+        try:
+            return normalize_currency(value) or DEFAULT_CURRENCY
+        except ValueError:
+            return DEFAULT_CURRENCY
+
+    return firebase_store.cached_aggregate(user_id, "reporting_currency", read)
+
+
+def set_reporting_currency(user_id: str, currency: str) -> str:
+    code = normalize_currency(currency)
+    if code is None:
+        raise ValueError("reporting_currency is required")
+    firebase_store.set_value(user_id, "settings/reporting_currency", code)
+    return code
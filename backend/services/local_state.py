@@ -0,0 +1,38 @@
+"""Local on-disk state (checkpoints, journals, caches) for background jobs."""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+STATE_DIR = Path(
+    os.getenv("CASHTRACK_STATE_DIR", Path(__file__).resolve().parent.parent / "var")
+)
+
+
+def state_path(*parts: str) -> Path:
+    """Return a path under the state directory, creating parent folders."""
+    path = STATE_DIR.joinpath(*parts)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def read_json(path: Path, default: Any = None) -> Any:
+    """Read a JSON file, returning ``default`` when missing or unreadable."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json_atomic(path: Path, data: Any) -> None:
+    """Write JSON via a temp file and rename so readers never see partial data."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
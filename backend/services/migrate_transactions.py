@@ -0,0 +1,264 @@
+"""Online migration of users' transactions to the month-partitioned layout.
+
+Run with ``python -m services.migrate_transactions``. For each user, flat
+items are moved to ``transactions/{YYYY-MM}/{id}`` (with their index entry)
+in batched multi-path updates that also delete the flat copy, then the
+``transaction_schema`` marker is set. The API keeps serving throughout:
+reads understand a half-moved node and single-item lookups check the index
+in either layout.
+
+Two races are closed afterwards. Workers trust a cached marker for up to
+``TRANSACTION_SCHEMA_TTL`` seconds and may still write flat items, so each
+user is swept again once that has passed. A delete that lands between a
+batch's read and its commit would be undone by the move, so journaled
+deletes since the user's migration began are re-applied after each pass.
+
+Progress is checkpointed under ``CASHTRACK_STATE_DIR``; rerunning resumes.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.change_journal import CHANGES_PATH, SEQ_PATH, key_seq, seq_key
+from services.firebase_db import CALL_DEADLINE_SECONDS, TRANSACTION_SCHEMA_TTL, get_firebase_store
+from services.local_state import read_json, state_path, write_json_atomic
+from services.transaction_partitions import (
+    INDEX_PATH,
+    SCHEMA_PARTITIONED,
+    SCHEMA_PATH,
+    is_partition_key,
+    partition_for,
+)
+
+logger = logging.getLogger(__name__)
+
+firebase_store = get_firebase_store()
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_BATCH_SIZE = 250
+DEFAULT_SWEEP_DELAY = TRANSACTION_SCHEMA_TTL + CALL_DEADLINE_SECONDS
+
+
+def _key_order(key: str) -> Tuple[int, Any]:
+    """RTDB key order: 32-bit integer keys numerically, then strings."""
+    if key.isdigit() and (key == "0" or not key.startswith("0")) and int(key) < 2 ** 31:
+        return 0, int(key)
+    return 1, key
+
+
+def _flat_runs(keys: List[str], batch_size: int) -> List[List[str]]:
+    """Split flat keys into batches that are contiguous in key order.
+
+    Partition keys break runs, so each batch can be read with one range
+    query without pulling in whole partitions.
+    """
+    runs: List[List[str]] = []
+    current: List[str] = []
+    for key in sorted(keys, key=_key_order):
+        if is_partition_key(key) or len(current) >= batch_size:
+            if current:
+                runs.append(current)
+            current = []
+        if not is_partition_key(key):
+            current.append(key)
+    if current:
+        runs.append(current)
+    return runs
+
+
+def move_flat_transactions(user_id: str, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Move a user's flat transactions into partitions, returning how many moved."""
+    prefix = f"users/{user_id}"
+    moved = 0
+    skipped: set = set()
+    while True:
+        keys = [k for k in firebase_store.child_keys(user_id, "transactions") if k not in skipped]
+        runs = _flat_runs(keys, batch_size)
+        if not runs:
+            _check_skipped(user_id, skipped)
+            return moved
+        for run in runs:
+            wanted = set(run)
+            items = firebase_store.get_range(user_id, "transactions", start=run[0], end=run[-1])
+            updates: Dict[str, Any] = {}
+            for item_id, item in items.items():
+                if item_id not in wanted:
+                    continue
+                if not isinstance(item, dict):
+                    # Not a transaction; leave it for someone to look at.
+                    logger.warning("Skipping malformed transaction %s/%s", user_id, item_id)
+                    skipped.add(item_id)
+                    continue
+                partition = partition_for(item)
+                updates[f"{prefix}/transactions/{partition}/{item_id}"] = item
+                updates[f"{prefix}/{INDEX_PATH}/{item_id}"] = partition
+                updates[f"{prefix}/transactions/{item_id}"] = None
+            skipped.update(wanted - set(items))
+            if not updates:
+                continue
+            # Ids and contents are unchanged, so clients need no change events.
+            if not firebase_store.update_paths(updates, journal=False):
+                raise RuntimeError(f"Failed to move transactions for {user_id}")
+            moved += len(updates) // 3
+
+
+def _check_skipped(user_id: str, skipped: set) -> None:
+    """Fail when a skipped id is still a flat transaction, so the user is not marked partitioned."""
+    stranded = sorted(
+        item_id for item_id in skipped
+        if isinstance(firebase_store.read_fresh(user_id, f"transactions/{item_id}"), dict)
+    )
+    if stranded:
+        raise RuntimeError(f"Could not move {len(stranded)} transactions for {user_id}: {', '.join(stranded[:10])}")
+
+
+def reapply_deletes(user_id: str, since_seq: int) -> int:
+    """Remove partitioned copies of transactions deleted after ``since_seq``."""
+    latest: Dict[str, str] = {}
+    start = since_seq + 1
+    while True:
+        entries = firebase_store.get_range(user_id, CHANGES_PATH, start=seq_key(start), first=1000)
+        for key, entry in entries.items():
+            if isinstance(entry, dict) and entry.get("collection") == "transactions":
+                latest[str(entry.get("id"))] = entry.get("op")
+        if len(entries) < 1000:
+            break
+        start = key_seq(list(entries)[-1]) + 1
+
+    prefix = f"users/{user_id}"
+    updates: Dict[str, Any] = {}
+    for item_id, op in latest.items():
+        if op != "delete":
+            continue
+        partition = firebase_store.get_value(user_id, f"{INDEX_PATH}/{item_id}")
+        if is_partition_key(partition):
+            updates[f"{prefix}/transactions/{partition}/{item_id}"] = None
+            updates[f"{prefix}/{INDEX_PATH}/{item_id}"] = None
+    if updates and not firebase_store.update_paths(updates, journal=False):
+        raise RuntimeError(f"Failed to re-apply deletes for {user_id}")
+    return len(updates) // 2
+
+
+def migrate_user(user_id: str, since_seq: int, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Move a user's transactions and mark them partitioned; safe to repeat."""
+    moved = move_flat_transactions(user_id, batch_size)
+    if not firebase_store.update_paths({f"users/{user_id}/{SCHEMA_PATH}": SCHEMA_PARTITIONED}, journal=False):
+        raise RuntimeError(f"Failed to mark {user_id} as partitioned")
+    reapply_deletes(user_id, since_seq)
+    return moved
+
+
+def sweep_user(user_id: str, since_seq: int, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Move flat items written by workers that had not yet seen the marker."""
+    moved = move_flat_transactions(user_id, batch_size)
+    reapply_deletes(user_id, since_seq)
+    return moved
+
+
+def _sweep_due(state: Dict[str, Any], checkpoint_path: Path, batch_size: int, sweep_delay: float, wait: bool) -> None:
+    while state["pending_sweeps"]:
+        sweep = state["pending_sweeps"][0]
+        remaining = sweep["marked_at"] + sweep_delay - time.time()
+        if remaining > 0:
+            if not wait:
+                return
+            time.sleep(remaining)
+        state["items_moved"] += sweep_user(sweep["user_id"], sweep["since_seq"], batch_size)
+        state["pending_sweeps"].pop(0)
+        write_json_atomic(checkpoint_path, state)
+
+
+def run_migration(
+    checkpoint_path: Optional[Path] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    sweep_delay: float = DEFAULT_SWEEP_DELAY,
+    restart: bool = False,
+) -> Dict[str, Any]:
+    """Migrate every user to the partitioned layout, resuming from the checkpoint."""
+    if not firebase_store.firebase_available:
+        raise RuntimeError("Firebase store is not available")
+
+    checkpoint_path = checkpoint_path or state_path("migrations", "transactions.json")
+    state = None if restart else read_json(checkpoint_path)
+    if not state or state.get("completed"):
+        state = {
+            "run_id": uuid.uuid4().hex,
+            "cursor": None,
+            "current": None,
+            "pending_sweeps": [],
+            "users_migrated": 0,
+            "items_moved": 0,
+            "completed": False,
+            "started_at": datetime.utcnow().isoformat() + "Z",
+        }
+    else:
+        logger.info("Resuming migration %s after %s", state["run_id"], state["cursor"])
+
+    for user_ids in firebase_store.iter_user_id_pages(start_after=state["cursor"], page_size=page_size):
+        for user_id in user_ids:
+            current = state["current"]
+            resuming = bool(current) and current["user_id"] == user_id
+            if not resuming and firebase_store.get_value(user_id, SCHEMA_PATH) == SCHEMA_PARTITIONED:
+                continue
+            if not resuming:
+                # Recorded before any move so a resumed run re-checks the same deletes.
+                current = {"user_id": user_id, "since_seq": int(firebase_store.get_value(user_id, SEQ_PATH) or 0)}
+                state["current"] = current
+                write_json_atomic(checkpoint_path, state)
+
+            state["items_moved"] += migrate_user(user_id, current["since_seq"], batch_size)
+            state["users_migrated"] += 1
+            state["pending_sweeps"].append({**current, "marked_at": time.time()})
+            state["current"] = None
+            write_json_atomic(checkpoint_path, state)
+            _sweep_due(state, checkpoint_path, batch_size, sweep_delay, wait=False)
+
+        state["cursor"] = user_ids[-1]
+        write_json_atomic(checkpoint_path, state)
+
+    _sweep_due(state, checkpoint_path, batch_size, sweep_delay, wait=True)
+    state["completed"] = True
+    state["finished_at"] = datetime.utcnow().isoformat() + "Z"
+    write_json_atomic(checkpoint_path, state)
+    return state
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Move transactions to the month-partitioned layout.")
+    parser.add_argument("--checkpoint", type=Path, default=None)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Users listed per page")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Transactions moved per update")
+    parser.add_argument(
+        "--sweep-delay",
+        type=float,
+        default=DEFAULT_SWEEP_DELAY,
+        help="Seconds to wait before re-sweeping a migrated user",
+    )
+    parser.add_argument("--restart", action="store_true", help="Ignore any saved checkpoint")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    result = run_migration(
+        checkpoint_path=args.checkpoint,
+        page_size=args.page_size,
+        batch_size=args.batch_size,
+        sweep_delay=args.sweep_delay,
+        restart=args.restart,
+    )
+    logger.info(
+        "Migration %s done: %d users, %d transactions moved",
+        result["run_id"],
+        result["users_migrated"],
+        result["items_moved"],
+    )
+
+
+if __name__ == "__main__":
+    main()
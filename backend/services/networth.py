@@ -0,0 +1,279 @@
+"""Daily net-worth snapshots at ``users/{uid}/networth/{YYYY-MM-DD}``.
+
+A snapshot stores cumulative income and expenses plus holding values, with
+the derived savings, liabilities, assets and net worth (same formulas as the
+dashboard overview), all in the user's reporting currency.
+
+Snapshots are kept current incrementally, off the request path: a
+transaction change queues its converted amount, and a background thread
+applies the user's queued changes to today's snapshot (seeded from the latest
+earlier one) in one RTDB transaction. A holding change re-totals the small
+stock and investment collections. The nightly job
+(``python -m services.networth``) writes a fully recomputed snapshot for every
+user so prices revalued outside the API are captured, changes still queued
+when a worker stopped are included, and days without activity still get a
+point.
+
+Each snapshot records the cumulative totals as they were known that day. A
+back-dated transaction is counted from the day it is entered onward; the
+snapshots of earlier days are not rewritten.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import math
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.archive import get_archive_totals
+from services.firebase_db import get_firebase_store
+from services.fx import convert_records, get_reporting_currency, rate_store, record_currency
+from services.local_state import read_json, state_path, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+firebase_store = get_firebase_store()
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_HISTORY_POINTS = 365
+MAX_HISTORY_POINTS = 2000
+NETWORTH_UPDATE_WORKERS = int(os.getenv("NETWORTH_UPDATE_WORKERS", 2))
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+# user_id => (summed field deltas, whether holdings need re-totalling)
+_queued: Dict[str, Tuple[Dict[str, float], bool]] = {}
+
+
+def _today() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def _derive(base: Dict[str, Any], day: str, currency: str) -> Dict[str, Any]:
+    """Build a snapshot from cumulative totals, deriving the overview figures."""
+    income = float(base.get("income", 0.0))
+    expenses = float(base.get("expenses", 0.0))
+    stock_value = float(base.get("stock_value", 0.0))
+    investment_value = float(base.get("investment_value", 0.0))
+    savings = max(income - expenses, 0.0)
+    return {
+        "date": day,
+        "currency": currency,
+        "income": round(income, 2),
+        "expenses": round(expenses, 2),
+        "savings": round(savings, 2),
+        "liabilities": round(max(expenses - income, 0.0), 2),
+        "stock_value": round(stock_value, 2),
+        "investment_value": round(investment_value, 2),
+        "assets": round(stock_value + investment_value + savings, 2),
+        "net_worth": round(stock_value + investment_value + savings, 2),
+    }
+
+
+def _holdings(user_id: str, currency: str) -> Tuple[float, float]:
+    stocks = [
+        {**stock, "value": float(stock.get("quantity", 0)) * float(stock.get("current_price", 0))}
+        for stock in firebase_store.get_stocks(user_id)
+    ]
+    stock_values, _ = convert_records(stocks, "value", currency)
+    investment_values, _ = convert_records(firebase_store.get_investments(user_id), "current_value", currency)
+    return float(stock_values.sum()), float(investment_values.sum())
+
+
+def compute_snapshot(user_id: str, day: Optional[str] = None) -> Dict[str, Any]:
+    """Compute a user's snapshot from all of their data."""
+    currency = get_reporting_currency(user_id)
+    transactions = firebase_store.get_transactions(user_id)
+    amounts, _ = convert_records(transactions, "amount", currency, date_field="date")
+    income = sum(abs(a) for t, a in zip(transactions, amounts.tolist()) if t.get("type") == "income")
+    expenses = sum(abs(a) for t, a in zip(transactions, amounts.tolist()) if t.get("type") == "expense")
+    for totals in get_archive_totals(user_id, currency).values():
+        income += float(totals.get("income", 0.0))
+        expenses += float(totals.get("expenses", 0.0))
+    stock_value, investment_value = _holdings(user_id, currency)
+    return _derive(
+        {"income": income, "expenses": expenses, "stock_value": stock_value, "investment_value": investment_value},
+        day or _today(),
+        currency,
+    )
+
+
+def _apply_change(user_id: str, change: Dict[str, float], holdings: bool = False) -> None:
+    day = _today()
+    currency = get_reporting_currency(user_id)
+    # Not flushing: a write-behind flush here would push every user's buffered writes.
+    latest = firebase_store.get_range(user_id, "networth", end=day, last=1, flush=False)
+    seed = next(iter(latest.values()), None)
+    if not isinstance(seed, dict) or seed.get("currency") != currency:
+        # No usable history yet; the full computation already includes the change.
+        firebase_store.set_value(user_id, f"networth/{day}", compute_snapshot(user_id, day))
+        return
+
+    values = _holdings(user_id, currency) if holdings else None
+
+    def apply(current):
+        base = dict(current if isinstance(current, dict) and current.get("currency") == currency else seed)
+        for field, delta in change.items():
+            base[field] = float(base.get(field, 0.0)) + delta
+        if values is not None:
+            base["stock_value"], base["investment_value"] = values
+        return _derive(base, day, currency)
+
+    firebase_store.transact_value(user_id, f"networth/{day}", apply)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Return the snapshot update executor, recreating it after a fork."""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=NETWORTH_UPDATE_WORKERS, thread_name_prefix="networth")
+        _executor_pid = os.getpid()
+        _queued.clear()
+    return _executor
+
+
+def _run_queued(user_id: str) -> None:
+    with _lock:
+        change, holdings = _queued.pop(user_id, ({}, False))
+    try:
+        _apply_change(user_id, change, holdings=holdings)
+    except Exception as exc:
+        logger.warning("Net-worth snapshot update failed for %s: %s", user_id, exc)
+
+
+def _queue_change(user_id: str, change: Dict[str, float], holdings: bool = False) -> None:
+    """Merge a change into the user's queued update, scheduling one if none is waiting."""
+    with _lock:
+        executor = _get_executor()
+        waiting = user_id in _queued
+        fields, refresh = _queued.get(user_id, ({}, False))
+        for field, delta in change.items():
+            fields[field] = fields.get(field, 0.0) + delta
+        _queued[user_id] = (fields, refresh or holdings)
+        if waiting:
+            return
+        try:
+            executor.submit(_run_queued, user_id)
+        except RuntimeError:
+            # Shutting down; the nightly recompute covers it.
+            _queued.pop(user_id, None)
+
+
+def record_transaction(user_id: str, transaction: Dict[str, Any], sign: int = 1) -> None:
+    """Queue an added (sign=1) or deleted (sign=-1) transaction for today's snapshot."""
+    field = {"income": "income", "expense": "expenses"}.get(transaction.get("type"))
+    if not user_id or field is None:
+        return
+    try:
+        amount = abs(rate_store.convert_one(
+            float(transaction.get("amount", 0.0)),
+            record_currency(transaction),
+            get_reporting_currency(user_id),
+            str(transaction.get("date") or ""),
+        ))
+        _queue_change(user_id, {field: sign * amount})
+    except Exception as exc:
+        logger.warning("Net-worth snapshot update failed for %s: %s", user_id, exc)
+
+
+def record_holdings(user_id: str) -> None:
+    """Queue a re-total of stock and investment values in today's snapshot after a holding changes."""
+    if not user_id:
+        return
+    _queue_change(user_id, {}, holdings=True)
+
+
+def _downsample(points: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """Keep the last snapshot of each of ``limit`` equal-width buckets."""
+    if len(points) <= limit:
+        return points
+    size = math.ceil(len(points) / limit)
+    return [points[min(start + size, len(points)) - 1] for start in range(0, len(points), size)]
+
+
+def get_history(
+    user_id: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    points: int = DEFAULT_HISTORY_POINTS,
+) -> Dict[str, Any]:
+    """Return snapshots between ``start`` and ``end`` (inclusive), downsampled to ``points``."""
+    points = min(max(points, 1), MAX_HISTORY_POINTS)
+    snapshots = [
+        {**value, "date": key}
+        for key, value in firebase_store.get_range(user_id, "networth", start=start, end=end).items()
+        if isinstance(value, dict)
+    ]
+    series = _downsample(snapshots, points)
+    return {
+        "currency": get_reporting_currency(user_id),
+        "start": start,
+        "end": end,
+        "total_points": len(snapshots),
+        "downsampled": len(series) < len(snapshots),
+        "points": series,
+    }
+
+
+def run_snapshots(
+    checkpoint_path: Path | None = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    restart: bool = False,
+) -> Dict[str, Any]:
+    """Write today's fully computed snapshot for every user, resuming from the checkpoint."""
+    if not firebase_store.firebase_available:
+        raise RuntimeError("Firebase store is not available")
+
+    day = _today()
+    checkpoint_path = checkpoint_path or state_path("networth", "checkpoint.json")
+    state = None if restart else read_json(checkpoint_path)
+    if not state or state.get("completed") or state.get("date") != day:
+        state = {
+            "run_id": uuid.uuid4().hex,
+            "date": day,
+            "cursor": None,
+            "users_processed": 0,
+            "completed": False,
+            "started_at": datetime.utcnow().isoformat() + "Z",
+        }
+    else:
+        logger.info("Resuming snapshot run %s after %s", state["run_id"], state["cursor"])
+
+    for user_ids in firebase_store.iter_user_id_pages(start_after=state["cursor"], page_size=page_size):
+        updates = {
+            f"users/{user_id}/networth/{day}": compute_snapshot(user_id, day) for user_id in user_ids
+        }
+        if not firebase_store.update_paths(updates):
+            raise RuntimeError("Failed to commit net-worth snapshots")
+
+        state["cursor"] = user_ids[-1]
+        state["users_processed"] += len(user_ids)
+        write_json_atomic(checkpoint_path, state)
+
+    state["completed"] = True
+    state["finished_at"] = datetime.utcnow().isoformat() + "Z"
+    write_json_atomic(checkpoint_path, state)
+    return state
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Write today's net-worth snapshot for all users.")
+    parser.add_argument("--checkpoint", type=Path, default=None)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--restart", action="store_true", help="Ignore any saved checkpoint")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    result = run_snapshots(checkpoint_path=args.checkpoint, page_size=args.page_size, restart=args.restart)
+    logger.info("Snapshot run %s done: %d users", result["run_id"], result["users_processed"])
+
+
+if __name__ == "__main__":
+    main()
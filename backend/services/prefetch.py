@@ -0,0 +1,157 @@
+"""Warm a user's data into the shared cache right after login.
+
+The dashboard load follows login within seconds, so ``schedule_prefetch``
+queues a background job that reads the user's collection snapshots and
+builds the overview totals, leaving both in the shared cache (see
+``services.shared_cache``) for the first render.
+
+Jobs are bounded: at most ``PREFETCH_MAX_PENDING`` are queued or running per
+worker, each gets ``PREFETCH_BUDGET_SECONDS``, and one that waited longer
+than ``PREFETCH_MAX_DELAY_SECONDS`` is dropped because the dashboard has
+already loaded. A user already being prefetched, or prefetched within
+``PREFETCH_MIN_INTERVAL`` seconds, is skipped. ``cancel_prefetch`` and
+``cancel_all`` stop jobs between steps.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import Flask, g
+
+from services.firebase_db import SHARED_CACHE_PATHS, get_firebase_store
+from services.shared_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+firebase_store = get_firebase_store()
+
+PREFETCH_ENABLED = os.getenv("LOGIN_PREFETCH", "1").lower() not in ("0", "false", "no")
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", 2))
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", 32))
+PREFETCH_BUDGET_SECONDS = float(os.getenv("PREFETCH_BUDGET_SECONDS", 10))
+PREFETCH_MAX_DELAY_SECONDS = float(os.getenv("PREFETCH_MAX_DELAY_SECONDS", 5))
+PREFETCH_MIN_INTERVAL = float(os.getenv("PREFETCH_MIN_INTERVAL", 60))
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_jobs: Dict[str, Tuple[Future, threading.Event]] = {}
+_last_prefetched: Dict[str, float] = {}
+_stats = {"scheduled": 0, "completed": 0, "skipped": 0, "dropped": 0, "cancelled": 0, "errors": 0}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Return the prefetch executor, recreating it after a fork."""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        _executor_pid = os.getpid()
+        _jobs.clear()
+    return _executor
+
+
+def _count(stat: str) -> None:
+    with _lock:
+        _stats[stat] += 1
+
+
+def _steps(app: Flask, uid: str) -> List[Tuple[str, Callable[[], Any]]]:
+    from services.data_store import dashboard_overview
+
+    def overview() -> None:
+        with app.app_context():
+            g.current_user = {"uid": uid}
+            dashboard_overview()
+
+    nodes = set(firebase_store.child_keys(uid, ""))
+    steps: List[Tuple[str, Callable[[], Any]]] = [
+        (path, lambda path=path: firebase_store.get_value(uid, path))
+        for path in sorted(SHARED_CACHE_PATHS & nodes)
+    ]
+    steps.append(("overview", overview))
+    return steps
+
+
+def _prefetch(app: Flask, uid: str, cancelled: threading.Event, queued_at: float) -> None:
+    try:
+        started = time.monotonic()
+        if started - queued_at > PREFETCH_MAX_DELAY_SECONDS:
+            _count("dropped")
+            return
+        for name, step in _steps(app, uid):
+            if cancelled.is_set():
+                _count("cancelled")
+                return
+            if time.monotonic() - started > PREFETCH_BUDGET_SECONDS:
+                logger.info("Prefetch for %s stopped at %s: over budget", uid, name)
+                _count("dropped")
+                return
+            step()
+        with _lock:
+            _last_prefetched[uid] = time.monotonic()
+        _count("completed")
+    except Exception as exc:
+        # A failed prefetch only means a cold first load.
+        logger.warning("Prefetch for %s failed: %s", uid, exc)
+        _count("errors")
+    finally:
+        with _lock:
+            if _jobs.get(uid, (None, None))[1] is cancelled:
+                del _jobs[uid]
+
+
+def schedule_prefetch(app: Flask, uid: str) -> bool:
+    """Queue a prefetch of ``uid``'s data; returns True if one was queued."""
+    if not PREFETCH_ENABLED or shared_cache is None or not firebase_store.firebase_available:
+        return False
+    now = time.monotonic()
+    with _lock:
+        executor = _get_executor()
+        last = _last_prefetched.get(uid)
+        if uid in _jobs or (last is not None and now - last < PREFETCH_MIN_INTERVAL):
+            _stats["skipped"] += 1
+            return False
+        if len(_jobs) >= PREFETCH_MAX_PENDING:
+            _stats["dropped"] += 1
+            return False
+        cancelled = threading.Event()
+        try:
+            future = executor.submit(_prefetch, app, uid, cancelled, now)
+        except RuntimeError:
+            return False
+        _jobs[uid] = (future, cancelled)
+        _stats["scheduled"] += 1
+        if len(_last_prefetched) > 10000:
+            _last_prefetched.clear()
+    return True
+
+
+def cancel_prefetch(uid: str) -> bool:
+    """Stop ``uid``'s prefetch before its next step; returns True if one was running or queued."""
+    with _lock:
+        job = _jobs.pop(uid, None)
+    if job is None:
+        return False
+    future, cancelled = job
+    cancelled.set()
+    if future.cancel():
+        _count("cancelled")
+    return True
+
+
+def cancel_all() -> None:
+    """Cancel every queued and running prefetch in this process."""
+    with _lock:
+        uids = list(_jobs)
+    for uid in uids:
+        cancel_prefetch(uid)
+
+
+def prefetch_stats() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, "pending": len(_jobs)}
@@ -0,0 +1,167 @@
+"""Append-only price history per ticker, with downsampled range reads.
+
+Each ticker has one file under ``CASHTRACK_STATE_DIR/prices`` holding
+fixed-size little-endian records of (epoch seconds ``int64``, price
+``float64``) in time order. Reads memory-map the file, find the range with a
+binary search and downsample it with Largest-Triangle-Three-Buckets, so a
+multi-year chart is a few hundred points whatever the history length.
+
+Prices are recorded from trusted sources only: the reference price used by
+``add_stock`` and the unit prices of a revaluation run. A point older than the
+last one is skipped, as is one repeating the last price on the same day.
+"""
+from __future__ import annotations
+
+import fcntl
+import math
+import os
+import re
+import struct
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from services.local_state import state_path
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Appends use ``struct`` so recording a price never loads numpy.
+RECORD_FORMAT = struct.Struct("<qd")
+RECORD_SIZE = RECORD_FORMAT.size
+_TICKER = re.compile(r"^[A-Z0-9][A-Z0-9.\-^=]{0,19}$")
+DEFAULT_POINTS = 300
+MAX_POINTS = 5000
+
+
+def normalize_ticker(ticker: str) -> str:
+    """Upper-cased ticker, or ValueError when it is not a plain symbol."""
+    symbol = str(ticker or "").strip().upper()
+    if not _TICKER.match(symbol):
+        raise ValueError(f"Invalid ticker: {ticker!r}")
+    return symbol
+
+
+def history_path(ticker: str) -> Path:
+    return state_path("prices", f"{normalize_ticker(ticker)}.bin")
+
+
+def _epoch(moment: datetime) -> int:
+    """Epoch seconds; naive datetimes are taken as UTC."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+@lru_cache(maxsize=None)
+def _record_dtype() -> np.dtype:
+    import numpy as np
+
+    return np.dtype([("t", "<i8"), ("p", "<f8")])
+
+
+def _records(path: Path) -> np.ndarray:
+    """All complete records in ``path`` as a read-only memory map (or empty)."""
+    import numpy as np
+
+    try:
+        count = os.path.getsize(path) // RECORD_SIZE
+    except OSError:
+        count = 0
+    if count == 0:
+        return np.empty(0, dtype=_record_dtype())
+    # A record torn by a crash mid-append is ignored.
+    return np.memmap(path, dtype=_record_dtype(), mode="r", shape=(count,))
+
+
+def record_price(ticker: str, price: float, at: Optional[datetime] = None) -> bool:
+    """Append a price point; returns False when it was skipped."""
+    price = float(price)
+    if not math.isfinite(price) or price <= 0:
+        return False
+    timestamp = _epoch(at or datetime.now(timezone.utc))
+    path = history_path(ticker)
+    with open(path, "ab") as handle:
+        # Appends from every worker and job on the host are serialised.
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            size = os.fstat(handle.fileno()).st_size
+            if size % RECORD_SIZE:
+                handle.truncate(size - size % RECORD_SIZE)
+                size -= size % RECORD_SIZE
+            if size:
+                with open(path, "rb") as reader:
+                    reader.seek(size - RECORD_SIZE)
+                    last_time, last_price = RECORD_FORMAT.unpack(reader.read(RECORD_SIZE))
+                if timestamp < last_time:
+                    return False
+                if price == last_price and timestamp // 86400 == last_time // 86400:
+                    return False
+            handle.write(RECORD_FORMAT.pack(timestamp, price))
+            handle.flush()
+            return True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def record_prices(prices: Dict[str, float], at: Optional[datetime] = None) -> int:
+    """Record every entry whose key is a valid ticker; returns how many were appended."""
+    appended = 0
+    for name, price in prices.items():
+        try:
+            appended += record_price(name, price, at)
+        except ValueError:
+            continue
+    return appended
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the points Largest-Triangle-Three-Buckets keeps."""
+    import numpy as np
+
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Bucket edges for the n - 2 interior points.
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    keep = np.empty(threshold, dtype=np.intp)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], max(edges[bucket + 1], edges[bucket] + 1)
+        next_start, next_end = edges[bucket + 1], edges[bucket + 2] if bucket + 2 < len(edges) else n
+        if next_start >= next_end:
+            avg_x, avg_y = x[-1], y[-1]
+        else:
+            avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        px, py = x[previous], y[previous]
+        areas = np.abs((px - avg_x) * (y[start:end] - py) - (px - x[start:end]) * (avg_y - py))
+        previous = start + int(np.argmax(areas))
+        keep[bucket + 1] = previous
+    return keep
+
+
+def price_history(
+    ticker: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    points: int = DEFAULT_POINTS,
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """(timestamps, prices, points in range) for ``ticker`` between ``start`` and ``end``, downsampled."""
+    import numpy as np
+
+    records = _records(history_path(ticker))
+    times = records["t"]
+    low = 0 if start is None else int(np.searchsorted(times, _epoch(start), "left"))
+    high = len(times) if end is None else int(np.searchsorted(times, _epoch(end), "right"))
+    window = records[low:max(low, high)]
+    keep = lttb(window["t"], window["p"], max(3, min(points, MAX_POINTS)))
+    selected = window[keep]
+    return np.array(selected["t"]), np.array(selected["p"]), len(window)
+
+
+def has_history(ticker: str) -> bool:
+    return history_path(ticker).exists()
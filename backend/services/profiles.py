@@ -0,0 +1,66 @@
+"""Cached Firebase user records for profile and provider lookups."""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", 300))
+
+# uid => (token identities it was built under, profile)
+_profile_cache = TTLCache(ttl=PROFILE_CACHE_TTL, max_entries=10000)
+
+
+def _derive_profile(user_record: Any) -> Dict[str, Any]:
+    """Derive the cached profile fields and sign-in providers from a UserRecord."""
+    # Determine available sign-in methods
+    providers = []
+    for provider_data in user_record.provider_data:
+        providers.append(provider_data.provider_id)
+
+    # Also check if email/password is enabled
+    if user_record.email and not user_record.disabled:
+        if 'password' not in providers and len(user_record.provider_data) > 0:
+            # Check if any provider is not password-based
+            has_non_password = any(p.provider_id != 'password' for p in user_record.provider_data)
+            if has_non_password and user_record.email:
+                providers.append('email')
+        elif len(user_record.provider_data) == 0:
+            providers.append('email')
+
+    return {
+        "display_name": user_record.display_name,
+        "photo_url": user_record.photo_url,
+        "email_verified": user_record.email_verified,
+        "providers": providers,
+    }
+
+
+def token_identities(decoded_token: Dict[str, Any]) -> Tuple[str, ...]:
+    """Sign-in identities (``google.com``, ``email``...) listed in a decoded ID token."""
+    identities = (decoded_token.get("firebase") or {}).get("identities") or {}
+    return tuple(sorted(identities))
+
+
+def get_profile(uid: str, identities: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """Return the derived profile for ``uid``, fetching the user record on a miss.
+
+    ``identities`` are those in the caller's ID token (see
+    ``token_identities``). A cached profile built under other identities is
+    refetched: once linking completes on the client, the refreshed token
+    lists the new provider, so every worker drops its stale entry.
+    """
+    key = tuple(identities) if identities is not None else None
+    cached = _profile_cache.get(uid)
+    if cached is not None and (key is None or cached[0] == key):
+        return cached[1]
+
+    from firebase_admin import auth as admin_auth
+
+    profile = _derive_profile(admin_auth.get_user(uid))
+    _profile_cache.set(uid, (key, profile))
+    return profile
@@ -0,0 +1,305 @@
+"""Per-user token-bucket rate limiting and in-flight based load shedding.
+
+Two limiter implementations share one interface:
+
+* ``InProcessRateLimiter`` keeps buckets in a dict, so every gunicorn worker
+  enforces its own budget.
+* ``SharedMemoryRateLimiter`` keeps buckets in an anonymous shared ``mmap``
+  created at import time. With ``preload_app = True`` the mapping is created
+  in the gunicorn master and inherited by every forked worker, so all workers
+  draw from the same per-user budget.
+
+Nothing here takes a lock that a dead process could leave held: bucket
+updates use ``fcntl`` record locks, which the kernel drops when their owner
+exits, and the load shedder counts per process without cross-process locks.
+"""
+from __future__ import annotations
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+from services.local_state import state_path
+
+READ = "read"
+WRITE = "write"
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1").lower() not in ("0", "false", "no")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "shared")
+
+# (refill tokens per second, bucket capacity) per request kind.
+DEFAULT_BUDGETS: Dict[str, Tuple[float, float]] = {
+    READ: (
+        float(os.getenv("RATE_LIMIT_READ_PER_SEC", 10)),
+        float(os.getenv("RATE_LIMIT_READ_BURST", 40)),
+    ),
+    WRITE: (
+        float(os.getenv("RATE_LIMIT_WRITE_PER_SEC", 2)),
+        float(os.getenv("RATE_LIMIT_WRITE_BURST", 20)),
+    ),
+}
+
+# Defaults to three quarters of the gunicorn request threads (see
+# gunicorn.conf.py), so requests are shed before every thread is busy.
+LOAD_SHED_MAX_INFLIGHT = int(
+    os.getenv("LOAD_SHED_MAX_INFLIGHT")
+    or max(1, int(os.getenv("GUNICORN_WORKERS", 2)) * int(os.getenv("GUNICORN_THREADS", 32)) * 3 // 4)
+)
+LOAD_SHED_MAX_QUEUE_MS = float(os.getenv("LOAD_SHED_MAX_QUEUE_MS", 5000))
+
+
+def _refill(tokens: float, updated_at: float, now: float, rate: float, capacity: float) -> float:
+    return min(capacity, tokens + (now - updated_at) * rate)
+
+
+def _take(tokens: float, rate: float) -> Tuple[bool, float, float]:
+    """Try to take one token; returns (allowed, remaining tokens, retry_after)."""
+    if tokens >= 1.0:
+        return True, tokens - 1.0, 0.0
+    retry_after = (1.0 - tokens) / rate if rate > 0 else 60.0
+    return False, tokens, retry_after
+
+
+class InProcessRateLimiter:
+    """Token buckets keyed by (uid, kind) held in this process."""
+
+    def __init__(self, budgets: Dict[str, Tuple[float, float]] | None = None):
+        self.budgets = budgets or DEFAULT_BUDGETS
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+    def acquire(self, uid: str, kind: str) -> Tuple[bool, float]:
+        """Consume a token for ``uid``; returns (allowed, retry_after seconds)."""
+        rate, capacity = self.budgets[kind]
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get((uid, kind), (capacity, now))
+            tokens = _refill(tokens, updated_at, now, rate, capacity)
+            allowed, tokens, retry_after = _take(tokens, rate)
+            self._buckets[(uid, kind)] = (tokens, now)
+            if len(self._buckets) > 100000:
+                # Full buckets carry no state worth keeping.
+                self._buckets = {
+                    key: value for key, value in self._buckets.items()
+                    if _refill(value[0], value[1], now, *self.budgets[key[1]]) < self.budgets[key[1]][1]
+                }
+        return allowed, retry_after
+
+
+class SharedMemoryRateLimiter:
+    """Token buckets in an anonymous shared mmap, shared by forked workers.
+
+    Buckets live in a fixed open-addressed table; when every probe slot is
+    taken by another key the least recently used one is recycled, which at
+    worst hands that user a fresh (full) bucket. A key's probe window is
+    locked with ``lockf`` on the matching byte range of a lock file, so only
+    overlapping windows contend and a worker killed mid-update releases it.
+    """
+
+    _RECORD = struct.Struct("=Qdd")  # key hash, tokens, updated_at (monotonic)
+    _PROBES = 8
+
+    def __init__(
+        self,
+        budgets: Dict[str, Tuple[float, float]] | None = None,
+        slots: int = 8192,
+        lock_path: Optional[str] = None,
+    ):
+        self.budgets = budgets or DEFAULT_BUDGETS
+        self.slots = max(slots, self._PROBES)
+        self.lock_path = lock_path
+        self._map = mmap.mmap(-1, self._RECORD.size * self.slots)
+        # Record locks are per process, so threads of one worker also need
+        # a thread lock.
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._lock_file_pid: Optional[int] = None
+
+    def _lock_fd(self) -> int:
+        """This process's own descriptor for the lock file, reopened after a fork."""
+        if self._lock_file_pid != os.getpid():
+            self._lock_file = open(self.lock_path or state_path("rate_limit", "buckets.lock"), "a")
+            self._lock_file_pid = os.getpid()
+        return self._lock_file.fileno()
+
+    def _key(self, uid: str, kind: str) -> int:
+        # Stable across processes (unlike hash()); 0 marks an empty slot.
+        return zlib.crc32(f"{kind}:{uid}".encode()) | (1 << 32)
+
+    def acquire(self, uid: str, kind: str) -> Tuple[bool, float]:
+        """Consume a token for ``uid``; returns (allowed, retry_after seconds)."""
+        rate, capacity = self.budgets[kind]
+        key = self._key(uid, kind)
+        now = time.monotonic()
+        # Probe windows never wrap, so each maps to one byte range to lock.
+        start = key % (self.slots - self._PROBES + 1)
+
+        with self._lock:
+            fd = self._lock_fd()
+            fcntl.lockf(fd, fcntl.LOCK_EX, self._PROBES, start)
+            try:
+                return self._update(key, start, now, rate, capacity)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, self._PROBES, start)
+
+    def _update(self, key: int, start: int, now: float, rate: float, capacity: float) -> Tuple[bool, float]:
+        """Refill and take from ``key``'s bucket; the caller holds its window lock."""
+        slot, oldest_slot, oldest_at = None, start, float("inf")
+        for probe in range(self._PROBES):
+            index = start + probe
+            stored_key, tokens, updated_at = self._RECORD.unpack_from(
+                self._map, index * self._RECORD.size
+            )
+            if stored_key == key:
+                slot = index
+                break
+            if stored_key == 0:
+                slot, tokens, updated_at = index, capacity, now
+                break
+            if updated_at < oldest_at:
+                oldest_slot, oldest_at = index, updated_at
+        else:
+            slot, tokens, updated_at = oldest_slot, capacity, now
+
+        tokens = _refill(tokens, updated_at, now, rate, capacity)
+        allowed, tokens, retry_after = _take(tokens, rate)
+        self._RECORD.pack_into(self._map, slot * self._RECORD.size, key, tokens, now)
+        return allowed, retry_after
+
+
+class LoadShedder:
+    """Reject new requests once too many are already queued or in flight.
+
+    The in-flight count covers every worker forked from the master: each
+    process counts its own requests in its own slot of a shared table, so no
+    lock is shared between processes. Slots of processes that are gone are
+    ignored and reused, and gunicorn's ``child_exit`` hook clears a dead
+    worker's slot straight away. If the proxy sets ``X-Request-Start`` the
+    time a request spent queued before reaching a worker is checked as well.
+    """
+
+    _SLOT = struct.Struct("=qq")  # pid, requests in flight
+
+    def __init__(
+        self,
+        max_inflight: int = LOAD_SHED_MAX_INFLIGHT,
+        max_queue_ms: float = LOAD_SHED_MAX_QUEUE_MS,
+        slots: int = 256,
+    ):
+        self.max_inflight = max_inflight
+        self.max_queue_ms = max_queue_ms
+        self.slots = slots
+        self._map = mmap.mmap(-1, self._SLOT.size * slots)
+        self._lock = threading.Lock()
+        self._slot: Optional[int] = None
+        self._slot_pid: Optional[int] = None
+
+    def _own_slot(self) -> Optional[int]:
+        """This process's slot, claimed on first use (None when the table is full)."""
+        pid = os.getpid()
+        if self._slot_pid != pid:
+            # The lock file serialises claims between processes; flock is
+            # released when the holder exits, however it dies.
+            with open(state_path("load_shed", "slots.lock"), "a") as handle:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+                self._slot = next(
+                    (index for index in range(self.slots) if not _alive(self._read(index)[0])), None
+                )
+                if self._slot is not None:
+                    self._SLOT.pack_into(self._map, self._slot * self._SLOT.size, pid, 0)
+            self._slot_pid = pid
+        return self._slot
+
+    def _read(self, index: int) -> Tuple[int, int]:
+        return self._SLOT.unpack_from(self._map, index * self._SLOT.size)
+
+    @property
+    def inflight(self) -> int:
+        total = 0
+        for index in range(self.slots):
+            pid, count = self._read(index)
+            if count > 0 and _alive(pid):
+                total += count
+        return total
+
+    def enter(self, request_start: str | None = None) -> Tuple[bool, float]:
+        """Admit a request; returns (admitted, retry_after seconds)."""
+        if request_start and self.max_queue_ms > 0:
+            queued_ms = _queue_time_ms(request_start)
+            if queued_ms is not None and queued_ms > self.max_queue_ms:
+                return False, max(queued_ms / 1000.0, 1.0)
+
+        with self._lock:
+            slot = self._own_slot()
+            if slot is None:
+                return True, 0.0
+            # Counted first so the limit includes this request.
+            pid, count = self._read(slot)
+            self._SLOT.pack_into(self._map, slot * self._SLOT.size, pid, count + 1)
+            if self.inflight > self.max_inflight:
+                self._SLOT.pack_into(self._map, slot * self._SLOT.size, pid, count)
+                return False, 1.0
+        return True, 0.0
+
+    def leave(self) -> None:
+        with self._lock:
+            slot = self._own_slot()
+            if slot is None:
+                return
+            pid, count = self._read(slot)
+            self._SLOT.pack_into(self._map, slot * self._SLOT.size, pid, max(count - 1, 0))
+
+    def release_pid(self, pid: int) -> None:
+        """Free the slot of a process that exited (called from gunicorn's master)."""
+        for index in range(self.slots):
+            if self._read(index)[0] == pid:
+                self._SLOT.pack_into(self._map, index * self._SLOT.size, 0, 0)
+
+
+def _alive(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _queue_time_ms(header: str) -> float | None:
+    """Parse ``X-Request-Start`` (``t=<epoch>`` in s, ms or us) into queued milliseconds."""
+    value = header.strip()
+    if value.startswith("t="):
+        value = value[2:]
+    try:
+        started = float(value)
+    except ValueError:
+        return None
+    # Normalise to seconds whatever unit the proxy used.
+    while started > 1e11:
+        started /= 1000.0
+    return max((time.time() - started) * 1000.0, 0.0)
+
+
+def _build_limiter():
+    if RATE_LIMIT_BACKEND == "memory":
+        return InProcessRateLimiter()
+    return SharedMemoryRateLimiter()
+
+
+# Created at import so that, with preload_app, the shared mappings are
+# allocated in the gunicorn master and inherited by every worker.
+rate_limiter = _build_limiter()
+load_shedder = LoadShedder()
+
+
+def request_kind(method: str) -> str:
+    """Classify an HTTP method against the read or write budget."""
+    return READ if method in ("GET", "HEAD", "OPTIONS") else WRITE
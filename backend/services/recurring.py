@@ -0,0 +1,482 @@
+"""Recurring transaction rules and the scheduler that materializes them.
+
+Rules live at ``users/{uid}/recurring/{rule_id}`` with a ``next_due`` date.
+One scheduler per host (elected with an exclusive ``flock``) keeps a min-heap
+of ``(next_due, uid, rule_id)`` across all users. Due occurrences are written
+together with the rule's advanced ``next_due`` in a single multi-path update,
+and each occurrence has a deterministic id (``r-{rule_id}-{YYYYMMDD}``), so a
+retried or repeated run never duplicates a record; an occurrence that already
+exists is left as it is.
+Occurrences missed while the scheduler was down are caught up when it starts,
+with one scan of every user's rules. After that the heap only changes through
+its own runs and through rule edits: the rule functions below queue each
+change in a host-local file, and the scheduler, which may live in another
+worker, applies them on its next tick.
+
+The same update marks each new occurrence pending at
+``recurring/{rule_id}/pending/{YYYYMMDD}``. Its side effects (budget spend,
+net-worth snapshot, search index) are applied only by whoever claims that
+marker, so a run retried after a partial failure applies them at most once.
+"""
+from __future__ import annotations
+
+import calendar
+import fcntl
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.auth import get_current_user_id
+from services.budgets import record_transaction_spend
+from services.firebase_db import get_firebase_store
+from services.fx import get_reporting_currency, normalize_currency, record_currency
+from services.local_state import state_path
+from services.networth import record_transaction
+from services.search import index_transaction
+
+logger = logging.getLogger(__name__)
+
+firebase_store = get_firebase_store()
+
+FREQUENCIES = ("daily", "weekly", "monthly", "yearly")
+
+RECURRING_SCHEDULER_ENABLED = os.getenv("RECURRING_SCHEDULER", "1").lower() not in ("0", "false", "no")
+RECURRING_TICK_SECONDS = float(os.getenv("RECURRING_TICK_SECONDS", 60))
+RECURRING_LEADER_RETRY_SECONDS = float(os.getenv("RECURRING_LEADER_RETRY_SECONDS", 30))
+# Paths per multi-path update and occurrences per rule per pass (catch-up is
+# spread over several passes for very old rules).
+RECURRING_BATCH_PATHS = int(os.getenv("RECURRING_BATCH_PATHS", 200))
+RECURRING_MAX_CATCH_UP = int(os.getenv("RECURRING_MAX_CATCH_UP", 400))
+_USER_PAGE_SIZE = 500
+
+
+def _parse_date(value: Any) -> date:
+    return date.fromisoformat(str(value)[:10])
+
+
+def _today() -> date:
+    return datetime.utcnow().date()
+
+
+def _add_months(anchor: date, current: date, months: int) -> date:
+    """Move ``months`` ahead of ``current`` keeping the anchor's day of month."""
+    month_index = current.year * 12 + current.month - 1 + months
+    year, month = divmod(month_index, 12)
+    day = min(anchor.day, calendar.monthrange(year, month + 1)[1])
+    return date(year, month + 1, day)
+
+
+def next_occurrence(rule: Dict[str, Any], current: date) -> date:
+    """Return the occurrence after ``current`` for a rule."""
+    interval = max(int(rule.get("interval", 1)), 1)
+    frequency = rule.get("frequency", "monthly")
+    if frequency == "daily":
+        return current + timedelta(days=interval)
+    if frequency == "weekly":
+        return current + timedelta(weeks=interval)
+    anchor = _parse_date(rule["start_date"])
+    if frequency == "yearly":
+        return _add_months(anchor, current, 12 * interval)
+    return _add_months(anchor, current, interval)
+
+
+def occurrence_id(rule_id: str, due: date) -> str:
+    return f"r-{rule_id}-{_due_key(due)}"
+
+
+def _occurrence(rule: Dict[str, Any], due: date) -> Dict[str, Any]:
+    return {
+        "id": occurrence_id(rule["id"], due),
+        "title": rule["title"],
+        "content": rule.get("content", ""),
+        "amount": float(rule["amount"]),
+        "type": rule["type"],
+        "category": rule.get("category", "Other"),
+        "date": datetime(due.year, due.month, due.day).isoformat() + "Z",
+        "recurring_id": rule["id"],
+        "currency": record_currency(rule),
+    }
+
+
+def due_occurrences(rule: Dict[str, Any], today: date) -> Tuple[List[Dict[str, Any]], Optional[date]]:
+    """Return (occurrences due by ``today``, the rule's next due date afterwards).
+
+    The next due date is None once the rule has passed its end date.
+    """
+    if not rule.get("active", True) or not rule.get("next_due"):
+        return [], None
+    end = _parse_date(rule["end_date"]) if rule.get("end_date") else None
+    due = _parse_date(rule["next_due"])
+    occurrences: List[Dict[str, Any]] = []
+    while due <= today and len(occurrences) < RECURRING_MAX_CATCH_UP:
+        if end is not None and due > end:
+            return occurrences, None
+        occurrences.append(_occurrence(rule, due))
+        due = next_occurrence(rule, due)
+    if end is not None and due > end:
+        return occurrences, None
+    return occurrences, due
+
+
+def _due_key(due: date) -> str:
+    return due.strftime('%Y%m%d')
+
+
+def _rules_for(user_id: str) -> Dict[str, Dict[str, Any]]:
+    rules = firebase_store.get_value(user_id, "recurring")
+    if isinstance(rules, dict):
+        return {rule_id: rule for rule_id, rule in rules.items() if isinstance(rule, dict)}
+    return {}
+
+
+def _claim_effects(user_id: str, rule_id: str, key: str) -> bool:
+    """Mark an occurrence's pending side effects applied; True if this caller claimed them."""
+    claimed = [False]
+
+    def apply(current):
+        claimed[0] = current is True
+        return "applied" if current is not None else None
+
+    # The claim only counts when the transaction committed "applied".
+    result = firebase_store.transact_value(user_id, f"recurring/{rule_id}/pending/{key}", apply)
+    return claimed[0] and result == "applied"
+
+
+def _apply_effects(user_id: str, rule_id: str, key: str, transaction: Optional[Dict[str, Any]]) -> None:
+    """Apply one occurrence's side effects once, then drop its marker."""
+    if not _claim_effects(user_id, rule_id, key):
+        return
+    if transaction is not None:
+        index_transaction(user_id, transaction)
+        record_transaction_spend(user_id, transaction)
+        record_transaction(user_id, transaction)
+    firebase_store.set_value(user_id, f"recurring/{rule_id}/pending/{key}", None)
+
+
+def materialize_user(user_id: str, today: date | None = None) -> Dict[str, Optional[str]]:
+    """Write every due occurrence for one user's rules.
+
+    Returns rule_id => next due date (None for finished rules) for the rules
+    that were processed successfully. Side effects left pending by an earlier
+    run that failed part way are applied first.
+    """
+    today = today or _today()
+    prefix = f"users/{user_id}"
+    rules = _rules_for(user_id)
+    scheduled: Dict[str, Optional[str]] = {}
+    updates: Dict[str, Any] = {}
+    pending: List[Tuple[str, Optional[str], List[Dict[str, Any]]]] = []
+    existing: Optional[set] = None
+
+    for rule_id, rule in rules.items():
+        markers = rule.get("pending")
+        for key, state in (markers.items() if isinstance(markers, dict) else ()):
+            if state is True:
+                transaction = firebase_store.get_one(user_id, "transactions", f"r-{rule_id}-{key}")
+                _apply_effects(user_id, rule_id, key, transaction)
+            else:
+                # Claimed and applied, but the marker was not removed.
+                firebase_store.set_value(user_id, f"recurring/{rule_id}/pending/{key}", None)
+
+    def commit() -> None:
+        if not updates:
+            return
+        if firebase_store.update_paths(updates):
+            for rule_id, next_due, occurrences in pending:
+                scheduled[rule_id] = next_due
+                for transaction in occurrences:
+                    _apply_effects(user_id, rule_id, _due_key(_parse_date(transaction["date"])), transaction)
+        updates.clear()
+        pending.clear()
+
+    for rule_id, rule in rules.items():
+        if not rule.get("active", True) or not rule.get("next_due"):
+            # Paused or finished; keep next_due so a resumed rule carries on.
+            continue
+        occurrences, next_due = due_occurrences(rule, today)
+        if not occurrences and next_due is not None:
+            scheduled[rule_id] = next_due.isoformat()
+            continue
+        if occurrences and existing is None:
+            existing = set(firebase_store.transaction_ids(user_id))
+        # A re-anchored rule can reach dates it already created; those keep
+        # their record and are not counted again.
+        occurrences = [t for t in occurrences if t["id"] not in existing]
+        for transaction in occurrences:
+            for path, value in firebase_store.transaction_writes(user_id, transaction).items():
+                updates[f"{prefix}/{path}"] = value
+            updates[f"{prefix}/recurring/{rule_id}/pending/{_due_key(_parse_date(transaction['date']))}"] = True
+        # Advancing next_due in the same update is what makes each
+        # occurrence be written (and counted) once.
+        updates[f"{prefix}/recurring/{rule_id}/next_due"] = next_due.isoformat() if next_due else None
+        if next_due is None:
+            updates[f"{prefix}/recurring/{rule_id}/active"] = False
+        pending.append((rule_id, next_due.isoformat() if next_due else None, occurrences))
+        if len(updates) >= RECURRING_BATCH_PATHS:
+            commit()
+    commit()
+    return scheduled
+
+
+def _rule_changes_path():
+    return state_path("recurring", "rule_changes.jsonl")
+
+
+def notify_rule_change(user_id: str, rule_id: str, next_due: Optional[str]) -> None:
+    """Queue a rule's new next due date (None: nothing scheduled) for this host's scheduler."""
+    line = json.dumps({"u": user_id, "r": rule_id, "d": next_due})
+    try:
+        with open(_rule_changes_path(), "a") as handle:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            handle.write(line + "\n")
+    except OSError as exc:
+        # The rule is saved; it is scheduled on the scheduler's next start.
+        logger.warning("Could not queue recurring rule change: %s", exc)
+
+
+def _drain_rule_changes() -> List[Tuple[str, str, Optional[str]]]:
+    """Take every queued rule change, oldest first."""
+    with open(_rule_changes_path(), "a+") as handle:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        handle.seek(0)
+        lines = handle.read().splitlines()
+        handle.truncate(0)
+    changes = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+            changes.append((entry["u"], entry["r"], entry.get("d")))
+        except (ValueError, KeyError, TypeError):
+            continue
+    return changes
+
+
+def _scheduled_due(rule: Dict[str, Any]) -> Optional[str]:
+    return rule.get("next_due") if rule.get("active", True) else None
+
+
+class RecurringScheduler:
+    """Min-heap of next due dates across all users' rules."""
+
+    def __init__(self):
+        self._heap: List[Tuple[str, str, str]] = []
+        self._loaded = False
+        self._stop = threading.Event()
+
+    def refresh(self) -> None:
+        """Rebuild the heap from every user's rules, catching up anything due."""
+        # Changes queued so far are covered by the scan.
+        _drain_rule_changes()
+        heap: List[Tuple[str, str, str]] = []
+        today = _today()
+        for user_ids in firebase_store.iter_user_id_pages(page_size=_USER_PAGE_SIZE):
+            for user_id in user_ids:
+                try:
+                    scheduled = materialize_user(user_id, today)
+                except Exception as exc:
+                    logger.warning("Recurring catch-up failed for %s: %s", user_id, exc)
+                    continue
+                heap.extend((due, user_id, rule_id) for rule_id, due in scheduled.items() if due)
+        heapq.heapify(heap)
+        self._heap = heap
+        self._loaded = True
+
+    def apply_rule_changes(self) -> int:
+        """Move queued rule edits into the heap; returns how many were applied."""
+        changes = _drain_rule_changes()
+        if not changes:
+            return 0
+        latest = {(user_id, rule_id): due for user_id, rule_id, due in changes}
+        self._heap = [entry for entry in self._heap if (entry[1], entry[2]) not in latest]
+        self._heap.extend((due, user_id, rule_id) for (user_id, rule_id), due in latest.items() if due)
+        heapq.heapify(self._heap)
+        return len(latest)
+
+    def run_due(self, today: date | None = None) -> int:
+        """Materialize rules whose next due date has arrived; returns users processed."""
+        today_key = (today or _today()).isoformat()
+        users = set()
+        while self._heap and self._heap[0][0] <= today_key:
+            _, user_id, _ = heapq.heappop(self._heap)
+            users.add(user_id)
+        for user_id in users:
+            # Re-read the user's rules so edits since the last refresh apply.
+            try:
+                scheduled = materialize_user(user_id, today)
+            except Exception as exc:
+                logger.warning("Recurring run failed for %s: %s", user_id, exc)
+                scheduled = {}
+            self._heap = [entry for entry in self._heap if entry[1] != user_id]
+            for rule_id, due in scheduled.items():
+                if due:
+                    self._heap.append((due, user_id, rule_id))
+            heapq.heapify(self._heap)
+        return len(users)
+
+    def run_forever(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if not self._loaded:
+                    self.refresh()
+                else:
+                    self.apply_rule_changes()
+                    self.run_due()
+            except Exception as exc:
+                logger.warning("Recurring scheduler pass failed: %s", exc)
+            self._stop.wait(RECURRING_TICK_SECONDS)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+_scheduler: Optional[RecurringScheduler] = None
+_leader_lock_file = None
+
+
+def _try_become_leader() -> bool:
+    """Take the host-wide scheduler lock; it is released when this process exits."""
+    global _leader_lock_file
+    handle = open(state_path("recurring", "leader.lock"), "a")
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _leader_lock_file = handle
+    return True
+
+
+def _leader_loop() -> None:
+    global _scheduler
+    while not _try_become_leader():
+        time.sleep(RECURRING_LEADER_RETRY_SECONDS)
+    logger.info("Recurring scheduler leader is pid %s", os.getpid())
+    _scheduler = RecurringScheduler()
+    _scheduler.run_forever()
+
+
+def start_scheduler() -> None:
+    """Start the leader-elected scheduler thread (called from gunicorn ``post_fork``).
+
+    Every worker starts a thread, but only the one holding the lock runs the
+    scheduler; the others keep retrying so a recycled leader is replaced.
+    """
+    if not RECURRING_SCHEDULER_ENABLED or not firebase_store.firebase_available:
+        return
+    threading.Thread(target=_leader_loop, name="recurring-scheduler", daemon=True).start()
+
+
+# Rule management for the current user
+def _require_user() -> str:
+    user_id = get_current_user_id()
+    if not user_id:
+        raise ValueError("User must be authenticated to manage recurring transactions")
+    if not firebase_store.firebase_available:
+        raise RuntimeError("Firebase store is not available")
+    return user_id
+
+
+def _next_rule_id(rules: Dict[str, Dict[str, Any]]) -> str:
+    numbers = [int(rule_id[4:]) for rule_id in rules if rule_id.startswith("rule") and rule_id[4:].isdigit()]
+    return f"rule{max(numbers) + 1}" if numbers else "rule1"
+
+
+def _validated(data: Dict[str, Any]) -> Dict[str, Any]:
+    rule: Dict[str, Any] = {}
+    if "title" in data:
+        rule["title"] = str(data["title"])
+    if "content" in data:
+        rule["content"] = str(data["content"])
+    if "amount" in data:
+        rule["amount"] = float(data["amount"])
+    if "type" in data:
+        if data["type"] not in ("income", "expense"):
+            raise ValueError("type must be 'income' or 'expense'")
+        rule["type"] = data["type"]
+    if "category" in data:
+        rule["category"] = str(data["category"])
+    if "currency" in data:
+        rule["currency"] = normalize_currency(data["currency"])
+    if "frequency" in data:
+        if data["frequency"] not in FREQUENCIES:
+            raise ValueError(f"frequency must be one of: {', '.join(FREQUENCIES)}")
+        rule["frequency"] = data["frequency"]
+    if "interval" in data:
+        rule["interval"] = max(int(data["interval"]), 1)
+    if "start_date" in data:
+        rule["start_date"] = _parse_date(data["start_date"]).isoformat()
+    if "end_date" in data:
+        rule["end_date"] = _parse_date(data["end_date"]).isoformat() if data["end_date"] else None
+    if "active" in data:
+        rule["active"] = bool(data["active"])
+    return rule
+
+
+def _public(rule: Dict[str, Any]) -> Dict[str, Any]:
+    """A rule without its internal pending side-effect markers."""
+    return {key: value for key, value in rule.items() if key != "pending"}
+
+
+def get_recurring_rules() -> List[Dict[str, Any]]:
+    """Return the current user's recurring rules."""
+    user_id = get_current_user_id()
+    if not user_id or not firebase_store.firebase_available:
+        return []
+    return [_public(rule) for rule in _rules_for(user_id).values()]
+
+
+def add_recurring_rule(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Create a recurring rule; its first occurrence is due on ``start_date``."""
+    user_id = _require_user()
+    rule = {
+        "content": "",
+        "category": "Other",
+        "frequency": "monthly",
+        "interval": 1,
+        "end_date": None,
+        "active": True,
+        **_validated(data),
+    }
+    rule.setdefault("start_date", _today().isoformat())
+    rule["currency"] = rule.get("currency") or get_reporting_currency(user_id)
+    rule.update(
+        id=_next_rule_id(_rules_for(user_id)),
+        next_due=rule["start_date"],
+        created_at=datetime.utcnow().isoformat() + "Z",
+        updated_at=datetime.utcnow().isoformat() + "Z",
+    )
+    firebase_store.set_value(user_id, f"recurring/{rule['id']}", {k: v for k, v in rule.items() if v is not None})
+    notify_rule_change(user_id, rule["id"], _scheduled_due(rule))
+    return rule
+
+
+def update_recurring_rule(rule_id: str, updates: Dict[str, Any]) -> Dict[str, Any] | None:
+    """Update a rule; changing ``start_date`` re-anchors the schedule there."""
+    user_id = _require_user()
+    changes = _validated(updates)
+    if "start_date" in changes:
+        changes["next_due"] = changes["start_date"]
+    changes["updated_at"] = datetime.utcnow().isoformat() + "Z"
+    rule = firebase_store.patch_one(user_id, "recurring", rule_id, changes)
+    if rule is None:
+        return None
+    notify_rule_change(user_id, rule_id, _scheduled_due(rule))
+    return _public(rule)
+
+
+def delete_recurring_rule(rule_id: str) -> bool:
+    """Delete a rule; transactions it already created are kept."""
+    user_id = get_current_user_id()
+    if not user_id:
+        return False
+    if not firebase_store.firebase_available:
+        raise RuntimeError("Firebase store is not available")
+    deleted = firebase_store.delete_one(user_id, "recurring", rule_id)
+    if deleted:
+        notify_rule_change(user_id, rule_id, None)
+    return deleted
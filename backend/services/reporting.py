@@ -0,0 +1,242 @@
+"""Fleet-wide usage report across all users.
+
+Run as ``python -m services.reporting``. Users are enumerated a page at a
+time with Firebase Auth ``list_users`` (RTDB cannot page a shallow read of
+``users``; the only shallow read returns every key at once). For each page,
+per-user aggregates are fetched concurrently by a bounded thread pool using
+shallow key reads, so no user's data is downloaded unless ``--storage`` asks
+for a byte count.
+
+Per-user rows are appended to a CSV and fleet totals are accumulated in the
+checkpoint after every page; only one page of users is held in memory. An
+interrupted run resumes from the saved page token, truncating any rows
+written after the last checkpoint. The finished report is written as JSON
+next to the CSV.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from services.archive import TOTALS_PATH as ARCHIVE_TOTALS_PATH
+from services.change_journal import SEQ_PATH
+from services.firebase import get_firebase_auth
+from services.firebase_db import get_firebase_store
+from services.local_state import read_json, state_path, write_json_atomic
+from services.transaction_partitions import INDEX_PATH, SCHEMA_FLAT, SCHEMA_PATH, is_partition_key
+
+logger = logging.getLogger(__name__)
+
+firebase_store = get_firebase_store()
+
+DEFAULT_PAGE_SIZE = 500
+# Firebase Auth list_users() returns at most 1000 users per page.
+MAX_PAGE_SIZE = 1000
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", 8))
+ACTIVE_DAYS = int(os.getenv("REPORT_ACTIVE_DAYS", 30))
+
+COUNTED_COLLECTIONS = ("stocks", "investments", "savings_goals", "budgets", "recurring")
+COLUMNS = (
+    "uid",
+    "created_at",
+    "last_active_at",
+    "active",
+    "disabled",
+    "has_data",
+    "transaction_schema",
+    "transactions",
+    "archived_transactions",
+    *COUNTED_COLLECTIONS,
+    "changes",
+    "storage_bytes",
+    "error",
+)
+SUMMED_COLUMNS = (
+    "transactions",
+    "archived_transactions",
+    *COUNTED_COLLECTIONS,
+    "changes",
+    "storage_bytes",
+)
+
+
+def _iso(millis: Optional[int]) -> Optional[str]:
+    return datetime.utcfromtimestamp(millis / 1000).isoformat() + "Z" if millis else None
+
+
+def user_aggregates(user: Any, include_storage: bool = False, now_ms: Optional[int] = None) -> Dict[str, Any]:
+    """One report row for an Auth user record, from shallow and single-value reads.
+
+    Reads go straight to Firebase (``read_fresh``), so nothing read for the
+    report stays in the store's last-known-good cache.
+    """
+    now_ms = now_ms or int(time.time() * 1000)
+    metadata = user.user_metadata
+    last_active = max(metadata.last_refresh_timestamp or 0, metadata.last_sign_in_timestamp or 0) or None
+    row: Dict[str, Any] = {column: 0 for column in SUMMED_COLUMNS}
+    row.update({
+        "uid": user.uid,
+        "created_at": _iso(metadata.creation_timestamp),
+        "last_active_at": _iso(last_active),
+        "active": bool(last_active and now_ms - last_active <= ACTIVE_DAYS * 86400 * 1000),
+        "disabled": bool(user.disabled),
+        "has_data": False,
+        "transaction_schema": None,
+        "storage_bytes": None,
+        "error": None,
+    })
+    try:
+        nodes = set(firebase_store.child_keys(user.uid, ""))
+        row["has_data"] = bool(nodes)
+        if not nodes:
+            return row
+        row["transaction_schema"] = firebase_store.read_fresh(user.uid, SCHEMA_PATH) or SCHEMA_FLAT
+        # Index keys plus flat items not yet moved; both shallow reads.
+        transaction_ids = set()
+        if INDEX_PATH in nodes:
+            transaction_ids.update(firebase_store.child_keys(user.uid, INDEX_PATH))
+        if "transactions" in nodes:
+            transaction_ids.update(
+                key for key in firebase_store.child_keys(user.uid, "transactions") if not is_partition_key(key)
+            )
+        row["transactions"] = len(transaction_ids)
+        for collection in COUNTED_COLLECTIONS:
+            if collection in nodes:
+                row[collection] = len(firebase_store.child_keys(user.uid, collection))
+        if ARCHIVE_TOTALS_PATH in nodes:
+            archived = firebase_store.read_fresh(user.uid, ARCHIVE_TOTALS_PATH)
+            if isinstance(archived, dict):
+                row["archived_transactions"] = sum(
+                    int(t.get("count", 0)) for t in archived.values() if isinstance(t, dict)
+                )
+        row["changes"] = int(firebase_store.read_fresh(user.uid, SEQ_PATH) or 0)
+        if include_storage:
+            # The one full read; bounded by REPORT_WORKERS users at a time and
+            # released once measured.
+            row["storage_bytes"] = len(json.dumps(firebase_store.read_fresh(user.uid, ""), separators=(",", ":")))
+    except Exception as exc:
+        row["error"] = str(exc) or exc.__class__.__name__
+    return row
+
+
+def _new_state(report_dir: Path, include_storage: bool) -> Dict[str, Any]:
+    run_id = uuid.uuid4().hex
+    return {
+        "run_id": run_id,
+        "page_token": None,
+        "include_storage": include_storage,
+        "csv_path": str(report_dir / f"users-{run_id}.csv"),
+        "csv_offset": 0,
+        "totals": {
+            "users": 0,
+            "active_users": 0,
+            "disabled_users": 0,
+            "users_with_data": 0,
+            "partitioned_users": 0,
+            "errors": 0,
+            **{column: 0 for column in SUMMED_COLUMNS},
+        },
+        "completed": False,
+        "started_at": datetime.utcnow().isoformat() + "Z",
+    }
+
+
+def _add_to_totals(totals: Dict[str, Any], row: Dict[str, Any]) -> None:
+    totals["users"] += 1
+    totals["active_users"] += int(row["active"])
+    totals["disabled_users"] += int(row["disabled"])
+    totals["users_with_data"] += int(row["has_data"])
+    totals["partitioned_users"] += int(row["transaction_schema"] not in (None, SCHEMA_FLAT))
+    totals["errors"] += int(bool(row["error"]))
+    for column in SUMMED_COLUMNS:
+        totals[column] += row[column] or 0
+
+
+def run_report(
+    checkpoint_path: Path | None = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    workers: int = REPORT_WORKERS,
+    include_storage: bool = False,
+    restart: bool = False,
+) -> Dict[str, Any]:
+    """Build the usage report for every user, resuming from the checkpoint."""
+    if not firebase_store.firebase_available:
+        raise RuntimeError("Firebase store is not available")
+
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    checkpoint_path = checkpoint_path or state_path("reports", "checkpoint.json")
+    state = None if restart else read_json(checkpoint_path)
+    if not state or state.get("completed"):
+        state = _new_state(checkpoint_path.parent, include_storage)
+    else:
+        logger.info("Resuming report %s", state["run_id"])
+        include_storage = state["include_storage"]
+
+    csv_path = Path(state["csv_path"])
+    auth = get_firebase_auth()
+    with open(csv_path, "a+", newline="") as handle, ThreadPoolExecutor(
+        max_workers=max(1, workers), thread_name_prefix="report"
+    ) as executor:
+        # Drop rows from a page that was written but not checkpointed.
+        handle.truncate(state["csv_offset"])
+        handle.seek(state["csv_offset"])
+        writer = csv.DictWriter(handle, fieldnames=COLUMNS)
+        if state["csv_offset"] == 0:
+            writer.writeheader()
+
+        while True:
+            page = auth.list_users(page_token=state["page_token"], max_results=page_size)
+            now_ms = int(time.time() * 1000)
+            rows = list(executor.map(lambda user: user_aggregates(user, include_storage, now_ms), page.users))
+            writer.writerows(rows)
+            handle.flush()
+            os.fsync(handle.fileno())
+            for row in rows:
+                _add_to_totals(state["totals"], row)
+
+            state["csv_offset"] = handle.tell()
+            state["page_token"] = page.next_page_token or None
+            write_json_atomic(checkpoint_path, state)
+            if not state["page_token"]:
+                break
+
+    state["completed"] = True
+    state["finished_at"] = datetime.utcnow().isoformat() + "Z"
+    report_path = csv_path.with_suffix(".json")
+    write_json_atomic(report_path, {key: state[key] for key in ("run_id", "started_at", "finished_at", "totals")})
+    state["report_path"] = str(report_path)
+    write_json_atomic(checkpoint_path, state)
+    return state
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Write a usage report across all users.")
+    parser.add_argument("--checkpoint", type=Path, default=None)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--workers", type=int, default=REPORT_WORKERS)
+    parser.add_argument("--storage", action="store_true", help="Also measure each user's data size (full reads)")
+    parser.add_argument("--restart", action="store_true", help="Ignore any saved checkpoint")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    result = run_report(
+        checkpoint_path=args.checkpoint,
+        page_size=args.page_size,
+        workers=args.workers,
+        include_storage=args.storage,
+        restart=args.restart,
+    )
+    logger.info("Report %s done: %d users, written to %s", result["run_id"], result["totals"]["users"], result["report_path"])
+
+
+if __name__ == "__main__":
+    main()
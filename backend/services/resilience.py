@@ -0,0 +1,141 @@
+"""Circuit breaker and retry helpers for calls to Firebase."""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+class StoreUnavailableError(RuntimeError):
+    """Raised when the backing store is failing and the call was not attempted or gave up."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Classic closed / open / half-open circuit breaker.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast for ``reset_timeout`` seconds. The next call after that is
+    let through as a probe; its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._probe_owner: Optional[int] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit will let a probe through."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed right now."""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._probe_owner = threading.get_ident()
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+            self._probe_owner = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+            self._probe_owner = None
+
+    def release_probe(self) -> None:
+        """Give up the half-open probe if this thread holds it, without recording an outcome."""
+        with self._lock:
+            if self._probe_in_flight and self._probe_owner == threading.get_ident():
+                self._probe_in_flight = False
+                self._probe_owner = None
+
+
+def call_with_retries(
+    fn: Callable[[], Any],
+    breaker: CircuitBreaker,
+    deadline: float,
+    attempts: int = 3,
+    base_delay: float = 0.1,
+    max_delay: float = 1.0,
+    retry_on: tuple = (Exception,),
+) -> Any:
+    """Call ``fn`` through ``breaker`` with jittered exponential backoff.
+
+    ``deadline`` bounds the total time (in seconds) spent across attempts and
+    backoff sleeps; no retry is started that could not finish in time.
+    Raises StoreUnavailableError when the circuit is open or all attempts fail.
+    """
+    give_up_at = time.monotonic() + deadline
+    last_error: Optional[BaseException] = None
+
+    for attempt in range(attempts):
+        if not breaker.allow():
+            raise StoreUnavailableError(
+                "Firebase circuit is open", retry_after=breaker.retry_after() or 1.0
+            ) from last_error
+        try:
+            result = fn()
+        except retry_on as exc:
+            breaker.record_failure()
+            last_error = exc
+        except Exception:
+            # A non-transient error (not found, conflict, bad request) still
+            # means the store answered.
+            breaker.record_success()
+            raise
+        else:
+            breaker.record_success()
+            return result
+        finally:
+            # Never leave a probe held, whatever escaped from fn().
+            breaker.release_probe()
+
+        # Full jitter: sleep a random amount up to the exponential cap.
+        delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+        if attempt + 1 >= attempts or time.monotonic() + delay >= give_up_at:
+            break
+        time.sleep(delay)
+
+    raise StoreUnavailableError(
+        f"Firebase call failed: {last_error}", retry_after=breaker.retry_after() or 1.0
+    ) from last_error
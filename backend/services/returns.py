@@ -0,0 +1,208 @@
+"""Investment returns: CAGR per holding and money-weighted XIRR.
+
+Cash flows for a holding are its purchase (outflow at ``purchase_date``),
+transactions linked to it with ``investment_id`` (expenses are further
+contributions, income is money taken out) and its ``current_value`` as an
+inflow today. The portfolio XIRR uses every holding's flows together.
+
+XIRR is solved for all holdings and the portfolio in one batch: flows are
+laid out as a zero-padded matrix with one row per cash-flow series, and
+Newton's method runs on every row at once, with a vectorised bisection for
+rows it does not settle.
+"""
+from __future__ import annotations
+
+import math
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from services.fx import convert_records
+
+if TYPE_CHECKING:
+    import numpy as np
+
+DAYS_PER_YEAR = 365.0
+# Bisection bracket for the annual rate.
+MIN_RATE = -0.9999
+MAX_RATE = 100.0
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    try:
+        return datetime.fromisoformat(str(value)[:10]).date()
+    except ValueError:
+        return None
+
+
+def cagr(start: np.ndarray, end: np.ndarray, years: np.ndarray) -> np.ndarray:
+    """Compound annual growth rate per element; NaN where it is undefined."""
+    import numpy as np
+
+    start, end, years = (np.asarray(a, dtype=float) for a in (start, end, years))
+    valid = (start > 0) & (end >= 0) & (years > 0)
+    result = np.full(start.shape, np.nan)
+    result[valid] = (end[valid] / start[valid]) ** (1.0 / years[valid]) - 1.0
+    return result
+
+
+def _npv(rates: np.ndarray, amounts: np.ndarray, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """NPV of each row at its rate, and its derivative with respect to the rate."""
+    discount = (1.0 + rates[:, None]) ** -times
+    value = (amounts * discount).sum(axis=1)
+    slope = (-times * amounts * discount / (1.0 + rates[:, None])).sum(axis=1)
+    return value, slope
+
+
+def xirr(
+    amounts: np.ndarray,
+    times: np.ndarray,
+    guess: float = 0.1,
+    tol: float = 1e-9,
+    max_iter: int = 50,
+) -> np.ndarray:
+    """Annual rate solving sum(amount * (1 + r) ** -t) = 0 for each row.
+
+    ``amounts`` and ``times`` (in years) are 2-D with one cash-flow series
+    per row; pad short rows with zero amounts. Rows without both an inflow
+    and an outflow, or with no root in the bracket, give NaN.
+    """
+    import numpy as np
+
+    amounts = np.asarray(amounts, dtype=float)
+    times = np.asarray(times, dtype=float)
+    rows = amounts.shape[0]
+    result = np.full(rows, np.nan)
+    solvable = (amounts > 0).any(axis=1) & (amounts < 0).any(axis=1)
+    if not solvable.any():
+        return result
+    scale = np.abs(amounts).sum(axis=1)
+    scale[scale == 0] = 1.0
+
+    rates = np.full(rows, guess)
+    done = ~solvable
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        for _ in range(max_iter):
+            active = ~done
+            if not active.any():
+                break
+            value, slope = _npv(rates[active], amounts[active], times[active])
+            step = value / slope
+            updated = rates[active] - step
+            converged = np.abs(value) <= tol * scale[active]
+            bad = ~np.isfinite(updated) | (updated <= MIN_RATE) | (updated > MAX_RATE)
+            index = np.flatnonzero(active)
+            result[index[converged]] = rates[active][converged]
+            done[index[converged | bad]] = True
+            keep = ~(converged | bad)
+            rates[index[keep]] = updated[keep]
+
+        # Bisection for rows Newton left unsolved.
+        pending = solvable & np.isnan(result)
+        if pending.any():
+            amounts, times, scale = amounts[pending], times[pending], scale[pending]
+            low = np.full(len(amounts), MIN_RATE)
+            high = np.full(len(amounts), MAX_RATE)
+            f_low = _npv(low, amounts, times)[0]
+            f_high = _npv(high, amounts, times)[0]
+            bracketed = np.sign(f_low) != np.sign(f_high)
+            for _ in range(200):
+                mid = (low + high) / 2
+                f_mid = _npv(mid, amounts, times)[0]
+                same = np.sign(f_mid) == np.sign(f_low)
+                low = np.where(same, mid, low)
+                f_low = np.where(same, f_mid, f_low)
+                high = np.where(same, high, mid)
+                if (high - low).max() < 1e-12:
+                    break
+            result[np.flatnonzero(pending)[bracketed]] = ((low + high) / 2)[bracketed]
+    return result
+
+
+def _flow_matrix(series: Sequence[List[Tuple[date, float]]]) -> Tuple[np.ndarray, np.ndarray]:
+    import numpy as np
+
+    width = max((len(flows) for flows in series), default=0)
+    amounts = np.zeros((len(series), max(width, 1)))
+    times = np.zeros_like(amounts)
+    for row, flows in enumerate(series):
+        if not flows:
+            continue
+        start = min(day for day, _ in flows)
+        times[row, :len(flows)] = [(day - start).days / DAYS_PER_YEAR for day, _ in flows]
+        amounts[row, :len(flows)] = [amount for _, amount in flows]
+    return amounts, times
+
+
+def _percent(value: float) -> Optional[float]:
+    return round(float(value) * 100, 2) if math.isfinite(value) else None
+
+
+def investment_returns(
+    investments: List[Dict[str, Any]],
+    linked_flows: List[Dict[str, Any]],
+    currency: str,
+    as_of: Optional[date] = None,
+) -> Dict[str, Any]:
+    """CAGR and XIRR per holding plus the portfolio XIRR, as percentages.
+
+    ``linked_flows`` are transaction-like records with ``investment_id``,
+    ``type``, ``amount``, ``currency`` and ``date``. CAGR is computed in
+    each holding's own currency; XIRR converts every flow to ``currency``
+    (purchases and linked flows at their dates, current values at the
+    latest rate), so it includes currency moves.
+    """
+    import numpy as np
+
+    as_of = as_of or datetime.utcnow().date()
+    purchase_dates = [_parse_date(i.get("purchase_date")) for i in investments]
+    purchases, missing = convert_records(investments, "purchase_value", currency, date_field="purchase_date")
+    values, missing_current = convert_records(investments, "current_value", currency)
+    flow_amounts, missing_flows = convert_records(linked_flows, "amount", currency, date_field="date")
+
+    series: List[List[Tuple[date, float]]] = []
+    positions: Dict[str, int] = {}
+    for index, (investment, bought) in enumerate(zip(investments, purchase_dates)):
+        flows: List[Tuple[date, float]] = []
+        if bought is not None and bought <= as_of:
+            flows = [(bought, -float(purchases[index])), (as_of, float(values[index]))]
+            positions[str(investment.get("id"))] = index
+        series.append(flows)
+    contributed = 0.0
+    for flow, amount in zip(linked_flows, flow_amounts.tolist()):
+        index = positions.get(str(flow.get("investment_id")))
+        day = _parse_date(flow.get("date"))
+        if index is None or day is None or day > as_of:
+            continue
+        # Expenses put money into the holding; income takes money out.
+        if flow.get("type") == "expense":
+            contributed += abs(amount)
+            series[index].append((day, -abs(amount)))
+        else:
+            series[index].append((day, abs(amount)))
+    series.append([flow for flows in series for flow in flows])
+
+    rates = xirr(*_flow_matrix(series))
+    years = np.array([((as_of - d).days / DAYS_PER_YEAR) if d else 0.0 for d in purchase_dates])
+    growth = cagr(
+        [float(i.get("purchase_value") or 0.0) for i in investments],
+        [float(i.get("current_value") or 0.0) for i in investments],
+        years,
+    )
+
+    portfolio: Dict[str, Any] = {
+        "currency": currency,
+        "xirr": _percent(rates[-1]),
+        "invested": round(float(purchases.sum()) + contributed, 2),
+        "current_value": round(float(values.sum()), 2),
+        "as_of": as_of.isoformat(),
+    }
+    missing_rates = sorted(set(missing) | set(missing_current) | set(missing_flows))
+    if missing_rates:
+        portfolio["missing_rates"] = missing_rates
+    return {
+        "holdings": {
+            str(investment.get("id")): {"cagr": _percent(growth[index]), "xirr": _percent(rates[index])}
+            for index, investment in enumerate(investments)
+        },
+        "portfolio": portfolio,
+    }
@@ -0,0 +1,215 @@
+"""Bulk revaluation of investment ``current_value`` across all users.
+
+Run as ``python -m services.revaluation --source prices.json``. The price
+source is a JSON document of the form::
+
+    {
+      "as_of": "2024-06-01",
+      "prices": {"Gold ETF": 61.2, "AAPL": 191.3},
+      "indices": {"gold": {"2023-01-01": 100.0, "2024-06-01": 112.4}}
+    }
+
+Investments with a ``quantity`` are priced by name from ``prices``; otherwise
+``purchase_value`` is scaled by the index for their type between the purchase
+date and ``as_of``. Prices keyed by a ticker symbol are also appended to the
+price history at ``as_of``. Progress is checkpointed after every page of users so an
+interrupted run resumes where it stopped.
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import logging
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.firebase_db import get_firebase_store
+from services.local_state import read_json, state_path, write_json_atomic
+from services.price_history import record_prices
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_BATCH_SIZE = 500
+
+
+class PriceSource:
+    """Unit prices by name plus dated index levels by investment type."""
+
+    def __init__(
+        self,
+        prices: Dict[str, float] | None = None,
+        indices: Dict[str, Dict[str, float]] | None = None,
+        as_of: str | None = None,
+    ):
+        self.prices = {str(k): float(v) for k, v in (prices or {}).items()}
+        self.as_of = (as_of or datetime.utcnow().date().isoformat())[:10]
+        self._indices: Dict[str, Tuple[List[str], List[float]]] = {}
+        for name, levels in (indices or {}).items():
+            points = sorted((str(day)[:10], float(level)) for day, level in levels.items())
+            if points:
+                self._indices[str(name).lower()] = (
+                    [day for day, _ in points],
+                    [level for _, level in points],
+                )
+
+    @classmethod
+    def from_file(cls, path: Path) -> "PriceSource":
+        data = read_json(path)
+        if not isinstance(data, dict):
+            raise ValueError(f"Invalid price source file: {path}")
+        return cls(data.get("prices"), data.get("indices"), data.get("as_of"))
+
+    def _index_level(self, index_name: str, day: str) -> Optional[float]:
+        """Return the last index level on or before ``day`` (or the first level)."""
+        series = self._indices.get(index_name.lower())
+        if not series:
+            return None
+        days, levels = series
+        position = bisect.bisect_right(days, day[:10]) - 1
+        return levels[max(position, 0)]
+
+    def value_for(self, investment: Dict[str, Any]) -> Optional[float]:
+        """Compute the new current value for an investment, or ``None`` if unpriced."""
+        quantity = investment.get("quantity")
+        price = self.prices.get(str(investment.get("name", "")))
+        if quantity is not None and price is not None:
+            return round(float(quantity) * price, 2)
+
+        for index_name in (investment.get("custom_type"), investment.get("type")):
+            if not index_name:
+                continue
+            purchase_date = str(investment.get("purchase_date") or self.as_of)
+            base = self._index_level(str(index_name), purchase_date)
+            latest = self._index_level(str(index_name), self.as_of)
+            if base and latest is not None:
+                return round(float(investment.get("purchase_value", 0.0)) * latest / base, 2)
+
+        return None
+
+
+def _investment_updates(
+    user_id: str,
+    investments: Any,
+    source: PriceSource,
+    timestamp: str,
+) -> Dict[str, Any]:
+    """Build multi-path updates for one user's investments whose value changed."""
+    if isinstance(investments, list):
+        items = {str(i): inv for i, inv in enumerate(investments) if inv is not None}
+    elif isinstance(investments, dict):
+        items = investments
+    else:
+        return {}
+
+    updates: Dict[str, Any] = {}
+    for key, investment in items.items():
+        if not isinstance(investment, dict):
+            continue
+        new_value = source.value_for(investment)
+        if new_value is None:
+            continue
+        try:
+            current_value = float(investment.get("current_value", 0.0))
+        except (TypeError, ValueError):
+            current_value = None
+        if current_value is not None and round(current_value, 2) == new_value:
+            continue
+        base_path = f"users/{user_id}/investments/{key}"
+        updates[f"{base_path}/current_value"] = new_value
+        updates[f"{base_path}/last_updated"] = timestamp
+    return updates
+
+
+def run_revaluation(
+    source: PriceSource,
+    checkpoint_path: Path | None = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    restart: bool = False,
+) -> Dict[str, Any]:
+    """Revalue every user's investments, resuming from the checkpoint if present."""
+    store = get_firebase_store()
+    if not store.firebase_available:
+        raise RuntimeError("Firebase store is not available")
+
+    checkpoint_path = checkpoint_path or state_path("revaluation", "checkpoint.json")
+    state = None if restart else read_json(checkpoint_path)
+    if not state or state.get("completed") or state.get("as_of") != source.as_of:
+        state = {
+            "run_id": uuid.uuid4().hex,
+            "as_of": source.as_of,
+            "cursor": None,
+            "users_processed": 0,
+            "investments_updated": 0,
+            "completed": False,
+            "started_at": datetime.utcnow().isoformat() + "Z",
+        }
+    else:
+        logger.info("Resuming revaluation run %s after %s", state["run_id"], state["cursor"])
+
+    try:
+        # Appends are idempotent, so a resumed run can record again.
+        record_prices(source.prices, at=datetime.fromisoformat(source.as_of))
+    except (OSError, ValueError) as exc:
+        logger.warning("Could not record price history: %s", exc)
+
+    timestamp = datetime.utcnow().isoformat() + "Z"
+    for user_ids in store.iter_user_id_pages(start_after=state["cursor"], page_size=page_size):
+        pending: Dict[str, Any] = {}
+        for user_id in user_ids:
+            investments = store.read_fresh(user_id, "investments")
+            pending.update(_investment_updates(user_id, investments, source, timestamp))
+            if len(pending) >= batch_size:
+                _commit(store, pending)
+                state["investments_updated"] += len(pending) // 2
+                pending = {}
+        if pending:
+            _commit(store, pending)
+            state["investments_updated"] += len(pending) // 2
+
+        state["cursor"] = user_ids[-1]
+        state["users_processed"] += len(user_ids)
+        write_json_atomic(checkpoint_path, state)
+
+    state["completed"] = True
+    state["finished_at"] = datetime.utcnow().isoformat() + "Z"
+    write_json_atomic(checkpoint_path, state)
+    return state
+
+
+def _commit(store: Any, updates: Dict[str, Any]) -> None:
+    """Commit a multi-path batch, failing the run (and keeping the checkpoint) on error."""
+    if not store.update_paths(updates):
+        raise RuntimeError("Failed to commit revaluation batch")
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Revalue investments for all users.")
+    parser.add_argument("--source", required=True, type=Path, help="Price/index JSON file")
+    parser.add_argument("--checkpoint", type=Path, default=None)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="Ignore any saved checkpoint")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    result = run_revaluation(
+        PriceSource.from_file(args.source),
+        checkpoint_path=args.checkpoint,
+        page_size=args.page_size,
+        batch_size=args.batch_size,
+        restart=args.restart,
+    )
+    logger.info(
+        "Revaluation %s done: %d users, %d investments updated",
+        result["run_id"],
+        result["users_processed"],
+        result["investments_updated"],
+    )
+
+
+if __name__ == "__main__":
+    main()
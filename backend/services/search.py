@@ -0,0 +1,262 @@
+"""Per-user inverted index for full-text search over transactions.
+
+Indexes are built lazily from the user's transactions on the first search,
+kept in a process-local TTL cache and updated incrementally by
+``add_transaction``/``delete_transaction``. Each index remembers the change
+journal sequence number (see ``services.change_journal``) it reflects; before
+a search, transaction changes journaled since then by any worker or job are
+applied to it, and writes to other collections only move the number on. The
+index is rebuilt only when the journal no longer covers the gap. Queries match
+every query term, with each term also matching as a prefix, and are ranked by
+TF-IDF.
+"""
+from __future__ import annotations
+
+import bisect
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from flask import g, has_app_context
+
+from services.cache import TTLCache
+from services.change_journal import SEQ_PATH
+from services.firebase_db import get_firebase_store
+from services.resilience import StoreUnavailableError
+from services.sync import get_changes
+
+firebase_store = get_firebase_store()
+
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", 900))
+SEARCH_INDEX_MAX_USERS = int(os.getenv("SEARCH_INDEX_MAX_USERS", 64))
+# Journal pages applied to catch an index up before rebuilding it instead.
+SEARCH_CATCH_UP_PAGES = int(os.getenv("SEARCH_CATCH_UP_PAGES", 2))
+# Score multiplier for a term matched only as a prefix of an indexed token.
+_PREFIX_WEIGHT = 0.7
+# Title words count more than words in the free-text content.
+_TITLE_WEIGHT = 2
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# user_id => (index, change journal sequence number it reflects)
+_indexes = TTLCache(ttl=SEARCH_INDEX_TTL, max_entries=SEARCH_INDEX_MAX_USERS)
+_build_locks: Dict[str, threading.Lock] = {}
+_build_locks_guard = threading.Lock()
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word tokens of a string."""
+    return _TOKEN_RE.findall(str(text or "").lower())
+
+
+class TransactionIndex:
+    """Inverted index: token => {transaction id: weighted term frequency}."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._tokens: List[str] = []  # sorted, for prefix range scans
+        self._doc_terms: Dict[str, Counter] = {}
+        self._docs: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, transaction: Dict[str, Any]) -> None:
+        with self._lock:
+            self._add(transaction, keep_sorted=True)
+
+    def bulk_load(self, transactions: Iterable[Dict[str, Any]]) -> None:
+        """Index many transactions, sorting the token list once at the end."""
+        with self._lock:
+            for transaction in transactions:
+                self._add(transaction, keep_sorted=False)
+            self._tokens = sorted(self._postings)
+
+    def _add(self, transaction: Dict[str, Any], keep_sorted: bool) -> None:
+        doc_id = str(transaction.get("id", ""))
+        if not doc_id:
+            return
+        terms: Counter = Counter()
+        for token in tokenize(transaction.get("title", "")):
+            terms[token] += _TITLE_WEIGHT
+        for token in tokenize(transaction.get("content", "")):
+            terms[token] += 1
+        for token in tokenize(transaction.get("category", "")):
+            terms[token] += 1
+
+        if doc_id in self._docs:
+            self.remove(doc_id)
+        self._docs[doc_id] = transaction
+        self._doc_terms[doc_id] = terms
+        for token, frequency in terms.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                if keep_sorted:
+                    bisect.insort(self._tokens, token)
+            postings[doc_id] = frequency
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            terms = self._doc_terms.pop(doc_id, None)
+            self._docs.pop(doc_id, None)
+            for token in terms or ():
+                postings = self._postings.get(token)
+                if postings is None:
+                    continue
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[token]
+                    position = bisect.bisect_left(self._tokens, token)
+                    if position < len(self._tokens) and self._tokens[position] == token:
+                        self._tokens.pop(position)
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        """Indexed tokens matching ``term`` exactly or as a prefix, with weights."""
+        start = bisect.bisect_left(self._tokens, term)
+        matches = []
+        for token in self._tokens[start:]:
+            if not token.startswith(term):
+                break
+            matches.append((token, 1.0 if token == term else _PREFIX_WEIGHT))
+        return matches
+
+    def search(self, query: str, offset: int = 0, limit: int = 20) -> Tuple[int, List[Dict[str, Any]]]:
+        """Return (total matches, one page of ranked transactions with scores)."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return 0, []
+
+        with self._lock:
+            total_docs = max(len(self._docs), 1)
+            scores: Dict[str, float] | None = None
+            for term in terms:
+                term_scores: Dict[str, float] = {}
+                for token, weight in self._expand(term):
+                    postings = self._postings[token]
+                    idf = math.log(1 + total_docs / len(postings))
+                    for doc_id, frequency in postings.items():
+                        score = weight * frequency * idf
+                        if score > term_scores.get(doc_id, 0.0):
+                            term_scores[doc_id] = score
+                if scores is None:
+                    scores = term_scores
+                else:
+                    # Every term must match.
+                    scores = {d: s + term_scores[d] for d, s in scores.items() if d in term_scores}
+                if not scores:
+                    return 0, []
+
+            # Only the requested page needs ordering: highest score, newest first.
+            top = heapq.nlargest(
+                offset + limit,
+                scores.items(),
+                key=lambda item: (item[1], str(self._docs[item[0]].get("date", ""))),
+            )
+            page = top[offset:offset + limit]
+            return len(scores), [
+                {**self._docs[doc_id], "score": round(score, 4)} for doc_id, score in page
+            ]
+
+
+def _build_index(user_id: str) -> TransactionIndex:
+    index = TransactionIndex()
+    index.bulk_load(firebase_store.get_transactions(user_id))
+    return index
+
+
+def _journal_head(user_id: str) -> Optional[int]:
+    """The user's change journal head, or None when it cannot be read."""
+    try:
+        return int(firebase_store.get_value(user_id, SEQ_PATH) or 0)
+    except StoreUnavailableError:
+        return None
+
+
+def _catch_up(user_id: str, index: TransactionIndex, seq: int) -> Optional[int]:
+    """Apply transaction changes journaled after ``seq``; None when a rebuild is needed."""
+    for _ in range(SEARCH_CATCH_UP_PAGES):
+        result = get_changes(user_id, seq, collections=("transactions",), full_state=False)
+        if result["reset"]:
+            return None
+        for change in result["changes"]:
+            if change["op"] == "delete":
+                index.remove(str(change["id"]))
+            else:
+                index.add({**change["value"], "id": change["id"]})
+        seq = result["seq"]
+        if not result["has_more"]:
+            return seq
+    return None
+
+
+def _lock_for(user_id: str) -> threading.Lock:
+    with _build_locks_guard:
+        lock = _build_locks.get(user_id)
+        if lock is None:
+            if len(_build_locks) >= 4 * SEARCH_INDEX_MAX_USERS:
+                for key in [key for key, held in _build_locks.items() if not held.locked()]:
+                    del _build_locks[key]
+            lock = _build_locks[user_id] = threading.Lock()
+        return lock
+
+
+def get_index(user_id: str) -> TransactionIndex:
+    """Return the user's index, brought up to date with the change journal."""
+    head = _journal_head(user_id)
+    entry = _indexes.get(user_id)
+    if entry is not None and (head is None or entry[1] >= head):
+        return entry[0]
+    with _lock_for(user_id):
+        entry = _indexes.get(user_id)
+        if entry is not None and (head is None or entry[1] >= head):
+            return entry[0]
+        if entry is not None:
+            seq = _catch_up(user_id, entry[0], entry[1])
+            if seq is not None:
+                _indexes.set(user_id, (entry[0], seq))
+                return entry[0]
+        index = _build_index(user_id)
+        # An empty or stale result may come from a failed read; it is not
+        # kept (and an empty index is cheap to build again). The head was
+        # read before the build, so catching up from it can only replay.
+        if len(index) and head is not None and not (has_app_context() and g.get("stale_data")):
+            _indexes.set(user_id, (index, head))
+    return index
+
+
+def index_transaction(user_id: str, transaction: Dict[str, Any]) -> None:
+    """Add or replace a transaction in the user's index if it is loaded.
+
+    The journal entry of the write is applied again on the next catch-up,
+    which leaves the index unchanged.
+    """
+    entry = _indexes.get(user_id)
+    if entry is not None:
+        entry[0].add(transaction)
+
+
+def unindex_transaction(user_id: str, transaction_id: str) -> None:
+    """Remove a transaction from the user's index if it is loaded."""
+    entry = _indexes.get(user_id)
+    if entry is not None:
+        entry[0].remove(str(transaction_id))
+
+
+def search_transactions(user_id: str, query: str, page: int = 1, per_page: int = 20) -> Dict[str, Any]:
+    """Run a ranked, paginated search over a user's transactions."""
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), 100)
+    total, results = get_index(user_id).search(query, (page - 1) * per_page, per_page)
+    return {
+        "query": query,
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "results": results,
+    }
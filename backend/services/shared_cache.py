@@ -0,0 +1,457 @@
+"""Cache tier shared by every gunicorn worker (and surviving worker restarts).
+
+Backends share one small interface (``get_many``, ``set``, ``incr``,
+``delete``):
+
+* ``RespCache`` speaks the Redis protocol (RESP) over TCP or a Unix socket,
+  so it works against Redis (``SHARED_CACHE_BACKEND=redis`` with
+  ``SHARED_CACHE_URL=redis://host:6379/0``) or against ``LocalRespServer``.
+* ``LocalRespServer`` is a small in-memory RESP server. With the default
+  ``SHARED_CACHE_BACKEND=local`` gunicorn starts one per host on a Unix
+  socket under ``CASHTRACK_STATE_DIR``; it also serves as the stand-in for
+  tests (``python -m services.shared_cache --socket /tmp/cache.sock``).
+* ``InProcessCache`` keeps entries in a dict (``memory``), for development.
+
+``VersionedCache`` adds per-user invalidation on top: every entry is stored
+with the user's version number at the time its data was read, and every
+committed write for a user increments that number, so entries read before
+the write stop matching. Entries also expire after ``SHARED_CACHE_TTL``,
+which bounds staleness from writers that did not bump the version.
+
+Cache errors never fail a request; the cache reports a miss and is skipped
+for a moment.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from services.local_state import state_path
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_BACKEND = os.getenv("SHARED_CACHE_BACKEND", "local").lower()
+SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL", "")
+SHARED_CACHE_TTL = int(os.getenv("SHARED_CACHE_TTL", 300))
+# Per-command socket timeout; the cache must never be slower than Firebase.
+SHARED_CACHE_TIMEOUT = float(os.getenv("SHARED_CACHE_TIMEOUT", 0.05))
+# Values above this size (bytes) are not cached.
+SHARED_CACHE_MAX_VALUE = int(os.getenv("SHARED_CACHE_MAX_VALUE", 4 * 1024 * 1024))
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", 20000))
+# Total size of cached values held by the local server / in-process cache.
+SHARED_CACHE_MAX_BYTES = int(os.getenv("SHARED_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Attempts for a version bump before it is deferred to the next cache call.
+_INVALIDATE_ATTEMPTS = 3
+_ERROR_BACKOFF = 1.0
+
+
+def default_socket_path() -> Path:
+    return state_path("cache", "shared.sock")
+
+
+class CacheError(Exception):
+    """A cache backend failed or returned an error reply."""
+
+
+# RESP encoding
+def _encode_command(args: Sequence[Any]) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+def _read_reply(stream) -> Any:
+    line = stream.readline()
+    if not line.endswith(b"\r\n"):
+        raise CacheError("Connection closed")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode("utf-8")
+    if kind == b"-":
+        raise CacheError(body.decode("utf-8"))
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = stream.read(length + 2)
+        if len(data) != length + 2:
+            raise CacheError("Connection closed")
+        return data[:-2]
+    if kind == b"*":
+        count = int(body)
+        return None if count < 0 else [_read_reply(stream) for _ in range(count)]
+    raise CacheError(f"Unexpected reply {line!r}")
+
+
+class RespCache:
+    """Minimal Redis-protocol client; one connection per thread and process."""
+
+    def __init__(self, url: str, timeout: float = SHARED_CACHE_TIMEOUT):
+        parsed = urlparse(url)
+        if parsed.scheme == "unix":
+            self._address: Any = parsed.path
+            self._family = socket.AF_UNIX
+            self._db = 0
+        elif parsed.scheme in ("redis", "tcp"):
+            self._address = (parsed.hostname or "localhost", parsed.port or 6379)
+            self._family = socket.AF_INET
+            self._db = int(parsed.path.strip("/") or 0)
+        else:
+            raise ValueError(f"Unsupported cache URL: {url}")
+        self._password = parsed.password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and conn[0] == os.getpid():
+            return conn[1], conn[2]
+        sock = socket.socket(self._family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self._address)
+        except OSError:
+            sock.close()
+            raise
+        stream = sock.makefile("rb")
+        self._local.conn = (os.getpid(), sock, stream)
+        if self._password:
+            self._execute_on(sock, stream, ("AUTH", self._password))
+        if self._db:
+            self._execute_on(sock, stream, ("SELECT", self._db))
+        return sock, stream
+
+    def _execute_on(self, sock, stream, args: Sequence[Any]) -> Any:
+        sock.sendall(_encode_command(args))
+        return _read_reply(stream)
+
+    def execute(self, *args: Any) -> Any:
+        try:
+            sock, stream = self._connection()
+            return self._execute_on(sock, stream, args)
+        except (OSError, CacheError) as exc:
+            self._drop()
+            raise CacheError(str(exc)) from exc
+
+    def _drop(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None and conn[0] == os.getpid():
+            try:
+                conn[1].close()
+            except OSError:
+                pass
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return self.execute("MGET", *keys)
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        self.execute("SET", key, value, "EX", ttl)
+
+    def incr(self, key: str) -> int:
+        return self.execute("INCR", key)
+
+    def delete(self, key: str) -> None:
+        self.execute("DEL", key)
+
+
+class InProcessCache:
+    """Entries in a dict in this process; same interface as ``RespCache``.
+
+    Bounded by entry count and by the total size of the values.
+    """
+
+    def __init__(self, max_entries: int = SHARED_CACHE_MAX_ENTRIES, max_bytes: int = SHARED_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Optional[float], bytes]] = {}
+        self._bytes = 0
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def _get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._drop(key)
+            return None
+        return value
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        with self._lock:
+            return [self._get(key) for key in keys]
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._bytes += len(value)
+            self._evict()
+
+    def _evict(self) -> None:
+        # Oldest entries first (with one TTL, also the first to expire);
+        # version counters never expire and are never evicted, or old entries
+        # could match a restarted count.
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next((k for k, v in self._entries.items() if v[0] is not None), None)
+            if oldest is None:
+                return
+            self._drop(oldest)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._get(key) or 0) + 1
+            self._drop(key)
+            data = str(value).encode()
+            self._entries[key] = (None, data)
+            self._bytes += len(data)
+            return value
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._drop(key)
+
+
+class VersionedCache:
+    """Per-user cached values invalidated by a per-user version counter."""
+
+    def __init__(self, backend: Any, ttl: int = SHARED_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._skip_until = 0.0
+        self._lock = threading.Lock()
+        # Users whose version bump failed, with when it failed; retried
+        # before the cache is used again.
+        self._unbumped: Dict[str, float] = {}
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0, "errors": 0}
+
+    @staticmethod
+    def _version_key(user_id: str) -> str:
+        return f"ver:{user_id}"
+
+    @staticmethod
+    def _entry_key(user_id: str, name: str) -> str:
+        return f"val:{user_id}:{name}"
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _failed(self, exc: Exception, skip_for: float = _ERROR_BACKOFF) -> None:
+        self._count("errors")
+        self._skip_until = time.monotonic() + skip_for
+        logger.debug("Shared cache unavailable: %s", exc)
+
+    def _available(self) -> bool:
+        if time.monotonic() < self._skip_until:
+            return False
+        if self._unbumped:
+            with self._lock:
+                pending, self._unbumped = self._unbumped, {}
+            now = time.monotonic()
+            users = list(pending.items())
+            for index, (user_id, failed_at) in enumerate(users):
+                # Entries older than the TTL have expired; no bump needed.
+                if now - failed_at < self.ttl and not self._bump(user_id, failed_at):
+                    # Keep the users not tried yet for the next attempt.
+                    with self._lock:
+                        for later_id, later_at in users[index + 1:]:
+                            self._unbumped.setdefault(later_id, later_at)
+                    return False
+        return True
+
+    def _bump(self, user_id: str, failed_at: Optional[float] = None) -> bool:
+        """Increment the user's version, retrying; on failure keep it pending.
+
+        While a bump is pending, other workers may still hit entries written
+        before the change, so this process stops using the cache and retries
+        the bump before its next lookup or store.
+        """
+        error: Optional[Exception] = None
+        for _ in range(_INVALIDATE_ATTEMPTS):
+            try:
+                self.backend.incr(self._version_key(user_id))
+                self._count("invalidations")
+                return True
+            except Exception as exc:
+                error = exc
+        with self._lock:
+            self._unbumped.setdefault(user_id, failed_at or time.monotonic())
+        self._failed(error)
+        return False
+
+    def lookup(self, user_id: str, name: str) -> Tuple[bool, Any, Optional[int]]:
+        """Return (hit, value, current version).
+
+        On a miss, pass the returned version to ``store`` after reading the
+        data, so a write that lands in between makes the entry stale.
+        """
+        if not self._available():
+            return False, None, None
+        try:
+            raw_version, raw_entry = self.backend.get_many(
+                [self._version_key(user_id), self._entry_key(user_id, name)]
+            )
+        except Exception as exc:
+            self._failed(exc)
+            return False, None, None
+        version = int(raw_version or 0)
+        if raw_entry is not None:
+            try:
+                entry = json.loads(raw_entry)
+                if entry.get("v") == version:
+                    self._count("hits")
+                    return True, entry.get("d"), version
+            except ValueError:
+                pass
+        self._count("misses")
+        return False, None, version
+
+    def version(self, user_id: str) -> Optional[int]:
+        """The user's current version, or None when the cache cannot be read."""
+        if not self._available():
+            return None
+        try:
+            return int(self.backend.get_many([self._version_key(user_id)])[0] or 0)
+        except Exception as exc:
+            self._failed(exc)
+            return None
+
+    def store(self, user_id: str, name: str, value: Any, version: Optional[int]) -> None:
+        if version is None or not self._available():
+            return
+        try:
+            data = json.dumps({"v": version, "d": value}, separators=(",", ":")).encode("utf-8")
+            if len(data) > SHARED_CACHE_MAX_VALUE:
+                return
+            self.backend.set(self._entry_key(user_id, name), data, self.ttl)
+            self._count("stores")
+        except Exception as exc:
+            self._failed(exc)
+
+    def invalidate(self, user_id: str) -> None:
+        """Make every cached value for ``user_id`` stale."""
+        self._bump(user_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+
+def _build_cache() -> Optional[VersionedCache]:
+    if SHARED_CACHE_BACKEND in ("off", "none", ""):
+        return None
+    if SHARED_CACHE_BACKEND == "memory":
+        return VersionedCache(InProcessCache())
+    if SHARED_CACHE_BACKEND == "redis":
+        return VersionedCache(RespCache(SHARED_CACHE_URL or "redis://localhost:6379/0"))
+    return VersionedCache(RespCache(SHARED_CACHE_URL or f"unix://{default_socket_path()}"))
+
+
+shared_cache = _build_cache()
+
+
+# Local stand-in server
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        while True:
+            try:
+                command = _read_reply(self.rfile)
+            except (CacheError, ValueError, OSError):
+                return
+            if not isinstance(command, list) or not command:
+                return
+            try:
+                reply = self.server.dispatch([bytes(part) for part in command])
+            except Exception as exc:
+                reply = CacheError(f"ERR {exc}")
+            self.wfile.write(_encode_reply(reply))
+
+
+def _encode_reply(reply: Any) -> bytes:
+    if isinstance(reply, CacheError):
+        return b"-%s\r\n" % str(reply).encode("utf-8")
+    if reply is True:
+        return b"+OK\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(_encode_reply(item) for item in reply)
+    raise TypeError(f"Cannot encode {reply!r}")
+
+
+class LocalRespServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """In-memory server for the subset of Redis commands the cache uses."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path):
+        socket_path = Path(socket_path)
+        if socket_path.exists():
+            socket_path.unlink()
+        self._store = InProcessCache()
+        super().__init__(str(socket_path), _RespHandler)
+        os.chmod(socket_path, 0o600)
+
+    def dispatch(self, command: List[bytes]) -> Any:
+        name, args = command[0].upper(), command[1:]
+        if name == b"PING":
+            return True
+        if name in (b"GET", b"MGET"):
+            values = self._store.get_many([arg.decode("utf-8") for arg in args])
+            return values[0] if name == b"GET" else values
+        if name == b"SET":
+            ttl = int(args[3]) if len(args) >= 4 and args[2].upper() == b"EX" else 10 ** 9
+            self._store.set(args[0].decode("utf-8"), args[1], ttl)
+            return True
+        if name == b"INCR":
+            return self._store.incr(args[0].decode("utf-8"))
+        if name == b"DEL":
+            for arg in args:
+                self._store.delete(arg.decode("utf-8"))
+            return len(args)
+        if name == b"FLUSHDB":
+            self._store = InProcessCache()
+            return True
+        return CacheError(f"ERR unknown command {name.decode('utf-8', 'replace')}")
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve the local shared cache on a Unix socket.")
+    parser.add_argument("--socket", type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    socket_path = args.socket or default_socket_path()
+    with LocalRespServer(socket_path) as server:
+        logger.info("Shared cache listening on %s", socket_path)
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
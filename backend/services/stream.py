@@ -0,0 +1,214 @@
+"""Server-Sent Events fan-out of per-user data changes.
+
+Each worker keeps at most one ``UserChannel`` per user with open streams.
+The channel listens to ``users/{uid}/change_seq`` with RTDB ``listen()``,
+so writes from any worker or device are seen, and is also poked directly
+by this process's own journaled writes for lower latency. On either
+signal it reads the new change journal entries once and fans them out to
+every connection's queue. Event ids are journal sequence numbers, so a
+reconnecting client resumes from ``Last-Event-ID``.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from services.change_journal import SEQ_PATH
+from services.firebase import get_firebase_db
+from services.firebase_db import get_firebase_store
+from services.sync import get_changes
+
+logger = logging.getLogger(__name__)
+
+firebase_store = get_firebase_store()
+
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", 15))
+# Streams are closed after this long; EventSource reconnects with Last-Event-ID.
+STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", 600))
+# Per worker; each open stream holds one gunicorn thread.
+STREAM_MAX_CONNECTIONS = int(os.getenv("STREAM_MAX_CONNECTIONS", 24))
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", 1000))
+_RETRY_MS = 3000
+
+
+class _Subscriber:
+    def __init__(self):
+        self.queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event: Dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A stalled client; it is told to resync instead of growing memory.
+            self.overflowed = True
+
+
+class UserChannel:
+    """One shared change listener for a user, fanned out to every open stream."""
+
+    def __init__(self, user_id: str, executor: ThreadPoolExecutor):
+        self.user_id = user_id
+        self.subscribers: Set[_Subscriber] = set()
+        self._executor = executor
+        self._fetch_lock = threading.Lock()
+        self.last_seq = int(firebase_store.get_value(user_id, SEQ_PATH) or 0)
+        self.known_head = self.last_seq
+        self._listener = None
+
+    def start(self) -> None:
+        try:
+            ref = get_firebase_db().reference(f"users/{self.user_id}/{SEQ_PATH}")
+            self._listener = ref.listen(self._on_event)
+        except Exception as exc:
+            # Local write notifications still reach streams on this worker.
+            logger.warning("RTDB listen unavailable for %s: %s", self.user_id, exc)
+
+    def close(self) -> None:
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            # close() joins the SSE thread; keep that off the request thread.
+            self._executor.submit(listener.close)
+
+    def _on_event(self, event: Any) -> None:
+        if isinstance(event.data, int):
+            self.notify(event.data)
+
+    def notify(self, head: int) -> None:
+        if head > self.known_head:
+            self.known_head = head
+        if head > self.last_seq:
+            self._executor.submit(self.advance)
+
+    def advance(self) -> None:
+        """Read journal entries after ``last_seq`` and publish them to every stream."""
+        with self._fetch_lock:
+            while True:
+                result = get_changes(self.user_id, self.last_seq)
+                if result["reset"]:
+                    self._publish({"event": "reset", "seq": result["seq"]})
+                else:
+                    for change in result["changes"]:
+                        self._publish({"event": "change", "seq": change["seq"], "data": change})
+                self.last_seq = max(self.last_seq, result["seq"])
+                if not result["has_more"]:
+                    return
+
+    @property
+    def lagging(self) -> bool:
+        """True while a journal gap held back changes that are known to exist."""
+        return self.last_seq < self.known_head
+
+    def _publish(self, event: Dict[str, Any]) -> None:
+        for subscriber in list(self.subscribers):
+            subscriber.put(event)
+
+
+class StreamHub:
+    """Per-worker registry of user channels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels: Dict[str, UserChannel] = {}
+        self._connections = 0
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="stream")
+        firebase_store.add_change_listener(self._on_local_change)
+
+    def _on_local_change(self, user_id: str, head: int) -> None:
+        channel = self._channels.get(user_id)
+        if channel is not None:
+            channel.notify(head)
+
+    def subscribe(self, user_id: str) -> Optional[Tuple[UserChannel, _Subscriber]]:
+        """Register a stream; returns None when this worker is at its connection limit."""
+        with self._lock:
+            if self._connections >= STREAM_MAX_CONNECTIONS:
+                return None
+            self._connections += 1
+            channel = self._channels.get(user_id)
+            created = channel is None
+            if created:
+                channel = self._channels[user_id] = UserChannel(user_id, self._executor)
+            subscriber = _Subscriber()
+            channel.subscribers.add(subscriber)
+        if created:
+            channel.start()
+        return channel, subscriber
+
+    def unsubscribe(self, channel: UserChannel, subscriber: _Subscriber) -> None:
+        """Drop a stream; safe to call more than once."""
+        with self._lock:
+            if subscriber not in channel.subscribers:
+                return
+            self._connections -= 1
+            channel.subscribers.discard(subscriber)
+            if channel.subscribers or self._channels.get(channel.user_id) is not channel:
+                return
+            del self._channels[channel.user_id]
+        channel.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {"connections": self._connections, "channels": len(self._channels)}
+
+
+_hub: Optional[StreamHub] = None
+_hub_pid: Optional[int] = None
+_hub_lock = threading.Lock()
+
+
+def get_hub() -> StreamHub:
+    """The hub for this process; created after fork so listener threads are per worker."""
+    global _hub, _hub_pid
+    if _hub is None or _hub_pid != os.getpid():
+        with _hub_lock:
+            if _hub is None or _hub_pid != os.getpid():
+                _hub = StreamHub()
+                _hub_pid = os.getpid()
+    return _hub
+
+
+def _format(event: Dict[str, Any]) -> str:
+    payload = event.get("data", {"seq": event["seq"]})
+    return f"id: {event['seq']}\nevent: {event['event']}\ndata: {json.dumps(payload)}\n\n"
+
+
+def event_stream(channel: UserChannel, subscriber: _Subscriber, last_event_id: Optional[int]) -> Iterator[str]:
+    """Yield SSE frames for one connection until it times out or is overflowed.
+
+    The caller unsubscribes when the response is closed.
+    """
+    yield f"retry: {_RETRY_MS}\n\n"
+    replayed = last_event_id if last_event_id is not None else channel.last_seq
+    # Replay what the client missed; live events at or below it are skipped.
+    while last_event_id is not None and replayed < channel.last_seq:
+        result = get_changes(channel.user_id, replayed)
+        if result["reset"]:
+            yield _format({"event": "reset", "seq": result["seq"]})
+        for change in result.get("changes", []):
+            yield _format({"event": "change", "seq": change["seq"], "data": change})
+        if result["seq"] <= replayed or not result["has_more"]:
+            replayed = max(replayed, result["seq"])
+            break
+        replayed = result["seq"]
+
+    deadline = time.monotonic() + STREAM_MAX_SECONDS
+    while time.monotonic() < deadline:
+        if subscriber.overflowed:
+            yield _format({"event": "reset", "seq": channel.last_seq})
+            return
+        try:
+            event = subscriber.queue.get(timeout=STREAM_HEARTBEAT_SECONDS)
+        except queue.Empty:
+            if channel.lagging:
+                channel.notify(channel.known_head)
+            yield ": ping\n\n"
+            continue
+        if event["event"] == "change" and event["seq"] <= replayed:
+            continue
+        yield _format(event)
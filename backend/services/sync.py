@@ -0,0 +1,112 @@
+"""Delta sync over the per-user change journal (see ``services.change_journal``)."""
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from services.change_journal import (
+    CHANGES_PATH,
+    FLOOR_PATH,
+    JOURNALED_COLLECTIONS,
+    SEQ_PATH,
+    key_seq,
+    seq_key,
+)
+from services.firebase_db import get_firebase_store
+
+firebase_store = get_firebase_store()
+
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", 1000))
+# Sequence numbers are reserved before the write that uses them lands, so a
+# recent gap may still fill in; readers stop before it until it is this old.
+SYNC_GAP_GRACE_MS = int(os.getenv("SYNC_GAP_GRACE_MS", 15000))
+# Above this many unresolved items in one collection, read the collection once.
+_BULK_RESOLVE_THRESHOLD = 20
+
+
+def _full_state(user_id: str) -> Dict[str, List[Dict[str, Any]]]:
+    state: Dict[str, List[Dict[str, Any]]] = {}
+    for collection in sorted(JOURNALED_COLLECTIONS):
+        state[collection] = list(firebase_store.get_collection(user_id, collection).values())
+    return state
+
+
+def _resolve_values(user_id: str, changes: List[Dict[str, Any]]) -> None:
+    """Fill in current values for upserts journaled without one (partial writes)."""
+    unresolved: Dict[str, List[Dict[str, Any]]] = {}
+    for change in changes:
+        if change["op"] == "upsert" and "value" not in change:
+            unresolved.setdefault(change["collection"], []).append(change)
+
+    for collection, pending in unresolved.items():
+        if len(pending) > _BULK_RESOLVE_THRESHOLD:
+            items = firebase_store.get_collection(user_id, collection)
+            lookup = lambda item_id: items.get(item_id)
+        else:
+            lookup = lambda item_id: firebase_store.get_one(user_id, collection, item_id)
+        for change in pending:
+            value = lookup(change["id"])
+            if isinstance(value, dict):
+                change["value"] = value
+            else:
+                # Deleted since the partial write was journaled.
+                change["op"] = "delete"
+
+
+def get_changes(
+    user_id: str,
+    since: int,
+    limit: int = SYNC_PAGE_SIZE,
+    collections: Optional[Iterable[str]] = None,
+    full_state: bool = True,
+) -> Dict[str, Any]:
+    """Return changes with sequence numbers after ``since``.
+
+    Only the latest change per item is returned. When ``since`` predates the
+    compacted journal (or is unknown) the response has ``reset: true`` and the
+    full current state instead, and the client should replace its copy.
+
+    ``collections`` limits the changes returned (the sequence still advances
+    past the others); with ``full_state=False`` a reset carries no state.
+    """
+    limit = min(max(limit, 1), SYNC_PAGE_SIZE)
+    head = firebase_store.get_value(user_id, SEQ_PATH) or 0
+    floor = firebase_store.get_value(user_id, FLOOR_PATH) or 1
+
+    if since < 0 or since > head or since + 1 < floor:
+        state = _full_state(user_id) if full_state else None
+        return {"reset": True, "seq": head, "state": state, "has_more": False}
+
+    entries = firebase_store.get_range(user_id, CHANGES_PATH, start=seq_key(since + 1), first=limit)
+    now_ms = int(time.time() * 1000)
+    latest: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    cursor = since
+    for key, entry in entries.items():
+        if not isinstance(entry, dict):
+            continue
+        seq = key_seq(key)
+        if seq != cursor + 1 and now_ms - int(entry.get("ts", 0)) < SYNC_GAP_GRACE_MS:
+            # An earlier sequence number may still be in flight.
+            break
+        cursor = seq
+        if collections is not None and entry.get("collection") not in collections:
+            continue
+        item_key = (entry.get("collection"), entry.get("id"))
+        latest.pop(item_key, None)
+        latest[item_key] = {
+            "collection": entry.get("collection"),
+            "id": entry.get("id"),
+            "op": entry.get("op"),
+            "seq": seq,
+            **({"value": entry["value"]} if "value" in entry else {}),
+        }
+
+    changes = list(latest.values())
+    _resolve_values(user_id, changes)
+    return {
+        "reset": False,
+        "seq": cursor,
+        "changes": changes,
+        "has_more": len(entries) >= limit and cursor > since,
+    }
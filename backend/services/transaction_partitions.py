@@ -0,0 +1,77 @@
+"""Month-partitioned transaction layout.
+
+Flat (original) layout::
+
+    users/{uid}/transactions/{id}
+
+Partitioned layout::
+
+    users/{uid}/transactions/{YYYY-MM}/{id}
+    users/{uid}/transaction_index/{id} = "YYYY-MM"
+
+``users/{uid}/transaction_schema`` is ``"partitioned"`` once a user has been
+migrated (see ``services.migrate_transactions``); a missing marker means
+flat. Partition keys never collide with transaction ids, so a node holding
+both kinds of children (a user mid-migration) is still read correctly.
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, Optional
+
+SCHEMA_PATH = "transaction_schema"
+INDEX_PATH = "transaction_index"
+SCHEMA_FLAT = "flat"
+SCHEMA_PARTITIONED = "partitioned"
+
+# Transactions without a usable date are kept in their own partition.
+UNDATED_PARTITION = "0000-00"
+
+_PARTITION_RE = re.compile(r"^\d{4}-(0\d|1[0-2])$")
+
+
+def is_partition_key(key: Any) -> bool:
+    return isinstance(key, str) and bool(_PARTITION_RE.match(key))
+
+
+def partition_for(transaction: Dict[str, Any]) -> str:
+    """The ``YYYY-MM`` partition a transaction belongs in, from its date."""
+    month = str(transaction.get("date") or "")[:7]
+    return month if is_partition_key(month) else UNDATED_PARTITION
+
+
+def _children(node: Any) -> Dict[str, Any]:
+    if isinstance(node, dict):
+        return {str(k): v for k, v in node.items() if v is not None}
+    if isinstance(node, list):
+        # RTDB returns sequential numeric keys as a sparse list.
+        return {str(i): v for i, v in enumerate(node) if v is not None}
+    return {}
+
+
+def flatten_transactions(node: Any) -> Dict[str, Dict[str, Any]]:
+    """Map a ``transactions`` node in either (or a mixed) layout to {id: item}."""
+    items: Dict[str, Dict[str, Any]] = {}
+    flat: Dict[str, Dict[str, Any]] = {}
+    for key, value in _children(node).items():
+        if is_partition_key(key):
+            for item_id, item in _children(value).items():
+                if isinstance(item, dict):
+                    items[item_id] = item
+        elif isinstance(value, dict):
+            flat[key] = value
+    # A flat copy of a moved item can only come from a later write, so it wins.
+    items.update(flat)
+    return items
+
+
+def split_transaction_path(parts: list) -> Optional[list]:
+    """Drop the partition segment from ``[users, uid, transactions, YYYY-MM, id, ...]``.
+
+    Returns the parts in flat form, or None for a write of a whole partition.
+    """
+    if len(parts) >= 4 and parts[2] == "transactions" and is_partition_key(parts[3]):
+        if len(parts) == 4:
+            return None
+        return parts[:3] + parts[4:]
+    return parts
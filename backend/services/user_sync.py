@@ -0,0 +1,109 @@
+"""Background, deduplicated sync of user profiles to Firestore on login."""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from services.firebase import get_firestore_client
+
+logger = logging.getLogger(__name__)
+
+# Repeat logins within this window never trigger a write.
+MIN_SYNC_INTERVAL = float(os.getenv("USER_SYNC_MIN_INTERVAL", 60))
+# Unchanged profiles are still re-synced this often so lastLogin stays roughly current.
+REFRESH_INTERVAL = float(os.getenv("USER_SYNC_REFRESH_INTERVAL", 6 * 3600))
+
+# Fields that change on every login and must not count as a profile change.
+_VOLATILE_FIELDS = ("lastLogin", "authTime")
+
+_lock = threading.Lock()
+_last_synced: Dict[str, Tuple[str, float]] = {}
+_in_flight: set[str] = set()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+
+
+def build_profile(decoded: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the Firestore user document from a decoded ID token."""
+    firebase_claims = decoded.get("firebase", {})
+    # Check if user has password provider (completed profile)
+    firebase_providers = firebase_claims.get("sign_in_provider", "")
+    has_password_auth = "password" in str(firebase_providers) or firebase_claims.get("identities", {}).get("password")
+
+    return {
+        'uid': decoded["uid"],
+        'email': decoded.get("email", ""),
+        'displayName': decoded.get("name", decoded.get("display_name", "")),
+        'authMethod': 'firebase_auth',  # Both Google and email/password use Firebase Auth
+        'lastLogin': datetime.utcnow().isoformat(),
+        'emailVerified': decoded.get("email_verified", False),
+        'authTime': datetime.utcfromtimestamp(decoded.get("auth_time", 0)).isoformat(),
+        'hasPasswordAuth': bool(has_password_auth),
+        'profileCompleted': bool(has_password_auth)  # Profile is complete when user has password auth
+    }
+
+
+def _fingerprint(profile: Dict[str, Any]) -> str:
+    stable = {k: v for k, v in profile.items() if k not in _VOLATILE_FIELDS}
+    return hashlib.sha256(json.dumps(stable, sort_keys=True).encode()).hexdigest()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Return the sync executor, recreating it after a fork."""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="user-sync")
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _write_profile(uid: str, profile: Dict[str, Any], fingerprint: str) -> None:
+    try:
+        db = get_firestore_client()
+        if db is None:
+            return
+        db.collection('users').document(uid).set(profile, merge=True)
+        with _lock:
+            _last_synced[uid] = (fingerprint, time.monotonic())
+    except Exception as e:
+        # Don't fail anything if Firestore update fails; the next login retries.
+        logger.warning(f"Firestore sync failed: {e}")
+    finally:
+        with _lock:
+            _in_flight.discard(uid)
+
+
+def schedule_profile_sync(decoded: Dict[str, Any]) -> bool:
+    """Queue a profile sync unless it is redundant; returns True if one was queued."""
+    uid = decoded["uid"]
+    profile = build_profile(decoded)
+    fingerprint = _fingerprint(profile)
+    now = time.monotonic()
+
+    with _lock:
+        if uid in _in_flight:
+            # Collapse rapid repeat logins onto the sync already running.
+            return False
+        last = _last_synced.get(uid)
+        if last is not None:
+            last_fingerprint, synced_at = last
+            if now - synced_at < MIN_SYNC_INTERVAL:
+                return False
+            if last_fingerprint == fingerprint and now - synced_at < REFRESH_INTERVAL:
+                return False
+        _in_flight.add(uid)
+
+    try:
+        _get_executor().submit(_write_profile, uid, profile, fingerprint)
+    except RuntimeError:
+        with _lock:
+            _in_flight.discard(uid)
+        return False
+    return True
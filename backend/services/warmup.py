@@ -0,0 +1,163 @@
+"""Worker warmup and readiness reporting.
+
+``warm_worker`` is called from the gunicorn ``post_fork`` hook so the first
+real request on a worker does not pay for Firebase credential, connection and
+certificate setup. ``readiness`` backs the ``/health/ready`` probe.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+from services.firebase import get_firebase_auth, get_firebase_db, initialize_app
+from services.shared_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WARMUP_SECONDS = 10.0
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {
+    "started_at": None,
+    "finished_at": None,
+    "steps": {},
+    "errors": {},
+}
+_cache_warmers: List[Tuple[str, Callable[[], Any]]] = []
+
+
+def register_cache_warmer(name: str, warmer: Callable[[], Any]) -> None:
+    """Register a callable that primes a process-local cache during warmup."""
+    _cache_warmers.append((name, warmer))
+
+
+def _record(step: str, ok: bool, error: Exception | None = None) -> None:
+    with _lock:
+        _state["steps"][step] = ok
+        if error is not None:
+            _state["errors"][step] = str(error)
+        else:
+            _state["errors"].pop(step, None)
+
+
+def _warm_firebase_app() -> None:
+    if initialize_app() is None:
+        raise RuntimeError("Firebase app is not initialised")
+
+
+def _warm_credentials() -> None:
+    app = initialize_app()
+    if app is None:
+        raise RuntimeError("Firebase app is not initialised")
+    app.credential.get_access_token()
+
+
+def _warm_rtdb() -> None:
+    db = get_firebase_db()
+    if db is None:
+        raise RuntimeError("Firebase app is not initialised")
+    # Any small read opens the pooled HTTPS session to the database host.
+    db.reference("users/connection_test").get(shallow=True)
+
+
+def _warm_auth_certs() -> None:
+    _warm_firebase_app()
+    from firebase_admin import _token_gen, auth
+
+    # Populate the token verifier's HTTP cache with Google's signing certs.
+    verifier = auth._get_client(None)._token_verifier
+    verifier.request(url=_token_gen.ID_TOKEN_CERT_URI, method="GET")
+
+
+def _run_steps() -> None:
+    steps: List[Tuple[str, Callable[[], Any]]] = [
+        ("firebase_app", _warm_firebase_app),
+        ("credentials", _warm_credentials),
+        ("rtdb", _warm_rtdb),
+        ("auth_certs", _warm_auth_certs),
+        ("auth_client", get_firebase_auth),
+    ]
+    steps.extend((f"cache:{name}", warmer) for name, warmer in _cache_warmers)
+
+    for name, step in steps:
+        try:
+            step()
+            _record(name, True)
+        except Exception as exc:
+            logger.warning("Warmup step %s failed: %s", name, exc)
+            _record(name, False, exc)
+
+    with _lock:
+        _state["finished_at"] = datetime.utcnow().isoformat() + "Z"
+
+
+def warm_worker(timeout: float = DEFAULT_WARMUP_SECONDS) -> bool:
+    """Run warmup steps, waiting at most ``timeout`` seconds.
+
+    Steps that overrun keep going on a daemon thread so a slow dependency
+    cannot stall the worker past gunicorn's boot timeout. Returns True when
+    warmup finished within the budget.
+    """
+    with _lock:
+        _state["started_at"] = datetime.utcnow().isoformat() + "Z"
+        _state["finished_at"] = None
+
+    started = time.monotonic()
+    thread = threading.Thread(target=_run_steps, name="worker-warmup", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    finished = not thread.is_alive()
+    logger.info(
+        "Worker warmup %s in %.2fs",
+        "completed" if finished else "still running",
+        time.monotonic() - started,
+    )
+    return finished
+
+
+def warmup_state() -> Dict[str, Any]:
+    """Return a copy of the current warmup state."""
+    with _lock:
+        return {
+            "started_at": _state["started_at"],
+            "finished_at": _state["finished_at"],
+            "steps": dict(_state["steps"]),
+            "errors": dict(_state["errors"]),
+        }
+
+
+def readiness() -> Tuple[bool, Dict[str, Any]]:
+    """Report dependency state and cache warmth for the readiness probe."""
+    from services.firebase_db import get_firebase_store
+    from services.prefetch import prefetch_stats
+
+    store = get_firebase_store()
+    firebase_ok = store.firebase_available
+    state = warmup_state()
+    steps = state["steps"]
+    cache_steps = {k: v for k, v in steps.items() if k.startswith("cache:")}
+
+    payload = {
+        "status": "ready" if firebase_ok else "not_ready",
+        "dependencies": {
+            "firebase_app": firebase_ok,
+            "rtdb_connection": steps.get("rtdb", False),
+            "auth_certs": steps.get("auth_certs", False),
+            "credentials": steps.get("credentials", False),
+            "firebase_circuit": store.breaker.state,
+        },
+        "warm": state["finished_at"] is not None and all(steps.values()),
+        "caches": cache_steps,
+        "read_coalescing": store.read_flights.stats(),
+        "shared_cache": shared_cache.stats() if shared_cache is not None else None,
+        "login_prefetch": prefetch_stats(),
+        "warmup": {
+            "started_at": state["started_at"],
+            "finished_at": state["finished_at"],
+            "errors": state["errors"],
+        },
+    }
+    return firebase_ok, payload
@@ -0,0 +1,288 @@
+"""Write-behind queue that coalesces store writes into multi-path updates.
+
+Writes are journaled to local disk (fsync'd) before they are acknowledged,
+merged per user by path, and flushed as a single RTDB ``update()`` either on
+a timer or once a size limit is reached. Journal segments are only removed
+after the batch containing their writes has been committed, and segments left
+behind by a crashed process are replayed on start-up.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.resilience import StoreUnavailableError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_MAX_BATCH = 500
+DEFAULT_MAX_PENDING = 5000
+
+_SEGMENT_PREFIX = "write-behind-"
+
+
+def _is_descendant(path: str, ancestor: str) -> bool:
+    return path.startswith(ancestor + "/")
+
+
+def _merge_path(pending: Dict[str, Any], path: str, value: Any) -> None:
+    """Merge a write into a path => value map without overlapping paths.
+
+    A write replaces any pending writes below it; a write below a pending
+    path is folded into that pending value so RTDB never sees overlapping
+    paths in one update.
+    """
+    for existing in list(pending):
+        if existing == path or _is_descendant(existing, path):
+            del pending[existing]
+
+    for existing, existing_value in pending.items():
+        if _is_descendant(path, existing):
+            relative = path[len(existing) + 1:].split("/")
+            if isinstance(existing_value, list):
+                # RTDB stores arrays as objects keyed by index.
+                existing_value = {str(i): v for i, v in enumerate(existing_value) if v is not None}
+            elif not isinstance(existing_value, dict):
+                # Nothing exists below None or a scalar; a child write replaces it.
+                if value is None:
+                    return
+                existing_value = {}
+            node = existing_value
+            for key in relative[:-1]:
+                child = node.get(key)
+                if not isinstance(child, dict):
+                    child = {}
+                    node[key] = child
+                node = child
+            if value is None:
+                node.pop(relative[-1], None)
+            else:
+                node[relative[-1]] = value
+            pending[existing] = existing_value
+            return
+
+    pending[path] = value
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WriteBehindQueue:
+    """Bounded per-user write buffer with durable journaling."""
+
+    def __init__(
+        self,
+        commit: Callable[[Dict[str, Any]], None],
+        journal_dir: Path,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        self._commit = commit
+        self._journal_dir = Path(journal_dir)
+        self._journal_dir.mkdir(parents=True, exist_ok=True)
+        self._flush_interval = flush_interval
+        self._max_batch = max_batch
+        self._max_pending = max_pending
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._inflight: Dict[str, Dict[str, Any]] = {}
+        self._pending_count = 0
+
+        self._segment_seq = 0
+        self._closed_segments: List[Path] = []
+        self._segment_path: Optional[Path] = None
+        self._segment = None
+
+        self._recover()
+        self._open_segment()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    # Journal handling
+    def _open_segment(self) -> None:
+        self._segment_seq += 1
+        self._segment_path = self._journal_dir / f"{_SEGMENT_PREFIX}{os.getpid()}-{self._segment_seq}.jsonl"
+        self._segment = open(self._segment_path, "a")
+
+    def _rotate_segment(self) -> List[Path]:
+        """Close the active segment and return every segment covered so far."""
+        if self._segment is not None:
+            self._segment.close()
+            self._closed_segments.append(self._segment_path)
+        covered = self._closed_segments
+        self._closed_segments = []
+        self._open_segment()
+        return covered
+
+    def _journal(self, user_id: str, path: str, value: Any) -> Any:
+        """Append a write to the active segment and return a private copy of the value."""
+        line = json.dumps({"u": user_id, "p": path, "v": value})
+        self._segment.write(line + "\n")
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+        return json.loads(line)["v"]
+
+    def _recover(self) -> None:
+        """Claim and replay journal segments left behind by dead processes."""
+        for segment in sorted(self._journal_dir.glob(f"{_SEGMENT_PREFIX}*.jsonl")):
+            try:
+                pid = int(segment.name[len(_SEGMENT_PREFIX):].split("-")[0])
+            except ValueError:
+                continue
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            claimed = segment.with_name(f"recovered-{os.getpid()}-{segment.name}")
+            try:
+                os.replace(segment, claimed)
+            except OSError:
+                continue
+            self._replay(claimed)
+            self._closed_segments.append(claimed)
+
+        for claimed in sorted(self._journal_dir.glob(f"recovered-*-{_SEGMENT_PREFIX}*.jsonl")):
+            owner = int(claimed.name.split("-")[1])
+            if claimed in self._closed_segments:
+                continue
+            if owner == os.getpid() or not _pid_alive(owner):
+                original = claimed.name.split("-", 2)[2]
+                reclaimed = claimed.with_name(f"recovered-{os.getpid()}-{original}")
+                try:
+                    os.replace(claimed, reclaimed)
+                except OSError:
+                    continue
+                self._replay(reclaimed)
+                self._closed_segments.append(reclaimed)
+
+    def _replay(self, segment: Path) -> None:
+        replayed = 0
+        with open(segment, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line was never acknowledged.
+                    continue
+                self._buffer(entry["u"], entry["p"], entry["v"])
+                replayed += 1
+        if replayed:
+            logger.info("Replayed %d journaled writes from %s", replayed, segment.name)
+
+    # Buffering
+    def _buffer(self, user_id: str, path: str, value: Any) -> None:
+        user_pending = self._pending.setdefault(user_id, {})
+        before = len(user_pending)
+        _merge_path(user_pending, path, value)
+        self._pending_count += len(user_pending) - before
+
+    def enqueue(self, user_id: str, path: str, value: Any) -> None:
+        """Durably record a write (``None`` deletes) and buffer it for flushing.
+
+        Raises StoreUnavailableError when the queue is full and flushing it
+        failed, rather than buffering without bound while the store is down.
+        """
+        if self._pending_count >= self._max_pending:
+            # Bounded queue: apply back-pressure by flushing in the caller.
+            if not self.flush() and self._pending_count >= self._max_pending:
+                raise StoreUnavailableError(
+                    f"Write-behind queue is full ({self._pending_count} pending writes)",
+                    retry_after=max(self._flush_interval, 1.0),
+                )
+
+        with self._lock:
+            self._buffer(user_id, path, self._journal(user_id, path, value))
+            full = self._pending_count >= self._max_batch
+
+        if full:
+            self._wake.set()
+
+    def pending_writes(self, user_id: str, prefix: str) -> List[Tuple[str, Any]]:
+        """Return unflushed writes for a user under ``prefix``, oldest first."""
+        with self._lock:
+            writes = []
+            for source in (self._inflight.get(user_id, {}), self._pending.get(user_id, {})):
+                for path, value in source.items():
+                    if path == prefix or _is_descendant(path, prefix) or _is_descendant(prefix, path):
+                        writes.append((path, value))
+            return writes
+
+    # Flushing
+    def flush(self) -> bool:
+        """Commit everything buffered so far; returns False if the commit failed."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return True
+                batch = self._pending
+                self._pending = {}
+                self._pending_count = 0
+                self._inflight = batch
+                covered = self._rotate_segment()
+
+            updates: Dict[str, Any] = {}
+            for user_pending in batch.values():
+                updates.update(user_pending)
+
+            try:
+                self._commit(updates)
+            except Exception as exc:
+                logger.warning("Write-behind flush of %d paths failed: %s", len(updates), exc)
+                with self._lock:
+                    # Re-buffer under any newer writes and keep the journal segments.
+                    newer = self._pending
+                    self._pending = {}
+                    self._pending_count = 0
+                    for source in (batch, newer):
+                        for user_id, user_pending in source.items():
+                            for path, value in user_pending.items():
+                                self._buffer(user_id, path, value)
+                    self._inflight = {}
+                    self._closed_segments = covered + self._closed_segments
+                return False
+
+            with self._lock:
+                self._inflight = {}
+            for segment in covered:
+                try:
+                    segment.unlink()
+                except OSError:
+                    pass
+            return True
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self) -> None:
+        """Flush remaining writes and stop the background flusher."""
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout=self._flush_interval * 4)
+        self.flush()
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            if not self._pending and self._segment_path is not None:
+                try:
+                    self._segment_path.unlink()
+                except OSError:
+                    pass
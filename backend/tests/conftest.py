@@ -0,0 +1,164 @@
+"""Shared test setup: import path, an isolated state directory and a fake RTDB.
+
+Services read their settings from the environment at import, so these are
+set before any test module imports them.
+"""
+import copy
+import os
+import sys
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import pytest
+
+BACKEND = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND))
+
+os.environ.setdefault("CASHTRACK_STATE_DIR", tempfile.mkdtemp(prefix="cashtrack-tests-"))
+os.environ.setdefault("SHARED_CACHE_BACKEND", "memory")
+
+
+def _parts(path):
+    return [part for part in str(path).split("/") if part]
+
+
+def _key_order(key):
+    # RTDB orders integer-like keys numerically, before string keys.
+    return (0, int(key), "") if key.isdigit() else (1, 0, key)
+
+
+class FakeDatabase:
+    """In-memory stand-in for the RTDB reference API the store uses."""
+
+    def __init__(self):
+        self.tree = {}
+        self.lock = threading.RLock()
+
+    def reference(self, path="/"):
+        return FakeReference(self, "/".join(_parts(path)))
+
+    def read(self, path):
+        node = self.tree
+        for key in _parts(path):
+            if not isinstance(node, dict) or key not in node:
+                return None
+            node = node[key]
+        return copy.deepcopy(node)
+
+    def write(self, path, value):
+        parts = _parts(path)
+        if not parts:
+            self.tree = copy.deepcopy(value) if isinstance(value, dict) else {}
+            return
+        node, trail = self.tree, []
+        for key in parts[:-1]:
+            if not isinstance(node.get(key), dict):
+                node[key] = {}
+            trail.append((node, key))
+            node = node[key]
+        if value is None:
+            node.pop(parts[-1], None)
+            # RTDB drops parents left empty.
+            for parent, key in reversed(trail):
+                if parent[key]:
+                    break
+                del parent[key]
+        else:
+            node[parts[-1]] = copy.deepcopy(value)
+
+
+class FakeQuery:
+    def __init__(self, reference):
+        self.reference = reference
+        self.start = self.end = self.first = self.last = None
+
+    def start_at(self, key):
+        self.start = key
+        return self
+
+    def end_at(self, key):
+        self.end = key
+        return self
+
+    def limit_to_first(self, count):
+        self.first = count
+        return self
+
+    def limit_to_last(self, count):
+        self.last = count
+        return self
+
+    def get(self):
+        data = self.reference.get()
+        if not isinstance(data, dict):
+            return OrderedDict()
+        keys = sorted(data, key=_key_order)
+        if self.start is not None:
+            keys = [k for k in keys if _key_order(k) >= _key_order(self.start)]
+        if self.end is not None:
+            keys = [k for k in keys if _key_order(k) <= _key_order(self.end)]
+        if self.first is not None:
+            keys = keys[:self.first]
+        if self.last is not None:
+            keys = keys[-self.last:]
+        return OrderedDict((key, data[key]) for key in keys)
+
+
+class FakeReference:
+    def __init__(self, database, path):
+        self.database = database
+        self.path = path
+        self.key = path.rsplit("/", 1)[-1] if path else None
+
+    def child(self, path):
+        return FakeReference(self.database, "/".join(_parts(f"{self.path}/{path}")))
+
+    def get(self, shallow=False):
+        with self.database.lock:
+            value = self.database.read(self.path)
+        if shallow and isinstance(value, dict):
+            return {key: True for key in value}
+        return value
+
+    def set(self, value):
+        with self.database.lock:
+            self.database.write(self.path, value)
+
+    def delete(self):
+        self.set(None)
+
+    def update(self, values):
+        with self.database.lock:
+            for path, value in values.items():
+                self.database.write(f"{self.path}/{path}", value)
+
+    def transaction(self, apply):
+        with self.database.lock:
+            value = apply(self.database.read(self.path))
+            self.database.write(self.path, value)
+            return value
+
+    def order_by_key(self):
+        return FakeQuery(self)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Point the Firebase store at a fresh in-memory database."""
+    import services.firebase as firebase
+    import services.firebase_db as firebase_db
+
+    database = FakeDatabase()
+    monkeypatch.setattr(firebase, "get_firebase_db", lambda: database)
+    monkeypatch.setattr(firebase_db, "get_firebase_db", lambda: database)
+    monkeypatch.setattr(firebase_db.get_firebase_store(), "_firebase_available", True)
+    return database
+
+
+@pytest.fixture
+def uid():
+    """A user id no other test has used, so process-wide caches never overlap."""
+    return f"user-{uuid.uuid4().hex[:12]}"
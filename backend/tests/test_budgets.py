@@ -0,0 +1,77 @@
+"""Budget spend counters kept incrementally, and threshold alerts."""
+import threading
+
+import pytest
+from flask import Flask, g
+
+from services import budgets
+from services.firebase_db import get_firebase_store
+
+store = get_firebase_store()
+
+
+@pytest.fixture
+def signed_in(fake_db, uid):
+    app = Flask(__name__)
+    with app.app_context():
+        g.current_user = {"uid": uid}
+        yield uid
+
+
+def _expense(item_id, amount, category="Food", date="2026-03-05T00:00:00Z"):
+    return {"id": item_id, "title": "x", "amount": amount, "type": "expense", "category": category, "date": date, "currency": "USD"}
+
+
+def _add(uid, transaction):
+    saved = store.save_transaction(uid, transaction)
+    return budgets.record_transaction_spend(uid, saved)
+
+
+def test_first_budget_rebuilds_counters_from_history(signed_in):
+    store.save_transaction(signed_in, _expense("1", 10.0))
+    store.save_transaction(signed_in, _expense("2", 5.5, category="Dining.Out"))
+    store.save_transaction(signed_in, _expense("3", 7.0, date="2026-02-01T00:00:00Z"))
+    store.save_transaction(signed_in, {**_expense("4", 99.0), "type": "income"})
+    budgets.add_budget({"category": "Food", "limit": 100})
+    assert store.get_value(signed_in, "budget_spend") == {
+        "2026-03": {"Food": 10.0, "Dining%2EOut": 5.5},
+        "2026-02": {"Food": 7.0},
+    }
+
+
+def test_counters_follow_adds_and_deletes_without_budgets_untouched(signed_in):
+    _add(signed_in, _expense("1", 10.0))
+    assert store.get_value(signed_in, "budget_spend") is None
+
+    budgets.add_budget({"category": "Food", "limit": 100})
+    _add(signed_in, _expense("2", 20.0))
+    assert store.get_value(signed_in, "budget_spend/2026-03/Food") == 30.0
+    budgets.record_transaction_spend(signed_in, _expense("1", 10.0), sign=-1)
+    assert store.get_value(signed_in, "budget_spend/2026-03/Food") == 20.0
+    assert [b["spent"] for b in budgets.get_budgets("2026-03")] == [20.0]
+
+
+def test_each_threshold_alerts_once_per_month(signed_in):
+    budget = budgets.add_budget({"category": "Food", "limit": 100})
+    assert _add(signed_in, _expense("1", 50.0)) == []
+    alerts = _add(signed_in, _expense("2", 35.0))
+    assert [(a["budget_id"], a["threshold"], a["status"]) for a in alerts] == [(budget["id"], 0.8, "warning")]
+    assert _add(signed_in, _expense("3", 5.0)) == []
+    assert [a["threshold"] for a in _add(signed_in, _expense("4", 20.0))] == [1.0]
+    assert _add(signed_in, _expense("5", 1.0)) == []
+    # A new month starts over.
+    assert [a["threshold"] for a in _add(signed_in, _expense("6", 90.0, date="2026-04-01T00:00:00Z"))] == [0.8]
+    assert budgets.get_budget_alerts("2026-03") == {budget["id"]: 1.0}
+
+
+def test_concurrent_expenses_are_all_counted(signed_in):
+    budgets.add_budget({"category": "Food", "limit": 1000})
+    threads = [
+        threading.Thread(target=budgets.record_transaction_spend, args=(signed_in, _expense(str(i), 1.25)))
+        for i in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.get_value(signed_in, "budget_spend/2026-03/Food") == 25.0
@@ -0,0 +1,46 @@
+"""Import-time budget for ``import app``.
+
+gunicorn imports the app on every cold start, so Firebase, gRPC and numpy
+must stay off the import path. Each measurement runs in a fresh interpreter;
+the best of a few runs is compared with ``IMPORT_TIME_BUDGET`` seconds.
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parents[1]
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", 1.0))
+RUNS = 3
+DEFERRED_MODULES = ("firebase_admin", "google.cloud.firestore", "grpc", "numpy")
+
+_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {DEFERRED_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def _measure() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=BACKEND,
+        capture_output=True,
+        text=True,
+        timeout=60,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_import_app_stays_under_budget():
+    runs = [_measure() for _ in range(RUNS)]
+    best = min(run["seconds"] for run in runs)
+    assert best < IMPORT_TIME_BUDGET, f"import app took {best:.3f}s (budget {IMPORT_TIME_BUDGET}s)"
+
+
+def test_import_app_defers_heavy_modules():
+    assert _measure()["loaded"] == []
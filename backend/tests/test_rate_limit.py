@@ -0,0 +1,101 @@
+"""Rate limiter and load shedder, including workers that die mid-request."""
+import os
+import signal
+import time
+
+import pytest
+
+from services.rate_limit import READ, InProcessRateLimiter, LoadShedder, SharedMemoryRateLimiter
+
+BUDGETS = {READ: (1.0, 3.0)}
+
+
+@pytest.fixture(params=["memory", "shared"])
+def limiter(request, tmp_path):
+    if request.param == "memory":
+        return InProcessRateLimiter(BUDGETS)
+    return SharedMemoryRateLimiter(BUDGETS, slots=64, lock_path=str(tmp_path / "buckets.lock"))
+
+
+def test_bucket_allows_burst_then_refuses(limiter):
+    assert [limiter.acquire("u", READ)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = limiter.acquire("u", READ)
+    assert not allowed and 0 < retry_after <= 1.0
+    # Other users have their own bucket.
+    assert limiter.acquire("v", READ)[0]
+
+
+def test_shared_buckets_are_shared_with_forked_workers(tmp_path):
+    limiter = SharedMemoryRateLimiter(BUDGETS, slots=64, lock_path=str(tmp_path / "buckets.lock"))
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if all(limiter.acquire("u", READ)[0] for _ in range(3)) else 1)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert not limiter.acquire("u", READ)[0]
+
+
+def test_shared_limiter_survives_worker_killed_holding_lock(tmp_path):
+    limiter = SharedMemoryRateLimiter(BUDGETS, slots=8, lock_path=str(tmp_path / "buckets.lock"))
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Take the window lock and die without releasing it.
+        limiter._lock.acquire()
+        import fcntl
+
+        fcntl.lockf(limiter._lock_fd(), fcntl.LOCK_EX, 8, 0)
+        os.write(write_fd, b"x")
+        time.sleep(60)
+        os._exit(0)
+    os.read(read_fd, 1)
+    os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    assert limiter.acquire("u", READ)[0]
+
+
+def test_shedder_counts_the_admitted_request():
+    shedder = LoadShedder(max_inflight=2, max_queue_ms=0, slots=8)
+    assert shedder.enter()[0] and shedder.enter()[0]
+    admitted, retry_after = shedder.enter()
+    assert not admitted and retry_after >= 1.0
+    assert shedder.inflight == 2
+    shedder.leave()
+    assert shedder.enter()[0]
+
+
+def test_shedder_ignores_requests_of_dead_workers():
+    shedder = LoadShedder(max_inflight=1, max_queue_ms=0, slots=8)
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if shedder.enter()[0] else 1)
+    assert os.waitpid(pid, 0)[1] == 0
+    # The child exited holding its request; it no longer counts.
+    assert shedder.inflight == 0
+    assert shedder.enter()[0]
+    shedder.release_pid(pid)
+    assert shedder.inflight == 1
+
+
+def test_shedder_rejects_long_queued_requests():
+    shedder = LoadShedder(max_inflight=10, max_queue_ms=100, slots=8)
+    admitted, _ = shedder.enter(f"t={time.time() - 5:.3f}")
+    assert not admitted
+    assert shedder.enter(f"t={time.time():.3f}")[0]
+
+
+def test_streamed_response_holds_its_slot_until_closed(monkeypatch):
+    import app as app_module
+
+    shedder = LoadShedder(max_inflight=10, max_queue_ms=0, slots=8)
+    monkeypatch.setattr(app_module, "load_shedder", shedder)
+    flask_app = app_module.create_app()
+
+    @flask_app.get("/_test/stream")
+    def _stream():
+        return flask_app.response_class(iter([b"a", b"b"]), mimetype="text/plain")
+
+    response = flask_app.test_client().get("/_test/stream", buffered=False)
+    assert shedder.inflight == 1
+    assert b"".join(response.response) == b"ab"
+    response.close()
+    assert shedder.inflight == 0
@@ -0,0 +1,77 @@
+"""Recurring scheduler: startup catch-up and rule edits pushed to the heap."""
+from datetime import date
+
+import pytest
+from flask import Flask, g
+
+from services import recurring
+from services.firebase_db import get_firebase_store
+
+store = get_firebase_store()
+
+
+@pytest.fixture
+def signed_in(fake_db, uid, monkeypatch, tmp_path):
+    monkeypatch.setattr(recurring, "_rule_changes_path", lambda: tmp_path / "rule_changes.jsonl")
+    app = Flask(__name__)
+    with app.app_context():
+        g.current_user = {"uid": uid}
+        yield uid
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    """Count full scans of every user's rules."""
+    count = [0]
+    pages = store.iter_user_id_pages
+
+    def counting(*args, **kwargs):
+        count[0] += 1
+        return pages(*args, **kwargs)
+
+    monkeypatch.setattr(store, "iter_user_id_pages", counting)
+    return count
+
+
+def _rule(**fields):
+    return {"title": "Rent", "amount": 100, "type": "expense", "currency": "USD", **fields}
+
+
+def _occurrences(uid):
+    return sorted(t["id"] for t in store.get_transactions(uid) if t.get("recurring_id"))
+
+
+def test_startup_scan_catches_up_missed_occurrences(signed_in, scans):
+    rule = recurring.add_recurring_rule(_rule(frequency="daily", start_date="2026-01-01"))
+    scheduler = recurring.RecurringScheduler()
+    scheduler.refresh()
+    assert scans[0] == 1
+    assert len(_occurrences(signed_in)) > 1
+    assert scheduler._heap[0][1:] == (signed_in, rule["id"])
+
+
+def test_rule_edits_reach_the_heap_without_a_rescan(signed_in, scans, monkeypatch):
+    monkeypatch.setattr(recurring, "_today", lambda: date(2026, 1, 10))
+    scheduler = recurring.RecurringScheduler()
+    scheduler.refresh()
+    assert scheduler._heap == []
+
+    rule = recurring.add_recurring_rule(_rule(start_date="2026-01-12"))
+    assert scheduler.apply_rule_changes() == 1
+    assert scheduler._heap == [("2026-01-12", signed_in, rule["id"])]
+
+    recurring.update_recurring_rule(rule["id"], {"start_date": "2026-01-05"})
+    scheduler.apply_rule_changes()
+    assert scheduler._heap == [("2026-01-05", signed_in, rule["id"])]
+    assert scheduler.run_due(date(2026, 1, 10)) == 1
+    assert _occurrences(signed_in) == [f"r-{rule['id']}-20260105"]
+    assert scheduler._heap == [("2026-02-05", signed_in, rule["id"])]
+
+    recurring.update_recurring_rule(rule["id"], {"active": False})
+    scheduler.apply_rule_changes()
+    assert scheduler._heap == []
+    recurring.update_recurring_rule(rule["id"], {"active": True})
+    recurring.delete_recurring_rule(rule["id"])
+    scheduler.apply_rule_changes()
+    assert scheduler._heap == []
+    assert scans[0] == 1
@@ -0,0 +1,83 @@
+"""Incremental search index kept current from the change journal."""
+import pytest
+
+from services import search
+from services.firebase_db import get_firebase_store
+
+store = get_firebase_store()
+
+
+def _transaction(item_id, title, date="2026-03-01T00:00:00Z"):
+    return {"id": item_id, "title": title, "content": "", "amount": 5.0, "type": "expense", "category": "food", "date": date}
+
+
+def _ids(uid, query):
+    return [result["id"] for result in search.search_transactions(uid, query)["results"]]
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Count full index builds (each one reads every transaction)."""
+    count = [0]
+    build = search._build_index
+
+    def counting(user_id):
+        count[0] += 1
+        return build(user_id)
+
+    monkeypatch.setattr(search, "_build_index", counting)
+    return count
+
+
+def test_ranks_title_matches_and_prefixes(fake_db, uid):
+    store.save_transaction(uid, _transaction("1", "Coffee beans"))
+    store.save_transaction(uid, {**_transaction("2", "Groceries"), "content": "coffee filter"})
+    store.save_transaction(uid, _transaction("3", "Rent"))
+    assert _ids(uid, "coffee") == ["1", "2"]
+    assert _ids(uid, "cof") == ["1", "2"]
+    assert _ids(uid, "coffee filter") == ["2"]
+    assert _ids(uid, "tea") == []
+
+
+def test_own_and_unrelated_writes_do_not_rebuild(fake_db, uid, builds):
+    store.save_transaction(uid, _transaction("1", "Coffee"))
+    assert _ids(uid, "coffee") == ["1"]
+    # What add_transaction does: the write, the index update, then counter
+    # and budget writes that also move the journal on.
+    saved = store.save_transaction(uid, _transaction("2", "Coffee again", "2026-03-02T00:00:00Z"))
+    search.index_transaction(uid, saved)
+    store.set_value(uid, "budgets/b1", {"id": "b1", "limit": 100})
+    store.increment_value(uid, "budgets/b1/spent", 5)
+    assert _ids(uid, "coffee") == ["2", "1"]
+    assert builds[0] == 1
+
+
+def test_writes_from_other_workers_are_applied_without_rebuild(fake_db, uid, builds):
+    store.save_transaction(uid, _transaction("1", "Coffee"))
+    store.save_transaction(uid, _transaction("2", "Tea"))
+    assert _ids(uid, "coffee") == ["1"]
+    # Another process: journaled writes this process's index never saw.
+    store.save_transaction(uid, _transaction("3", "Coffee beans"))
+    store.delete_transaction(uid, "1")
+    store.patch_one(uid, "transactions", "2", {"title": "Iced coffee"})
+    assert sorted(_ids(uid, "coffee")) == ["2", "3"]
+    assert builds[0] == 1
+
+
+def test_rebuilds_when_the_journal_no_longer_covers_the_gap(fake_db, uid, builds, monkeypatch):
+    store.save_transaction(uid, _transaction("1", "Coffee"))
+    assert _ids(uid, "coffee") == ["1"]
+    store.save_transaction(uid, _transaction("2", "Coffee beans"))
+    # Compaction has dropped the entries after the index's sequence number.
+    store.set_value(uid, "change_floor", 10 ** 6)
+    store.set_value(uid, "change_seq", 10 ** 6)
+    assert sorted(_ids(uid, "coffee")) == ["1", "2"]
+    assert builds[0] == 2
+
+
+def test_serves_the_loaded_index_when_the_journal_head_is_unreadable(fake_db, uid, builds, monkeypatch):
+    store.save_transaction(uid, _transaction("1", "Coffee"))
+    assert _ids(uid, "coffee") == ["1"]
+    monkeypatch.setattr(search, "_journal_head", lambda user_id: None)
+    assert _ids(uid, "coffee") == ["1"]
+    assert builds[0] == 1
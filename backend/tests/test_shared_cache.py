@@ -0,0 +1,129 @@
+"""Versioned shared cache: invalidation, failed bumps and the size bounds."""
+import threading
+
+import pytest
+
+from services.shared_cache import InProcessCache, LocalRespServer, RespCache, VersionedCache
+
+
+class FlakyCache(InProcessCache):
+    """InProcessCache whose ``incr`` fails for chosen keys."""
+
+    def __init__(self):
+        super().__init__()
+        self.failing = set()
+
+    def incr(self, key):
+        if key in self.failing:
+            raise OSError("cache down")
+        return super().incr(key)
+
+
+def _fill(cache, user_id, name="totals", value=1):
+    hit, _, version = cache.lookup(user_id, name)
+    assert not hit
+    cache.store(user_id, name, value, version)
+    assert cache.lookup(user_id, name)[:2] == (True, value)
+
+
+def test_invalidate_makes_entries_stale_for_every_client():
+    backend = InProcessCache()
+    writer, reader = VersionedCache(backend), VersionedCache(backend)
+    _fill(writer, "u")
+    assert reader.lookup("u", "totals")[0]
+    writer.invalidate("u")
+    assert not reader.lookup("u", "totals")[0]
+
+
+def test_store_with_an_old_version_is_never_served():
+    cache = VersionedCache(InProcessCache())
+    _, _, version = cache.lookup("u", "totals")
+    cache.invalidate("u")  # a write lands while the value is read
+    cache.store("u", "totals", "old", version)
+    assert not cache.lookup("u", "totals")[0]
+
+
+def test_failed_bump_is_retried_before_the_cache_is_used_again():
+    backend = FlakyCache()
+    cache, other = VersionedCache(backend), VersionedCache(backend)
+    _fill(cache, "u")
+    backend.failing.add("ver:u")
+    cache.invalidate("u")
+    # This worker stops using the cache while the bump is pending...
+    assert cache.lookup("u", "totals") == (False, None, None)
+    backend.failing.clear()
+    cache._skip_until = 0
+    # ...and applies it before its next lookup, so no client sees the entry.
+    assert not cache.lookup("u", "totals")[0]
+    assert not other.lookup("u", "totals")[0]
+    assert not cache._unbumped
+
+
+def test_pending_bumps_after_a_failure_are_kept():
+    backend = FlakyCache()
+    cache, other = VersionedCache(backend), VersionedCache(backend)
+    for user_id in ("a", "b", "c"):
+        _fill(cache, user_id)
+    backend.failing.update({"ver:a", "ver:b", "ver:c"})
+    for user_id in ("a", "b", "c"):
+        cache.invalidate(user_id)
+    assert set(cache._unbumped) == {"a", "b", "c"}
+
+    # Only the first retried bump fails; nobody queued behind it is lost.
+    first = next(iter(cache._unbumped))
+    backend.failing = {f"ver:{first}"}
+    cache._skip_until = 0
+    assert cache.lookup("a", "totals") == (False, None, None)
+    assert set(cache._unbumped) == {"a", "b", "c"}
+
+    backend.failing.clear()
+    cache._skip_until = 0
+    cache.lookup("a", "totals")
+    assert not cache._unbumped
+    assert not any(other.lookup(user_id, "totals")[0] for user_id in ("a", "b", "c"))
+
+
+def test_in_process_cache_is_bounded_by_bytes_and_keeps_versions():
+    backend = InProcessCache(max_entries=100, max_bytes=1000)
+    backend.incr("ver:u")
+    for index in range(20):
+        backend.set(f"val:u:{index}", b"x" * 100, 300)
+    assert backend._bytes <= 1000
+    assert backend._bytes == sum(len(value) for _, value in backend._entries.values())
+    assert backend.get_many(["ver:u", "val:u:0", "val:u:19"]) == [b"1", None, b"x" * 100]
+    backend.set("too-big", b"y" * 2000, 300)
+    assert backend.get_many(["too-big"]) == [None]
+
+
+def test_in_process_cache_is_bounded_by_entries():
+    backend = InProcessCache(max_entries=5)
+    for index in range(10):
+        backend.set(f"k{index}", b"v", 300)
+    assert len(backend._entries) == 5
+    assert backend.get_many(["k9"]) == [b"v"]
+
+
+@pytest.fixture
+def local_server(tmp_path):
+    socket_path = tmp_path / "cache.sock"
+    server = LocalRespServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"unix://{socket_path}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_local_server_shares_entries_between_clients(local_server):
+    writer, reader = VersionedCache(RespCache(local_server)), VersionedCache(RespCache(local_server))
+    _fill(writer, "u", value={"total": 2.5})
+    assert reader.lookup("u", "totals")[:2] == (True, {"total": 2.5})
+    reader.invalidate("u")
+    assert not writer.lookup("u", "totals")[0]
+
+
+def test_unreachable_server_fails_open(tmp_path):
+    cache = VersionedCache(RespCache(f"unix://{tmp_path / 'missing.sock'}"))
+    assert cache.lookup("u", "totals") == (False, None, None)
+    cache.store("u", "totals", 1, 1)
+    assert cache.stats()["errors"] >= 1
@@ -0,0 +1,98 @@
+"""Change journal sequence numbers and delta sync."""
+import threading
+
+from services import change_journal, firebase_db, sync
+from services.change_journal import CHANGES_PATH, key_seq
+from services.firebase_db import get_firebase_store
+
+store = get_firebase_store()
+
+
+def _stock(item_id, shares=1):
+    return {"id": item_id, "ticker": "ABC", "shares": shares}
+
+
+def _changes(uid, since=0, **options):
+    result = sync.get_changes(uid, since, **options)
+    return result, [(c["collection"], c["id"], c["op"]) for c in result["changes"]]
+
+
+def test_concurrent_writes_get_distinct_contiguous_sequence_numbers(fake_db, uid):
+    threads = [
+        threading.Thread(target=store.set_value, args=(uid, f"stocks/s{i}", _stock(f"s{i}")))
+        for i in range(25)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seqs = sorted(key_seq(key) for key in store.child_keys(uid, CHANGES_PATH))
+    assert seqs == list(range(1, 26))
+    assert store.get_value(uid, "change_seq") == 25
+
+
+def test_unjournaled_paths_do_not_advance_the_sequence(fake_db, uid):
+    store.set_value(uid, "settings/reporting_currency", "EUR")
+    store.set_value(uid, "budget_spend/2026-03/Food", 5.0)
+    assert not store.get_value(uid, "change_seq")
+
+
+def test_delta_returns_the_latest_change_per_item(fake_db, uid):
+    store.set_value(uid, "stocks/a", _stock("a"))
+    store.set_value(uid, "stocks/b", _stock("b"))
+    result, changes = _changes(uid)
+    assert changes == [("stocks", "a", "upsert"), ("stocks", "b", "upsert")]
+    since = result["seq"]
+
+    store.set_value(uid, "stocks/a", _stock("a", shares=3))
+    store.patch_one(uid, "stocks", "b", {"shares": 7})
+    store.delete_one(uid, "stocks", "a")
+    result, changes = _changes(uid, since)
+    assert changes == [("stocks", "b", "upsert"), ("stocks", "a", "delete")]
+    # A partial write is resolved from the live item.
+    assert result["changes"][0]["value"] == _stock("b", shares=7)
+    assert result["seq"] == since + 3 and not result["has_more"]
+    assert _changes(uid, result["seq"])[1] == []
+
+
+def test_delta_pages_and_filters_by_collection(fake_db, uid):
+    for i in range(5):
+        store.set_value(uid, f"stocks/s{i}", _stock(f"s{i}"))
+    store.set_value(uid, "budgets/b1", {"id": "b1", "limit": 10})
+    first, changes = _changes(uid, limit=2)
+    assert len(changes) == 2 and first["has_more"] and first["seq"] == 2
+    rest, changes = _changes(uid, first["seq"], limit=10)
+    assert len(changes) == 4 and not rest["has_more"]
+    only_budgets, changes = _changes(uid, collections=("budgets",))
+    assert changes == [("budgets", "b1", "upsert")] and only_budgets["seq"] == 6
+
+
+def test_delta_waits_for_a_recent_gap_and_skips_an_old_one(fake_db, uid, monkeypatch):
+    store.set_value(uid, "stocks/a", _stock("a"))
+    # A sequence number reserved by a write that has not landed yet.
+    store._allocate_seq(uid, 1)
+    store.set_value(uid, "stocks/b", _stock("b"))
+    result, changes = _changes(uid)
+    assert changes == [("stocks", "a", "upsert")] and result["seq"] == 1
+    monkeypatch.setattr(sync, "SYNC_GAP_GRACE_MS", 0)
+    result, changes = _changes(uid, 1)
+    assert changes == [("stocks", "b", "upsert")] and result["seq"] == 3
+
+
+def test_compacted_journal_resets_the_client(fake_db, uid, monkeypatch):
+    monkeypatch.setattr(firebase_db, "CHANGE_LOG_RETAIN", 3)
+    monkeypatch.setattr(change_journal, "CHANGE_LOG_COMPACT_EVERY", 4)
+    for i in range(8):
+        store.set_value(uid, f"stocks/s{i}", _stock(f"s{i}"))
+    floor = store.get_value(uid, "change_floor")
+    assert floor == 6
+    assert min(key_seq(key) for key in store.child_keys(uid, CHANGES_PATH)) == floor
+
+    result = sync.get_changes(uid, 2)
+    assert result["reset"] and result["seq"] == 8
+    assert sorted(result["state"]["stocks"], key=lambda s: s["id"])[0] == _stock("s0")
+    assert sync.get_changes(uid, 2, full_state=False)["state"] is None
+    # Still inside the journal: a normal delta.
+    assert not sync.get_changes(uid, floor - 1)["reset"]
+    # Ahead of the head (e.g. after a restore): reset as well.
+    assert sync.get_changes(uid, 99)["reset"]
@@ -0,0 +1,118 @@
+"""Write-behind queue: coalescing, journal replay and back-pressure."""
+import pytest
+
+from services.resilience import StoreUnavailableError
+from services.write_behind import WriteBehindQueue, _merge_path
+
+
+class Store:
+    """Commit target recording every multi-path update; can be made to fail."""
+
+    def __init__(self):
+        self.commits = []
+        self.failing = False
+
+    def __call__(self, updates):
+        if self.failing:
+            raise ConnectionError("firebase down")
+        self.commits.append(dict(updates))
+
+
+@pytest.fixture
+def store():
+    return Store()
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(commit, **options):
+        options.setdefault("flush_interval", 3600)
+        queue = WriteBehindQueue(commit, tmp_path / "journal", **options)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue._stopped.set()
+        queue._wake.set()
+
+
+def test_merge_path_never_leaves_overlapping_paths():
+    pending = {}
+    _merge_path(pending, "users/u/budgets/b1", {"limit": 10, "spent": 1})
+    _merge_path(pending, "users/u/budgets/b1/spent", 5)
+    _merge_path(pending, "users/u/tags", ["a", "b"])
+    _merge_path(pending, "users/u/tags/2", "c")
+    _merge_path(pending, "users/u/name", "x")
+    _merge_path(pending, "users/u/name/first", None)
+    assert pending == {
+        "users/u/budgets/b1": {"limit": 10, "spent": 5},
+        "users/u/tags": {"0": "a", "1": "b", "2": "c"},
+        "users/u/name": "x",
+    }
+    _merge_path(pending, "users/u", None)
+    assert pending == {"users/u": None}
+
+
+def test_flush_commits_one_coalesced_update(store, make_queue):
+    queue = make_queue(store)
+    queue.enqueue("u", "users/u/a", 1)
+    queue.enqueue("u", "users/u/a", 2)
+    queue.enqueue("v", "users/v/b", None)
+    assert queue.pending_writes("u", "users/u") == [("users/u/a", 2)]
+    assert queue.flush()
+    assert store.commits == [{"users/u/a": 2, "users/v/b": None}]
+    assert queue.pending_writes("u", "users/u") == []
+
+
+def test_failed_flush_keeps_writes_and_newer_ones_win(store, make_queue):
+    queue = make_queue(store)
+    queue.enqueue("u", "users/u/a", 1)
+    store.failing = True
+    assert not queue.flush()
+    queue.enqueue("u", "users/u/a", 2)
+    store.failing = False
+    assert queue.flush()
+    assert store.commits == [{"users/u/a": 2}]
+
+
+def test_journal_is_replayed_after_a_crash(store, make_queue):
+    crashed = make_queue(store)
+    crashed.enqueue("u", "users/u/a", {"amount": 1.5})
+    crashed.enqueue("u", "users/u/b", None)
+    # The process dies before flushing; a new queue on the same journal
+    # replays what was acknowledged.
+    crashed._stopped.set()
+    recovered = make_queue(store)
+    assert sorted(recovered.pending_writes("u", "users/u")) == [("users/u/a", {"amount": 1.5}), ("users/u/b", None)]
+    assert recovered.flush()
+    assert store.commits == [{"users/u/a": {"amount": 1.5}, "users/u/b": None}]
+    # Committed segments are removed, so nothing is replayed twice.
+    assert make_queue(store).pending_writes("u", "users/u") == []
+
+
+def test_torn_journal_line_is_skipped(store, make_queue):
+    crashed = make_queue(store)
+    crashed.enqueue("u", "users/u/a", 1)
+    crashed._stopped.set()
+    crashed._segment.write('{"u": "u", "p": "users/u/b"')
+    crashed._segment.flush()
+    recovered = make_queue(store)
+    assert recovered.pending_writes("u", "users/u") == [("users/u/a", 1)]
+
+
+def test_full_queue_refuses_writes_while_the_store_is_down(store, make_queue):
+    queue = make_queue(store, max_batch=100, max_pending=3)
+    for index in range(3):
+        queue.enqueue("u", f"users/u/{index}", index)
+    store.failing = True
+    with pytest.raises(StoreUnavailableError):
+        queue.enqueue("u", "users/u/3", 3)
+    assert queue._pending_count == 3
+    # Once the store is back the write flushes the queue and is accepted.
+    store.failing = False
+    queue.enqueue("u", "users/u/3", 3)
+    assert store.commits == [{"users/u/0": 0, "users/u/1": 1, "users/u/2": 2}]
+    assert queue.pending_writes("u", "users/u/3") == [("users/u/3", 3)]